@@ -0,0 +1,158 @@
+import os
+import io
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import visualisations as vis
+
+# Headless batch rendering of hex maps. A batch is a list of panel specs, each a dict with:
+# - column: the column of constits_df to map
+# - kind: "continuous" (default) or "discrete"
+# - colour_map: matplotlib colour map name for continuous panels, or a value -> colour dict for discrete ones
+# - limits: (min, max) colour bar limits for continuous panels, if left out the batch's shared scale is used
+# - title: panel title
+# - filename: output file name without an extension, defaults to the column name
+#
+# Panels are drawn onto their own Agg canvas rather than through pyplot, so no windows are opened and the caller's
+# backend and open figures are left alone, whether they're drawn in worker processes or in this one.
+
+def get_shared_colour_limits(constits_df, panels, symmetric=True):
+    # One colour scale for every continuous panel without its own limits, symmetrical around 0 by default as
+    # create_vote_share_change_maps_and_columns does for vote share changes
+    columns = [panel["column"] for panel in panels if ((panel.get("kind", "continuous") == "continuous") and (panel.get("limits") is None))]
+    if (len(columns) == 0):
+        return None
+    values = constits_df[columns].apply(pd.to_numeric, errors="coerce").values
+    v_min = np.nanmin(values)
+    v_max = np.nanmax(values)
+    if (symmetric):
+        v_max = max(abs(v_min), abs(v_max))
+        v_min = -v_max
+    return (v_min, v_max)
+
+# Set once per worker by start_render_worker
+render_state = {}
+
+def start_render_worker(constits_df, constit_hex_coords_df, figsize, dpi):
+    render_state["constits_df"] = constits_df
+    render_state["hex_layout"] = vis.HexLayout(constit_hex_coords_df)
+    render_state["figsize"] = figsize
+    render_state["dpi"] = dpi
+
+def draw_panel(panel):
+    fig = Figure(figsize=render_state["figsize"])
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    if (panel.get("kind", "continuous") == "discrete"):
+        vis.create_discrete_constit_map(
+            render_state["constits_df"],
+            panel["column"],
+            ax = ax,
+            title = panel.get("title"),
+            constit_colour_map = panel.get("colour_map", vis.ge_colour_map),
+            hex_layout = render_state["hex_layout"])
+    else:
+        vis.create_continous_constit_map(
+            render_state["constits_df"],
+            panel["column"],
+            fig = fig,
+            ax = ax,
+            title = panel.get("title"),
+            colour_map = panel.get("colour_map", "PiYG"),
+            colour_bar_limits = panel.get("limits"),
+            hex_layout = render_state["hex_layout"])
+    return fig
+
+def render_panel(job):
+    panel, output_dir, formats = job
+    fig = draw_panel(panel)
+    paths = []
+    for output_format in formats:
+        path = os.path.join(output_dir, panel.get("filename", panel["column"]) + "." + output_format)
+        fig.savefig(path, dpi=render_state["dpi"], bbox_inches="tight")
+        paths.append(path)
+    return paths
+
+def render_panel_bytes(panel, output_format="png"):
+    # Same as render_panel but returns the image rather than writing it, for callers serving it straight back
+    fig = draw_panel(panel)
+    image = io.BytesIO()
+    fig.savefig(image, format=output_format, dpi=render_state["dpi"], bbox_inches="tight")
+    return image.getvalue()
+
+def render_map_batch(
+    constits_df,
+    panels,
+    output_dir,
+    formats = ("png",),
+    n_workers = None,
+    shared_colour_scale = True,
+    symmetric = True,
+    constit_hex_coords_path = "csvs/constit_hex_coords.csv",
+    figsize = (10, 12),
+    dpi = 100):
+
+    # Renders every panel to output_dir and returns the list of file paths written for each panel
+    os.makedirs(output_dir, exist_ok=True)
+    panels = [dict(panel) for panel in panels]
+
+    if (shared_colour_scale):
+        limits = get_shared_colour_limits(constits_df, panels, symmetric)
+        for panel in panels:
+            if ((panel.get("kind", "continuous") == "continuous") and (panel.get("limits") is None)):
+                panel["limits"] = limits
+
+    # Workers only need the ids and the columns being drawn
+    columns = ["ons_id"] + list(dict.fromkeys(panel["column"] for panel in panels))
+    constits_df = constits_df[columns]
+    constit_hex_coords_df = pd.read_csv(constit_hex_coords_path)
+
+    jobs = [(panel, output_dir, tuple(formats)) for panel in panels]
+    if (n_workers is None):
+        n_workers = os.cpu_count() or 1
+    n_workers = min(n_workers, len(jobs))
+
+    if (n_workers <= 1):
+        start_render_worker(constits_df, constit_hex_coords_df, figsize, dpi)
+        try:
+            return [render_panel(job) for job in jobs]
+        finally:
+            render_state.clear()
+
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=start_render_worker, initargs=(constits_df, constit_hex_coords_df, figsize, dpi)) as executor:
+        return list(executor.map(render_panel, jobs))
+
+def render_map_animation(
+    constits_df,
+    panels,
+    output_path,
+    frame_duration = 1000,
+    n_workers = None,
+    shared_colour_scale = True,
+    symmetric = False,
+    constit_hex_coords_path = "csvs/constit_hex_coords.csv",
+    figsize = (10, 12),
+    dpi = 100):
+
+    # Renders each panel as a frame (e.g. one per election from 1997 to 2019, in order) and stitches them into an
+    # animated gif. Continuous frames share one colour scale so the colours are comparable between years.
+    from PIL import Image
+
+    frames_dir = os.path.splitext(output_path)[0] + "_frames"
+    panels = [dict(panel, filename="frame_" + str(frame_no).zfill(3)) for frame_no, panel in enumerate(panels)]
+    frame_paths = render_map_batch(constits_df, panels, frames_dir, ("png",), n_workers, shared_colour_scale, symmetric, constit_hex_coords_path, figsize, dpi)
+
+    # bbox_inches="tight" can leave the frames slightly different sizes, so pad them all to the largest
+    frames = [Image.open(paths[0]).convert("RGB") for paths in frame_paths]
+    width = max(frame.size[0] for frame in frames)
+    height = max(frame.size[1] for frame in frames)
+    padded_frames = []
+    for frame in frames:
+        padded_frame = Image.new("RGB", (width, height), "white")
+        padded_frame.paste(frame, (0, 0))
+        padded_frames.append(padded_frame)
+
+    padded_frames[0].save(output_path, save_all=True, append_images=padded_frames[1:], duration=frame_duration, loop=0)
+    return output_path
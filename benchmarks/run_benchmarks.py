@@ -0,0 +1,345 @@
+import os
+import sys
+import io
+import gc
+import json
+import time
+import platform
+import argparse
+import tracemalloc
+import subprocess
+import contextlib
+import tempfile
+import numpy as np
+import pandas as pd
+
+# Benchmarks for the public functions in utilities, visualisations and the analysis modules, run on synthetic data.
+#
+# Usage (from the repository root):
+#   python benchmarks/run_benchmarks.py                         # run everything, save to benchmarks/results/<commit>.json
+#   python benchmarks/run_benchmarks.py --filter flow --repeat 5
+#   python benchmarks/run_benchmarks.py --constits 1300 --respondents 100000
+#   python benchmarks/run_benchmarks.py --compare benchmarks/results/a.json benchmarks/results/b.json
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+import synthetic_data
+import utilities
+import visualisations as vis
+import voter_flows
+import constit_linker
+import poststratification
+import seat_projection
+import share_changes
+import streaming_stats
+import bes_loader
+import model_scoring
+
+benchmarks = {}
+
+def benchmark(name):
+    # Registers a benchmark. The decorated function does any setup and returns the callable to be timed.
+    def register(setup):
+        benchmarks[name] = setup
+        return setup
+    return register
+
+# Cold start imports, each in a new interpreter. The headless modules must not pull in the plotting libraries.
+plotting_module_names = ["matplotlib", "plotly"]
+
+def import_benchmark(module_name, headless):
+    check = "import sys, " + module_name + "\n"
+    check += "loaded = [name for name in " + repr(plotting_module_names) + " if name in sys.modules]\n"
+    check += "print(','.join(loaded))"
+    def run():
+        loaded = subprocess.run([sys.executable, "-c", check], cwd=repo_dir, capture_output=True, text=True, check=True).stdout.strip()
+        if (headless and (loaded != "")):
+            raise Exception("importing " + module_name + " loaded " + loaded)
+    return run
+
+@benchmark("import election_core (cold)")
+def bench_import_core(data):
+    return import_benchmark("election_core", True)
+
+@benchmark("import utilities (cold)")
+def bench_import_utilities(data):
+    return import_benchmark("utilities", True)
+
+@benchmark("import visualisations (cold)")
+def bench_import_visualisations(data):
+    return import_benchmark("visualisations", False)
+
+@benchmark("utilities.calculate_constit_results")
+def bench_constit_results(data):
+    return lambda: utilities.calculate_constit_results(data["constits_df"], data["years"])
+
+@benchmark("utilities.calculate_constit_winners (apply)")
+def bench_constit_winners_apply(data):
+    year = data["years"][-1]
+    return lambda: data["constits_df"].apply(utilities.calculate_constit_winners, year=year, parties=data["parties"], axis=1)
+
+@benchmark("utilities.calculate_constit_runnerup (apply)")
+def bench_constit_runnerup_apply(data):
+    year = data["years"][-1]
+    return lambda: data["constits_df"].apply(utilities.calculate_constit_runnerup, year=year, parties=data["parties"], axis=1)
+
+@benchmark("utilities.calculate_share_change (apply)")
+def bench_share_change_apply(data):
+    return lambda: data["constits_df"].apply(utilities.calculate_share_change, args=(data["years"][-1], data["years"][-2], "con"), axis=1)
+
+@benchmark("utilities.calculate_net_volatility")
+def bench_net_volatility(data):
+    return lambda: utilities.calculate_net_volatility(data["constits_df"], data["years"][-2], data["years"][-1])
+
+@benchmark("utilities.print_summary_election_result")
+def bench_print_summary(data):
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            utilities.print_summary_election_result(data["constits_df"], data["years"][-1], data["constits_df"], data["years"][-2])
+    return run
+
+@benchmark("utilities.calculate_election_summary_cube")
+def bench_summary_cube(data):
+    return lambda: utilities.calculate_election_summary_cube(data["constits_df"])
+
+@benchmark("utilities.estimate_individual_volatility")
+def bench_individual_volatility(data):
+    return lambda: utilities.estimate_individual_volatility(data["bes_df"], "p_past_vote_2017", "p_past_vote_2019", "wt")
+
+@benchmark("utilities.calculate_individual_volatility (grouped)")
+def bench_individual_volatility_grouped(data):
+    pairs = list(zip(synthetic_data.bes_elections[:-1], synthetic_data.bes_elections[1:]))
+    return lambda: utilities.calculate_individual_volatility(data["bes_df"], pairs, "wt", group_by="country")
+
+@benchmark("utilities.find_most_recent_answer")
+def bench_most_recent_answer(data):
+    columns = synthetic_data.get_bes_wave_columns(data["bes_df"])["lr1"]
+    return lambda: utilities.find_most_recent_answer(data["bes_df"], columns, numeric=True)
+
+@benchmark("utilities.build_most_recent_answer_features")
+def bench_most_recent_answer_features(data):
+    feature_columns = synthetic_data.get_bes_wave_columns(data["bes_df"])
+    return lambda: utilities.build_most_recent_answer_features(data["bes_df"], feature_columns)
+
+@benchmark("streaming_stats.StreamingStats (grouped, chunked)")
+def bench_streaming_stats(data):
+    columns = [columns[0] for columns in synthetic_data.get_bes_wave_columns(data["bes_df"]).values()]
+    def run():
+        stats = streaming_stats.StreamingStats(columns, "country", invalid_values=utilities.bes_invalid_values)
+        for chunk_start in range(0, data["bes_df"].shape[0], 10000):
+            stats.update(data["bes_df"].iloc[chunk_start:chunk_start + 10000])
+        return stats.result()
+    return run
+
+@benchmark("bes_loader.load_bes_panel (csv, then cached)")
+def bench_bes_loader(data):
+    temp_dir = os.path.join(data["temp_dir"], "bes_loader")
+    os.makedirs(temp_dir)
+    csv_path = os.path.join(temp_dir, "bes.csv")
+    data["bes_df"].to_csv(csv_path, index=False)
+    columns = ["wt", "country", "general_election_vote"]
+    def run():
+        bes_loader.load_bes_panel(csv_path, columns, [r"^lr\dW"], ["p_past_vote_2019"], cache_dir=os.path.join(temp_dir, "cache"), use_cache=False)
+        bes_loader.load_bes_panel(csv_path, columns, [r"^lr\dW"], ["p_past_vote_2019"], cache_dir=os.path.join(temp_dir, "cache"))
+    return run
+
+@benchmark("voter_flows.calculate_voter_flow_matrix")
+def bench_voter_flow_matrix(data):
+    parties = synthetic_data.bes_parties[:6]
+    return lambda: voter_flows.calculate_voter_flow_matrix(data["bes_df"], "p_past_vote_2015", "general_election_vote", "wt", parties, synthetic_data.bes_non_votes)
+
+@benchmark("voter_flows.bootstrap_voter_flow_intervals")
+def bench_voter_flow_bootstrap(data):
+    parties = synthetic_data.bes_parties[:6]
+    return lambda: voter_flows.bootstrap_voter_flow_intervals(data["bes_df"], "p_past_vote_2015", "general_election_vote", "wt", parties, synthetic_data.bes_non_votes, n_bootstraps=200, seed=0)
+
+@benchmark("voter_flows.calculate_voter_paths")
+def bench_voter_paths(data):
+    # Every election plus the current vote, split by country, then one transition matrix for each country
+    parties = synthetic_data.bes_parties[:6]
+    def run():
+        voter_paths = voter_flows.calculate_voter_paths(data["bes_df"], synthetic_data.bes_elections + ["general_election_vote"], "wt", parties, synthetic_data.bes_non_votes, group_by="country")
+        return [voter_paths.slice(country).transition_matrix(0, -1) for country in voter_paths.group_labels]
+    return run
+
+@benchmark("visualisations.create_discrete_constit_map")
+def bench_discrete_map(data):
+    df = data["constits_df"]
+    col = data["years"][-1] + "_first_party"
+    def run():
+        fig, ax = plt.subplots()
+        with contextlib.redirect_stdout(io.StringIO()):
+            vis.create_discrete_constit_map(df, col, ax=ax, hex_layout=data["hex_layout"])
+        fig.canvas.draw()
+        plt.close(fig)
+    return run
+
+@benchmark("visualisations.create_continous_constit_map")
+def bench_continuous_map(data):
+    df = data["constits_df"]
+    col = data["years"][-1] + "_con"
+    def run():
+        fig, ax = plt.subplots()
+        vis.create_continous_constit_map(df, col, fig=fig, ax=ax, hex_layout=data["hex_layout"])
+        fig.canvas.draw()
+        plt.close(fig)
+    return run
+
+@benchmark("utilities.create_vote_share_change_maps_and_columns")
+def bench_share_change_maps(data):
+    def run():
+        fig, axes = plt.subplots(2, 3)
+        utilities.create_vote_share_change_maps_and_columns(data["constits_df"].copy(), data["years"][-1], data["years"][-2], data["parties"][:6], fig, axes, hex_layout=data["hex_layout"])
+        fig.canvas.draw()
+        plt.close(fig)
+    return run
+
+@benchmark("share_changes.ShareTensor (all pairs volatility)")
+def bench_share_tensor(data):
+    def run():
+        share_tensor = share_changes.ShareTensor(data["constits_df"])
+        share_tensor.pedersen_volatility_matrix()
+        for year in share_tensor.years:
+            for compare_year in share_tensor.years:
+                share_tensor.pedersen_volatility(year, compare_year)
+                share_tensor.pedersen_volatility(year, compare_year, "region")
+    return run
+
+@benchmark("constit_linker.link_constituency_names")
+def bench_linker(data):
+    targets = data["constits_df"]["constituency_name"].values
+    # Reverse the word order of most names and misspell a few so both the exact and fuzzy paths are used
+    sources = [" ".join(reversed(name.split())) if (name_no % 10 != 0) else name.replace("constituency", "constituancy") for name_no, name in enumerate(targets)]
+    return lambda: constit_linker.link_constituency_names(sources, targets)
+
+@benchmark("poststratification.poststratify")
+def bench_poststratify(data):
+    return lambda: poststratification.poststratify(intercept="intercept", **data["posterior"])
+
+@benchmark("model_scoring.score_poststratification_frame")
+def bench_score_poststratification_frame(data):
+    features = synthetic_data.make_poststratification_features(data["posterior"])
+    parties = data["parties"][:4]
+    model = synthetic_data.SoftmaxModel(features.shape[1], parties)
+    return lambda: model_scoring.score_poststratification_frame(model, features, data["posterior"]["cell_constits"], data["posterior"]["cell_weights"], parties, constit_electorates=data["posterior"]["constit_electorates"], chunk_size=10000, n_workers=1)
+
+@benchmark("seat_projection.project_seats")
+def bench_project_seats(data):
+    return lambda: seat_projection.project_seats(data["constits_df"], data["years"][-1], {"con": 35, "lab": 35}, no_simulations=2000, n_workers=1, seed=0)
+
+def make_data(args):
+    constits_df = synthetic_data.make_constits_df(args.constits, args.years, args.parties, seed=args.seed)
+    return {
+        "constits_df": constits_df,
+        "years": synthetic_data.get_years(args.years),
+        "parties": synthetic_data.get_party_names(args.parties),
+        "bes_df": synthetic_data.make_bes_df(args.respondents, seed=args.seed),
+        "hex_layout": vis.HexLayout(synthetic_data.make_hex_coords_df(args.constits)),
+        "posterior": synthetic_data.make_posterior_trace(args.draws, seed=args.seed)
+    }
+
+def time_benchmark(run, repeat):
+    timings = []
+    for repeat_no in range(0, repeat):
+        gc.collect()
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def measure_peak_memory(run):
+    gc.collect()
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+def get_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=repo_dir, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def run_benchmarks(args):
+    data = make_data(args)
+    results = {}
+    # Benchmarks that need files write them under data["temp_dir"], which is removed once they've all run
+    with tempfile.TemporaryDirectory() as temp_dir:
+        data["temp_dir"] = temp_dir
+        for name, setup in benchmarks.items():
+            if ((args.filter is not None) and (args.filter not in name)):
+                continue
+            run = setup(data)
+            # One untimed run first so imports and caches don't count
+            run()
+            timings = time_benchmark(run, args.repeat)
+            results[name] = {
+                "min_seconds": min(timings),
+                "median_seconds": float(np.median(timings)),
+                "repeats": args.repeat,
+                "peak_memory_bytes": measure_peak_memory(run)
+            }
+            print('{:60s}'.format(name) + '{:10.4f}'.format(results[name]["min_seconds"]) + "s " + '{:10.1f}'.format(results[name]["peak_memory_bytes"]/1e6) + "MB")
+
+    return {
+        "commit": get_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "scale": {"constits": args.constits, "years": args.years, "parties": args.parties, "respondents": args.respondents, "draws": args.draws, "seed": args.seed},
+        "results": results
+    }
+
+def compare_results(old_path, new_path):
+    with open(old_path) as old_file:
+        old = json.load(old_file)
+    with open(new_path) as new_file:
+        new = json.load(new_file)
+    print(old.get("commit", old_path) + " -> " + new.get("commit", new_path))
+    if (old.get("scale") != new.get("scale")):
+        print("(warning: the runs used different data sizes)")
+    for name in new["results"]:
+        if (name not in old["results"]):
+            print('{:60s}'.format(name) + "new")
+            continue
+        time_ratio = new["results"][name]["min_seconds"]/old["results"][name]["min_seconds"]
+        memory_ratio = new["results"][name]["peak_memory_bytes"]/max(old["results"][name]["peak_memory_bytes"], 1)
+        print('{:60s}'.format(name) + '{:8.2f}'.format(time_ratio) + "x time " + '{:8.2f}'.format(memory_ratio) + "x memory")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the election analysis functions on synthetic data")
+    parser.add_argument("--constits", type=int, default=650)
+    parser.add_argument("--years", type=int, default=4)
+    parser.add_argument("--parties", type=int, default=8)
+    parser.add_argument("--respondents", type=int, default=30000)
+    parser.add_argument("--draws", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--filter", default=None, help="only run benchmarks whose name contains this")
+    parser.add_argument("--output", default=None, help="json file to save to, defaults to benchmarks/results/<commit>.json")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), default=None, help="compare two saved runs instead of running")
+    args = parser.parse_args()
+
+    if (args.compare is not None):
+        compare_results(args.compare[0], args.compare[1])
+        return
+
+    run = run_benchmarks(args)
+    output = args.output
+    if (output is None):
+        output = os.path.join(repo_dir, "benchmarks", "results", run["commit"] + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as output_file:
+        json.dump(run, output_file, indent=2)
+    print("Saved to " + output)
+
+if __name__ == "__main__":
+    main()
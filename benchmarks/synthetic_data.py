@@ -0,0 +1,143 @@
+import pandas as pd
+import numpy as np
+
+# Generators for synthetic data shaped like the project's real datasets, so the benchmarks can run without any of
+# the csvs present. Everything is scalable and seeded.
+
+default_years = ["2010", "2015", "2017", "2019"]
+default_parties = ["con", "lab", "ld", "ukip", "green", "snp", "pc", "brexit"]
+default_regions = ["scotland", "wales", "north east", "north west", "london", "south east", "west midlands", "south west", "east", "east midlands", "yorkshire and the humber"]
+
+bes_parties = ["Conservative", "Labour", "Liberal Democrat", "Scottish National Party (SNP)", "Plaid Cymru", "United Kingdom Independence Party (UKIP)", "Green Party", "Brexit Party"]
+bes_non_votes = ["Didn't vote", "Don't know", " "]
+bes_elections = ["p_past_vote_2010", "p_past_vote_2015", "p_past_vote_2017", "p_past_vote_2019"]
+
+def get_party_names(no_parties):
+    # The real party names first, then made up ones if more are asked for
+    return default_parties[:no_parties] + ["party" + str(party_no) for party_no in range(len(default_parties), no_parties)]
+
+def get_years(no_years):
+    if (no_years <= len(default_years)):
+        return default_years[-no_years:]
+    return [str(year) for year in range(2019 - 2*(no_years - 1), 2020, 2)]
+
+def make_constits_df(no_constits=650, no_years=4, no_parties=8, seed=0):
+    # A constits_df-like frame: ons_id, names, region and for every year <year>_<party> votes, <year>_valid_votes,
+    # <year>_electorate and <year>_first_party. Some parties don't stand in some seats (NaN votes).
+    rng = np.random.default_rng(seed)
+    years = get_years(no_years)
+    parties = get_party_names(no_parties)
+
+    columns = {
+        "ons_id": ["E" + str(14000000 + constit_no) for constit_no in range(0, no_constits)],
+        "constituency_name": ["constituency " + str(constit_no) for constit_no in range(0, no_constits)],
+        "region_name": rng.choice(default_regions, no_constits),
+    }
+    columns["country_name"] = np.where(columns["region_name"] == "scotland", "scotland", np.where(columns["region_name"] == "wales", "wales", "england"))
+
+    # Each seat has a persistent lean towards each party so results are correlated across years
+    constit_lean = rng.dirichlet(np.ones(no_parties), size=no_constits)
+    for year in years:
+        electorate = rng.integers(55000, 80000, no_constits)
+        turnout = rng.uniform(0.55, 0.75, no_constits)
+        valid_votes = np.round(electorate*turnout)
+        shares = rng.dirichlet(np.ones(no_parties), size=no_constits)*0.5 + constit_lean*0.5
+        votes = np.round(shares*valid_votes[:, np.newaxis])
+        votes[rng.random(votes.shape) < 0.1] = np.nan
+        for party_no in range(0, no_parties):
+            columns[year + "_" + parties[party_no]] = votes[:, party_no]
+        columns[year + "_valid_votes"] = np.nansum(votes, axis=1)
+        columns[year + "_electorate"] = electorate
+        columns[year + "_first_party"] = np.array(parties)[np.nanargmax(np.where(np.isnan(votes), -1, votes), axis=1)]
+
+    return pd.DataFrame(columns)
+
+def make_bes_df(no_respondents=30000, no_parties=6, no_waves=3, seed=0):
+    # A BES-panel-like frame: past vote columns, general_election_vote, wt, country and a few attitude questions
+    # (lr1..lr5) asked in several waves with BES style missing value codes mixed in.
+    rng = np.random.default_rng(seed)
+    parties = bes_parties[:no_parties]
+    answers = parties + bes_non_votes
+
+    columns = {}
+    previous_vote = rng.choice(answers, no_respondents)
+    for election_column in bes_elections:
+        # Most people vote the same way as last time
+        switch = rng.random(no_respondents) < 0.3
+        previous_vote = np.where(switch, rng.choice(answers, no_respondents), previous_vote)
+        columns[election_column] = previous_vote
+    columns["general_election_vote"] = np.where(rng.random(no_respondents) < 0.3, rng.choice(answers, no_respondents), previous_vote)
+    columns["wt"] = np.where(rng.random(no_respondents) < 0.02, 0, rng.gamma(4, 0.25, no_respondents))
+    columns["country"] = rng.choice(["England", "Scotland", "Wales"], no_respondents, p=[0.8, 0.12, 0.08])
+
+    waves = ["W" + str(19 - wave_no) for wave_no in range(0, no_waves)]
+    for question_no in range(1, 6):
+        for wave in waves:
+            values = rng.integers(1, 6, no_respondents).astype(object)
+            missing = rng.random(no_respondents)
+            values[missing < 0.15] = 9999
+            values[(missing >= 0.15) & (missing < 0.2)] = " "
+            values[(missing >= 0.2) & (missing < 0.25)] = np.nan
+            columns["lr" + str(question_no) + wave] = values
+
+    return pd.DataFrame(columns)
+
+def get_bes_wave_columns(bes_df, question="lr"):
+    # feature name -> ordered wave columns (most recent first) for the attitude questions in a make_bes_df frame
+    feature_columns = {}
+    for col in bes_df.columns:
+        if (col.startswith(question) and "W" in col):
+            feature_columns.setdefault(col.split("W")[0], []).append(col)
+    for feature in feature_columns:
+        feature_columns[feature] = sorted(feature_columns[feature], key=lambda col: -int(col.split("W")[1]))
+    return feature_columns
+
+def make_hex_coords_df(no_constits=650, seed=0):
+    # Hex map coordinates for the ons_ids generated by make_constits_df, on a roughly square grid
+    width = int(np.ceil(np.sqrt(no_constits)))
+    constit_nos = np.arange(0, no_constits)
+    return pd.DataFrame({
+        "ons_id": ["E" + str(14000000 + constit_no) for constit_no in constit_nos],
+        "q": constit_nos % width,
+        "r": constit_nos // width
+    })
+
+def make_posterior_trace(no_draws=1000, no_parties=6, no_constits=59, seed=0):
+    # A dict of posterior draws shaped like the MRP model's trace, with the cell and constituency indexes to go with it
+    rng = np.random.default_rng(seed)
+    levels = {"sex": 2, "age": 8, "home": 2, "edu": 6, "soc_grade": 4}
+    cells_per_constit = int(np.prod(list(levels.values())))
+
+    trace = {"intercept": rng.normal(size=(no_draws, no_parties))}
+    cell_effects = {}
+    for name, no_levels in levels.items():
+        trace[name] = rng.normal(size=(no_draws, no_levels, no_parties))
+        cell_effects[name] = np.tile(np.indices(list(levels.values())).reshape(len(levels), -1)[list(levels.keys()).index(name)], no_constits)
+    trace["incumbent"] = rng.normal(size=(no_draws, 4, no_parties))
+    trace["l2_coeffs"] = rng.normal(size=(no_draws, 4, no_parties))
+
+    return {
+        "trace": trace,
+        "cell_constits": np.repeat(np.arange(no_constits), cells_per_constit),
+        "cell_weights": rng.dirichlet(np.ones(cells_per_constit), size=no_constits).ravel(),
+        "cell_effects": cell_effects,
+        "constit_effects": {"incumbent": rng.integers(0, 4, no_constits)},
+        "constit_slopes": {"l2_coeffs": rng.random((no_constits, 4))},
+        "constit_electorates": rng.integers(55000, 80000, no_constits)
+    }
+
+class SoftmaxModel:
+    # Stands in for a fitted sklearn classifier: a linear softmax model with random coefficients
+    def __init__(self, no_features, classes, seed=0):
+        rng = np.random.default_rng(seed)
+        self.classes_ = np.asarray(classes, dtype=object)
+        self.coefficients = rng.normal(size=(no_features, len(classes)))
+
+    def predict_proba(self, features):
+        predictions = np.asarray(features, dtype=float) @ self.coefficients
+        predictions = np.exp(predictions - predictions.max(axis=1, keepdims=True))
+        return predictions/predictions.sum(axis=1, keepdims=True)
+
+def make_poststratification_features(posterior):
+    # One hot encoded cell levels for every row of a make_posterior_trace frame
+    return np.column_stack([np.eye(levels.max() + 1)[levels] for levels in posterior["cell_effects"].values()])
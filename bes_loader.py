@@ -0,0 +1,265 @@
+import os
+import re
+import json
+import shutil
+import hashlib
+import numpy as np
+import pandas as pd
+from election_store import get_source_signature
+
+# Loads a compact subset of a BES panel csv (e.g. wave1-19BES.csv, thousands of mostly object columns) without ever
+# holding the whole file in memory:
+# - only the requested columns are parsed
+# - rows are filtered chunk by chunk as the file streams in, including rows with a required answer that's missing
+#   whatever kind of column it turns out to be
+# - answers are dictionary encoded while streaming, then stored as the smallest nullable integer type if every answer
+#   is a whole number, Float32 if they're other numbers and a categorical otherwise
+# - BES missing value codes become missing values. Each column gets its own set: text answer columns lose 9999, 99,
+#   98 and blanks, number columns (e.g. age, where 99 is a real answer) only 9999 and blanks. Codes are compared as
+#   numbers too, so "9999.0" is caught as well as "9999".
+#
+# The result is cached as one .npy file per array plus a metadata.json, which later sessions load memory mapped so only
+# the parts of the columns that get used are read from disk.
+
+bes_sentinel_values = ["9999", "99", "98", " ", ""]
+bes_numeric_sentinel_values = ["9999", " ", ""]
+
+cache_format_version = 2
+
+def get_bes_columns(csv_path, columns=[], column_patterns=[]):
+    # The requested columns along with any whose name matches one of the regex patterns (e.g. r"^lr\dW1[7-9]$"), in
+    # file order
+    header = pd.read_csv(csv_path, nrows=0).columns
+    compiled_patterns = [re.compile(pattern) for pattern in column_patterns]
+    missing = [col for col in columns if col not in header]
+    if (len(missing) > 0):
+        raise Exception("columns " + ", ".join(missing) + " not recognised")
+    return [col for col in header if ((col in columns) or any(pattern.search(col) for pattern in compiled_patterns))]
+
+def get_integer_dtype(min_value, max_value):
+    for dtype in [np.int8, np.int16, np.int32]:
+        if ((min_value >= np.iinfo(dtype).min) and (max_value <= np.iinfo(dtype).max)):
+            return dtype
+    return np.int64
+
+def get_code_dtype(no_categories):
+    return get_integer_dtype(-1, no_categories)
+
+def get_sentinel_categories(categories, sentinel_values):
+    # True for each category that's one of the sentinels, compared as text ignoring surrounding spaces and as a number
+    sentinel_strings = set(str(value).strip() for value in sentinel_values)
+    sentinel_numbers = pd.to_numeric(pd.Series(list(sentinel_strings), dtype=object), errors="coerce").dropna().values
+    category_strings = np.array([str(category).strip() for category in categories], dtype=object)
+    category_numbers = pd.to_numeric(pd.Series(categories, dtype=object), errors="coerce").values.astype(float)
+    return np.isin(category_strings, list(sentinel_strings)) | np.isin(category_numbers, sentinel_numbers)
+
+class ColumnEncoder:
+    # Dictionary encodes one column's string values chunk by chunk, with the same code for a value in every chunk
+    def __init__(self):
+        self.categories = []
+        self.category_codes = {}
+        self.chunk_codes = []
+        self.codes = None
+        self.kind = None
+
+    def add(self, values):
+        codes, uniques = pd.factorize(values)
+        global_codes = np.empty(len(uniques) + 1, dtype=np.int32)
+        global_codes[-1] = -1
+        for unique_no, value in enumerate(uniques):
+            if (value not in self.category_codes):
+                self.category_codes[value] = len(self.categories)
+                self.categories.append(value)
+            global_codes[unique_no] = self.category_codes[value]
+        self.chunk_codes.append(global_codes[codes])
+
+    def resolve(self, sentinel_values, numeric_sentinel_values):
+        # Once every chunk is in: works out whether the answers are numbers and turns that kind's sentinels into
+        # missing values. Returns the missing value mask.
+        codes = np.concatenate(self.chunk_codes) if len(self.chunk_codes) > 0 else np.zeros(0, dtype=np.int32)
+        self.chunk_codes = []
+        numeric_categories = pd.to_numeric(pd.Series(self.categories, dtype=object), errors="coerce").values.astype(float)
+        is_sentinel = get_sentinel_categories(self.categories, numeric_sentinel_values)
+        if ((~is_sentinel).any() and (not np.isnan(numeric_categories[~is_sentinel]).any())):
+            self.kind = "number"
+        else:
+            self.kind = "category"
+            is_sentinel = get_sentinel_categories(self.categories, sentinel_values)
+
+        # Drop the sentinels from the categories and renumber the rest
+        kept = np.flatnonzero(~is_sentinel)
+        new_codes = np.full(len(self.categories) + 1, -1, dtype=np.int32)
+        new_codes[kept] = np.arange(len(kept))
+        self.codes = new_codes[codes]
+        self.categories = [self.categories[category_no] for category_no in kept]
+        return self.codes < 0
+
+    def finish(self, row_mask=None):
+        # Returns (kind, arrays, categories) for the rows in row_mask, kind being "integer", "float" or "category"
+        codes = self.codes if row_mask is None else self.codes[row_mask]
+        self.codes = None
+        missing = codes < 0
+        numeric_categories = pd.to_numeric(pd.Series(self.categories, dtype=object), errors="coerce").values.astype(float)
+
+        if ((self.kind == "number") and (len(self.categories) > 0)):
+            values = numeric_categories[np.where(missing, 0, codes)]
+            if ((numeric_categories == np.round(numeric_categories)).all()):
+                data = np.where(missing, 0, values).astype(get_integer_dtype(numeric_categories.min(), numeric_categories.max()))
+                return "integer", {"data": data, "mask": missing}, None
+            return "float", {"data": np.where(missing, 0, values).astype(np.float32), "mask": missing}, None
+
+        categories = list(self.categories)
+        # Sort the categories so the codes don't depend on the order answers first appeared in
+        order = np.argsort(np.array(categories, dtype=object).astype(str), kind="stable")
+        new_codes = np.empty(len(categories) + 1, dtype=np.int64)
+        new_codes[order] = np.arange(len(categories))
+        new_codes[-1] = -1
+        return "category", {"codes": new_codes[codes].astype(get_code_dtype(len(categories)))}, [categories[category_no] for category_no in order]
+
+def build_column(kind, arrays, categories):
+    # Wraps the (possibly memory mapped) arrays as a pandas column without copying them
+    if (kind == "integer"):
+        return pd.arrays.IntegerArray(arrays["data"], arrays["mask"])
+    elif (kind == "float"):
+        return pd.arrays.FloatingArray(arrays["data"], arrays["mask"])
+    elif (kind == "category"):
+        return pd.Categorical.from_codes(arrays["codes"], categories=categories)
+    else:
+        raise Exception("column kind " + kind + " not recognised")
+
+def get_row_mask(chunk, filters):
+    mask = np.ones(chunk.shape[0], dtype=bool)
+    for col, allowed_values in filters.items():
+        mask &= chunk[col].isin([str(value) for value in allowed_values]).values
+    return mask
+
+def get_certain_missing(values, sentinel_values, numeric_sentinel_values):
+    # True for blanks and answers that are sentinels for text and number columns alike (e.g. 9999), which are missing
+    # however the column is resolved. Answers that are only sometimes sentinels (e.g. 99) are left for resolve.
+    codes, uniques = pd.factorize(values)
+    is_sentinel = get_sentinel_categories(uniques, sentinel_values) & get_sentinel_categories(uniques, numeric_sentinel_values)
+    return np.r_[is_sentinel, True][codes]
+
+def get_column_sentinel_values(col, sentinel_values, numeric_sentinel_values, column_sentinel_values, raw_columns):
+    # (text answer sentinels, number sentinels) for one column
+    if (col in raw_columns):
+        return [], []
+    if (col in column_sentinel_values):
+        return list(column_sentinel_values[col]), list(column_sentinel_values[col])
+    return list(sentinel_values), list(numeric_sentinel_values)
+
+def get_cache_key(csv_path, columns, column_sentinels, required_columns, filters):
+    settings = {
+        "format_version": cache_format_version,
+        "source_signature": list(get_source_signature(csv_path)),
+        "columns": list(columns),
+        "sentinel_values": {col: [[str(value) for value in values] for values in column_sentinels[col]] for col in columns},
+        "required_columns": list(required_columns),
+        "filters": {col: [str(value) for value in values] for col, values in sorted(filters.items())}
+    }
+    return hashlib.sha1(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:16], settings
+
+def save_bes_cache(cache_path, settings, encoded_columns, no_rows):
+    # Written to a temporary directory first so an interrupted save never leaves a half written cache behind
+    temp_path = cache_path + ".tmp"
+    if (os.path.exists(temp_path)):
+        shutil.rmtree(temp_path)
+    os.makedirs(temp_path)
+    metadata = {"settings": settings, "rows": no_rows, "columns": []}
+    for col_no, (col, (kind, arrays, categories)) in enumerate(encoded_columns.items()):
+        files = {}
+        for array_name, array in arrays.items():
+            files[array_name] = str(col_no) + "_" + array_name + ".npy"
+            np.save(os.path.join(temp_path, files[array_name]), array)
+        metadata["columns"].append({"name": col, "kind": kind, "files": files, "categories": categories})
+    with open(os.path.join(temp_path, "metadata.json"), "w") as metadata_file:
+        json.dump(metadata, metadata_file)
+    if (os.path.exists(cache_path)):
+        shutil.rmtree(cache_path)
+    os.rename(temp_path, cache_path)
+
+def load_bes_cache(cache_path, mmap=True):
+    # Returns None if there's no (complete) cache
+    metadata_path = os.path.join(cache_path, "metadata.json")
+    if (not os.path.exists(metadata_path)):
+        return None
+    with open(metadata_path) as metadata_file:
+        metadata = json.load(metadata_file)
+    if (metadata["settings"].get("format_version") != cache_format_version):
+        return None
+    columns = {}
+    for column in metadata["columns"]:
+        arrays = {array_name: np.load(os.path.join(cache_path, file_name), mmap_mode=("r" if mmap else None)) for array_name, file_name in column["files"].items()}
+        columns[column["name"]] = build_column(column["kind"], arrays, column["categories"])
+    return pd.DataFrame(columns, copy=False)
+
+def load_bes_panel(
+    csv_path,
+    columns = [],
+    column_patterns = [],
+    required_columns = [],
+    filters = {},
+    sentinel_values = bes_sentinel_values,
+    numeric_sentinel_values = bes_numeric_sentinel_values,
+    column_sentinel_values = {},
+    raw_columns = ["id"],
+    chunksize = 20000,
+    cache_dir = None,
+    use_cache = True,
+    mmap = True):
+
+    # Returns a DataFrame of the requested columns for the rows that pass the filters.
+    #
+    # Parameters:
+    # - csv_path (string): BES panel csv, e.g. csvs/bes_datasets/wave1-19BES.csv
+    # - columns (array of strings): columns to load
+    # - column_patterns (array of strings): regexes, columns with a matching name are loaded too
+    # - required_columns (array of strings): rows missing an answer in any of these are dropped, e.g. ["p_past_vote_2019"]
+    # - filters (dict): column -> answers to keep, e.g. {"country": ["England", "Wales"]}
+    # - sentinel_values (array of strings): answers treated as missing in text answer columns
+    # - numeric_sentinel_values (array of strings): answers treated as missing in columns where every other answer
+    #   is a number
+    # - column_sentinel_values (dict): column -> its own sentinels, used whatever its answers are
+    # - raw_columns (array of strings): columns such as respondent ids where no value is a sentinel
+    # - cache_dir (string): where the binary cache goes, defaults to a .cache directory next to the csv. The cache is
+    #   keyed on the csv's size and modification time along with the other parameters.
+    # - mmap (bool): memory map the cached arrays rather than reading them in
+    columns = get_bes_columns(csv_path, list(columns) + [col for col in list(required_columns) + list(filters.keys()) if col not in columns], column_patterns)
+    column_sentinels = {col: get_column_sentinel_values(col, sentinel_values, numeric_sentinel_values, column_sentinel_values, raw_columns) for col in columns}
+    cache_key, settings = get_cache_key(csv_path, columns, column_sentinels, required_columns, filters)
+    if (cache_dir is None):
+        cache_dir = os.path.join(os.path.dirname(csv_path), ".cache")
+    cache_path = os.path.join(cache_dir, os.path.splitext(os.path.basename(csv_path))[0] + "_" + cache_key)
+
+    if (use_cache):
+        bes_df = load_bes_cache(cache_path, mmap)
+        if (bes_df is not None):
+            return bes_df
+
+    encoders = {col: ColumnEncoder() for col in columns}
+    no_rows = 0
+    # Everything is read as strings and only blank fields are missing (pandas' default NA strings include real answers
+    # like "None"). Which sentinels apply is only known once a column's answers have all been seen, so rows missing a
+    # required answer are dropped as they stream in where that's certain, and the rest after the file has been read.
+    chunks = pd.read_csv(csv_path, usecols=columns, dtype=str, na_values={col: [""] for col in columns}, keep_default_na=False, chunksize=chunksize)
+    for chunk in chunks:
+        chunk_mask = get_row_mask(chunk, filters)
+        for col in required_columns:
+            chunk_mask &= ~get_certain_missing(chunk[col].values, *column_sentinels[col])
+        chunk = chunk[chunk_mask]
+        no_rows += chunk.shape[0]
+        for col in columns:
+            encoders[col].add(chunk[col].values)
+
+    row_mask = None
+    for col in columns:
+        missing = encoders[col].resolve(*column_sentinels[col])
+        if (col in required_columns):
+            row_mask = ~missing if row_mask is None else row_mask & ~missing
+    if (row_mask is not None):
+        no_rows = int(row_mask.sum())
+    encoded_columns = {col: encoders[col].finish(row_mask) for col in columns}
+    if (use_cache):
+        save_bes_cache(cache_path, settings, encoded_columns, no_rows)
+        return load_bes_cache(cache_path, mmap)
+    return pd.DataFrame({col: build_column(*encoded_columns[col]) for col in columns}, copy=False)
@@ -0,0 +1,121 @@
+import os
+import re
+import difflib
+import hashlib
+import pandas as pd
+
+crosswalk_columns = ["target_set", "source_name", "target_name", "score", "method"]
+
+non_alphanumeric_pattern = re.compile(r"[^a-z0-9]+")
+
+def normalise_constituency_name(name):
+    # Lower case, "&" spelt out, punctuation removed and the words sorted, so names that only differ in those ways share a
+    # key, e.g. "Durham, City of" and "City of Durham" or "Edinburgh North & Leith" and "Edinburgh North and Leith".
+    if (not isinstance(name, str)):
+        return ""
+    tokens = non_alphanumeric_pattern.sub(" ", name.lower().replace("&", " and ")).split()
+    return " ".join(sorted(tokens))
+
+class ConstituencyLinker:
+    # Links constituency names to a fixed set of target names (e.g. the constituencies after a boundary change).
+    # The targets are indexed once: names with an identical normalised key are matched by a dictionary lookup and
+    # only the leftovers are fuzzy matched, against targets that share at least one word.
+
+    def __init__(self, target_names):
+        self.key_to_target = {}
+        self.token_to_keys = {}
+        for target_name in target_names:
+            key = normalise_constituency_name(target_name)
+            if ((key == "") or (key in self.key_to_target)):
+                continue
+            self.key_to_target[key] = target_name
+            for token in set(key.split()):
+                self.token_to_keys.setdefault(token, set()).add(key)
+
+    def get_candidate_keys(self, key, max_candidates):
+        # Targets sharing the most words with the name, capped at max_candidates
+        shared_token_counts = {}
+        for token in set(key.split()):
+            for candidate_key in self.token_to_keys.get(token, ()):
+                shared_token_counts[candidate_key] = shared_token_counts.get(candidate_key, 0) + 1
+        ranked_keys = sorted(shared_token_counts.keys(), key=lambda candidate_key: (-shared_token_counts[candidate_key], candidate_key))
+        return ranked_keys[:max_candidates]
+
+    def link(self, name, min_score=90, max_candidates=25):
+        # Returns (target name, score out of 100, method) where method is "exact", "fuzzy" or "unmatched"
+        key = normalise_constituency_name(name)
+        if (key in self.key_to_target):
+            return self.key_to_target[key], 100, "exact"
+
+        best_key = None
+        best_score = -1
+        for candidate_key in self.get_candidate_keys(key, max_candidates):
+            score = round(100*difflib.SequenceMatcher(None, key, candidate_key).ratio())
+            if (score > best_score):
+                best_key = candidate_key
+                best_score = score
+
+        if ((best_key is not None) and (best_score >= min_score)):
+            return self.key_to_target[best_key], best_score, "fuzzy"
+        return None, max(best_score, 0), "unmatched"
+
+    def link_all(self, names, min_score=90, max_candidates=25):
+        rows = []
+        for name in pd.unique(pd.Series(list(names)).dropna()):
+            target_name, score, method = self.link(name, min_score, max_candidates)
+            rows.append((name, target_name, score, method))
+        return pd.DataFrame(rows, columns=crosswalk_columns[1:])
+
+def get_target_set_key(target_names):
+    # Identifies a set of target names (e.g. the 2010 constituencies) so one crosswalk file can hold several mappings
+    return hashlib.sha1("\n".join(sorted(set(target_names))).encode()).hexdigest()[:16]
+
+def load_crosswalk(crosswalk_path):
+    if ((crosswalk_path is None) or (not os.path.exists(crosswalk_path))):
+        return pd.DataFrame(columns=crosswalk_columns)
+    crosswalk = pd.read_csv(crosswalk_path)
+    # Files saved before target sets were recorded can't be told apart, so their rows get linked again
+    if ("target_set" not in crosswalk.columns):
+        return pd.DataFrame(columns=crosswalk_columns)
+    return crosswalk[crosswalk_columns]
+
+def save_crosswalk(crosswalk, crosswalk_path):
+    crosswalk_dir = os.path.dirname(crosswalk_path)
+    if (crosswalk_dir != ""):
+        os.makedirs(crosswalk_dir, exist_ok=True)
+    crosswalk.to_csv(crosswalk_path, index=False)
+
+def link_constituency_names(source_names, target_names, crosswalk_path=None, min_score=90, max_candidates=25):
+    # Returns a crosswalk DataFrame (source_name, target_name, score, method) for every source name. If crosswalk_path
+    # is given, names already linked to the same set of target names are reused and only new names are linked before
+    # it's saved again. Links to other target sets (e.g. 2001 -> 2005 alongside 2005 -> 2010) are kept in the file as
+    # they are. Names that were unmatched before are retried.
+    target_names = list(target_names)
+    target_set = get_target_set_key(target_names)
+    saved_crosswalk = load_crosswalk(crosswalk_path)
+    is_target_set = saved_crosswalk["target_set"] == target_set
+    other_crosswalks = saved_crosswalk[~is_target_set]
+    crosswalk = saved_crosswalk[is_target_set & (saved_crosswalk["method"] != "unmatched")]
+
+    source_names = pd.unique(pd.Series(list(source_names)).dropna())
+    known_names = set(crosswalk["source_name"].values)
+    new_names = [name for name in source_names if name not in known_names]
+
+    if (len(new_names) > 0):
+        linker = ConstituencyLinker(target_names)
+        new_links = linker.link_all(new_names, min_score, max_candidates)
+        new_links.insert(0, "target_set", target_set)
+        crosswalk = pd.concat([crosswalk, new_links], ignore_index=True)
+        if (crosswalk_path is not None):
+            save_crosswalk(pd.concat([other_crosswalks, crosswalk], ignore_index=True), crosswalk_path)
+
+    crosswalk = crosswalk[crosswalk["source_name"].isin(source_names)]
+    return crosswalk[crosswalk_columns[1:]].reset_index(drop=True)
+
+def apply_crosswalk(df, name_column, crosswalk):
+    # Returns a copy of df with name_column replaced by the linked target names, names with no link are left as they are
+    df = df.copy()
+    linked = crosswalk.dropna(subset=["target_name"])
+    name_map = pd.Series(linked["target_name"].values, index=linked["source_name"].values)
+    df[name_column] = df[name_column].map(name_map).fillna(df[name_column])
+    return df
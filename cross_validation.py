@@ -0,0 +1,183 @@
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+from sklearn.base import clone
+from sklearn.model_selection import KFold, ParameterGrid, ParameterSampler
+from sklearn.metrics import confusion_matrix, accuracy_score
+from imblearn.over_sampling import SMOTE
+
+# k-fold cross validation and hyperparameter searches with SMOTE oversampling of the training folds.
+#
+# The oversampled folds are worked out once per (data, k, seed) and cached, in memory and optionally on disk, so
+# every model and hyperparameter set is trained on exactly the same folds without re-running SMOTE. The fold x
+# hyperparameter jobs are spread over a process pool with the fold arrays in shared memory, and the confusion
+# matrices are merged once all the jobs are back.
+
+# Oversampled folds are a few copies of the training data each, so only the smote_fold_cache_size most recently
+# used are kept in memory (the npz files in cache_dir aren't limited)
+smote_fold_cache = {}
+smote_fold_cache_size = 4
+
+def cache_smote_folds(data_hash, folds):
+    smote_fold_cache[data_hash] = folds
+    while (len(smote_fold_cache) > smote_fold_cache_size):
+        smote_fold_cache.pop(next(iter(smote_fold_cache)))
+
+def get_data_hash(features, target_codes, k, seed, shuffle):
+    data_hash = hashlib.sha1()
+    data_hash.update(np.ascontiguousarray(features).tobytes())
+    data_hash.update(np.ascontiguousarray(target_codes).tobytes())
+    data_hash.update(repr((features.shape, k, seed, shuffle)).encode())
+    return data_hash.hexdigest()
+
+def encode_targets(targets):
+    labels, target_codes = np.unique(np.asarray(targets), return_inverse=True)
+    return labels, target_codes.astype(np.int64)
+
+def get_smote_folds(features, targets, k=5, seed=0, shuffle=False, cache_dir=None):
+    # Returns (labels, folds) where each fold is a dict with the oversampled training features and target codes
+    # along with the untouched test indexes
+    features = np.asarray(features, dtype=float)
+    labels, target_codes = encode_targets(targets)
+    data_hash = get_data_hash(features, target_codes, k, seed, shuffle)
+
+    if (data_hash in smote_fold_cache):
+        smote_fold_cache[data_hash] = smote_fold_cache.pop(data_hash)
+        return labels, smote_fold_cache[data_hash]
+
+    cache_path = None
+    if (cache_dir is not None):
+        cache_path = os.path.join(cache_dir, data_hash + ".npz")
+        if (os.path.exists(cache_path)):
+            cached = np.load(cache_path)
+            folds = [{
+                "X_train": cached["X_train_" + str(fold_no)],
+                "y_train": cached["y_train_" + str(fold_no)],
+                "test_index": cached["test_index_" + str(fold_no)]
+            } for fold_no in range(0, k)]
+            cache_smote_folds(data_hash, folds)
+            return labels, folds
+
+    kf = KFold(n_splits=k, shuffle=shuffle, random_state=(seed if shuffle else None))
+    oversample = SMOTE(random_state=seed)
+    folds = []
+    for train_index, test_index in kf.split(features):
+        X_train, y_train = oversample.fit_resample(features[train_index], target_codes[train_index])
+        folds.append({"X_train": X_train, "y_train": y_train, "test_index": test_index})
+
+    if (cache_path is not None):
+        os.makedirs(cache_dir, exist_ok=True)
+        arrays = {}
+        for fold_no in range(0, k):
+            for name, array in folds[fold_no].items():
+                arrays[name + "_" + str(fold_no)] = array
+        np.savez(cache_path, **arrays)
+
+    cache_smote_folds(data_hash, folds)
+    return labels, folds
+
+# Arrays the jobs work on. In worker processes these are views onto shared memory set up by attach_shared_arrays.
+worker_state = {}
+
+def create_shared_arrays(arrays):
+    # Copies each array into its own shared memory block, returns the blocks and the specs workers need to attach
+    blocks = []
+    specs = {}
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+        blocks.append(block)
+        specs[name] = (block.name, array.shape, array.dtype.str)
+    return blocks, specs
+
+def attach_shared_arrays(specs, model):
+    worker_state["blocks"] = []
+    worker_state["arrays"] = {}
+    for name, (block_name, shape, dtype) in specs.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        worker_state["blocks"].append(block)
+        worker_state["arrays"][name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+    worker_state["model"] = model
+
+def run_fold_job(job):
+    fold_no, params_no, params = job
+    arrays = worker_state["arrays"]
+    model = clone(worker_state["model"])
+    model.set_params(**params)
+    model.fit(arrays["X_train_" + str(fold_no)], arrays["y_train_" + str(fold_no)])
+    test_index = arrays["test_index_" + str(fold_no)]
+    predictions = np.asarray(model.predict(arrays["features"][test_index])).astype(np.int64)
+    return fold_no, params_no, predictions
+
+def evaluate_with_smote(features, targets, model, param_sets=[{}], k=5, seed=0, shuffle=False, n_workers=None, cache_dir=None):
+    # Cross validates the model with every set of hyperparameters in param_sets on the same oversampled folds.
+    # Returns a dict with:
+    # - results: DataFrame with a row per param set (params, mean_accuracy, sd_accuracy, fold accuracies), best first
+    # - confusion_matrices: list of merged (over all folds) confusion matrices, in the same order as param_sets
+    # - labels: the class labels in confusion matrix order
+    # - best_params: the params with the highest mean accuracy
+    param_sets = list(param_sets)
+    features = np.asarray(features, dtype=float)
+    labels, folds = get_smote_folds(features, targets, k, seed, shuffle, cache_dir)
+    target_codes = encode_targets(targets)[1]
+
+    arrays = {"features": features}
+    for fold_no in range(0, len(folds)):
+        for name, array in folds[fold_no].items():
+            arrays[name + "_" + str(fold_no)] = array
+
+    jobs = [(fold_no, params_no, param_sets[params_no]) for params_no in range(0, len(param_sets)) for fold_no in range(0, len(folds))]
+
+    if (n_workers is None):
+        n_workers = os.cpu_count() or 1
+    n_workers = min(n_workers, len(jobs))
+
+    if (n_workers <= 1):
+        worker_state["arrays"] = arrays
+        worker_state["model"] = model
+        job_results = [run_fold_job(job) for job in jobs]
+        worker_state.clear()
+    else:
+        blocks, specs = create_shared_arrays(arrays)
+        try:
+            with ProcessPoolExecutor(max_workers=n_workers, initializer=attach_shared_arrays, initargs=(specs, model)) as executor:
+                job_results = list(executor.map(run_fold_job, jobs))
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+
+    # Merge the folds for each param set
+    predictions = [[None]*len(folds) for params_no in range(0, len(param_sets))]
+    for fold_no, params_no, fold_predictions in job_results:
+        predictions[params_no][fold_no] = fold_predictions
+
+    rows = []
+    confusion_matrices = []
+    for params_no in range(0, len(param_sets)):
+        fold_accuracies = [accuracy_score(target_codes[folds[fold_no]["test_index"]], predictions[params_no][fold_no]) for fold_no in range(0, len(folds))]
+        all_real_values = np.concatenate([target_codes[fold["test_index"]] for fold in folds])
+        all_predictions = np.concatenate(predictions[params_no])
+        confusion_matrices.append(confusion_matrix(all_real_values, all_predictions, labels=np.arange(len(labels))))
+        row = {"params": param_sets[params_no], "mean_accuracy": np.mean(fold_accuracies), "sd_accuracy": np.std(fold_accuracies)}
+        for fold_no in range(0, len(folds)):
+            row["fold_" + str(fold_no) + "_accuracy"] = fold_accuracies[fold_no]
+        rows.append(row)
+
+    results_df = pd.DataFrame(rows).sort_values("mean_accuracy", ascending=False, kind="stable")
+    return {
+        "results": results_df,
+        "confusion_matrices": confusion_matrices,
+        "labels": labels,
+        "best_params": results_df["params"].values[0]
+    }
+
+def grid_search_with_smote(features, targets, model, param_grid, k=5, seed=0, n_workers=None, cache_dir=None):
+    return evaluate_with_smote(features, targets, model, ParameterGrid(param_grid), k, seed, n_workers=n_workers, cache_dir=cache_dir)
+
+def random_search_with_smote(features, targets, model, param_distributions, n_iter=10, k=5, seed=0, n_workers=None, cache_dir=None):
+    return evaluate_with_smote(features, targets, model, ParameterSampler(param_distributions, n_iter, random_state=seed), k, seed, n_workers=n_workers, cache_dir=cache_dir)
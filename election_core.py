@@ -0,0 +1,496 @@
+import pandas as pd
+import numpy as np
+import streaming_stats
+import profiling
+from election_store import ElectionStore, is_party_column, get_column_years
+
+# The numeric side of utilities, which only needs pandas and NumPy so batch workers and services can import it
+# without loading matplotlib or plotly. utilities re-exports everything here along with the drawing functions.
+
+def get_election_parties(df, year):
+    if (isinstance(df, ElectionStore)):
+        return df.parties(year)
+    parties = []
+    for col in df.columns:
+        if (is_party_column(col, year)):
+            parties.append(col.replace(str(year + "_"), ""))
+    return parties
+
+def get_election_frame(df):
+    if (isinstance(df, ElectionStore)):
+        return df.df
+    return df
+
+def get_vote_column(df, col):
+    # Stores have already had their vote columns coerced so we can skip to_numeric. They're float32 though, which
+    # loses whole votes once summed to national totals, so they're upcast for summing.
+    if (isinstance(df, ElectionStore)):
+        return df.df[col].astype(np.float64)
+    # TODO: to_numeric here deals with the fact that some of the election dfs haven't had their vote columns put into pure numeric form
+    return pd.to_numeric(df[col])
+
+summary_cube_cache = {}
+summary_cube_cache_size = 32
+
+def get_default_summary_groupings(df):
+    groupings = {"uk": None}
+    for level, col in [("country", "country_name"), ("region", "region_name")]:
+        if (col in df.columns):
+            groupings[level] = col
+    return groupings
+
+def calculate_election_summary_cube(df, years=None, groupings=None):
+    # Seats, votes and vote shares for every party, year and group in one grouped aggregation, along with the changes
+    # from the previous year in years (use compare_summary_years for any other pair). Returns a tidy DataFrame with the
+    # columns:
+    #   level, group, year, compare_year, party, seats, votes, share, compare_seats, compare_share, seat_change, share_change
+    #
+    # Parameters:
+    # - df (DataFrame or ElectionStore): constituency results with <year>_<party>, <year>_valid_votes and <year>_first_party columns
+    # - years (array of strings): years to include in order, defaults to every year with a valid votes column
+    # - groupings (dict): level name -> column to group by, or a boolean mask selecting a custom group, or None for
+    #   every constituency. Defaults to UK wide, by country and by region (where those columns exist).
+    #
+    # Results for an ElectionStore are memoized on the store's version, for the summary_cube_cache_size most
+    # recently used.
+    frame = get_election_frame(df)
+    if (years is None):
+        years = [year for year in get_column_years(frame) if (year + "_valid_votes") in frame.columns]
+    years = [str(year) for year in years]
+    if (groupings is None):
+        groupings = get_default_summary_groupings(frame)
+    
+    cache_key = None
+    if (isinstance(df, ElectionStore)):
+        grouping_key = tuple((level, grouping if (grouping is None or isinstance(grouping, str)) else np.asarray(grouping).tobytes()) for level, grouping in groupings.items())
+        cache_key = (df.version, tuple(years), grouping_key)
+        if (cache_key in summary_cube_cache):
+            summary_cube_cache[cache_key] = summary_cube_cache.pop(cache_key)
+            return summary_cube_cache[cache_key]
+    
+    votes, parties = get_vote_matrix(df, years)
+    # A party with a column stood, even if it has no votes in these rows (e.g. pc in a Scotland only frame)
+    has_column = np.array([[(year + "_" + party) in frame.columns for party in parties] for year in years], dtype=bool).reshape(len(years), len(parties))
+    valid_votes = np.column_stack([get_vote_column(df, year + "_valid_votes").values.astype(float) for year in years])
+    
+    # Seat winners can include parties without a votes column (e.g. the speaker)
+    all_parties = list(parties)
+    winner_codes = np.full((frame.shape[0], len(years)), -1, dtype=np.int64)
+    for year_no in range(0, len(years)):
+        col_name = years[year_no] + "_first_party"
+        if (col_name in frame.columns):
+            for party in pd.unique(frame[col_name].dropna()):
+                if (party not in all_parties):
+                    all_parties.append(party)
+            winner_codes[:, year_no] = pd.Categorical(frame[col_name], categories=all_parties).codes
+    no_parties = len(all_parties)
+    has_column = np.concatenate([has_column, np.zeros((len(years), no_parties - len(parties)), dtype=bool)], axis=1)
+    votes = np.concatenate([np.nan_to_num(votes), np.zeros((frame.shape[0], len(years), no_parties - len(parties)))], axis=2)
+    valid_votes = np.nan_to_num(valid_votes)
+    
+    level_dfs = []
+    for level, grouping in groupings.items():
+        if (grouping is None):
+            group_codes = np.zeros(frame.shape[0], dtype=np.int64)
+            group_labels = [level]
+        elif (isinstance(grouping, str)):
+            group_codes, group_labels = pd.factorize(frame[grouping], sort=True)
+        else:
+            group_codes = np.where(np.asarray(grouping, dtype=bool), 0, -1)
+            group_labels = [level]
+        no_groups = len(group_labels)
+        in_group = group_codes >= 0
+        
+        group_votes = np.zeros((no_groups, len(years), no_parties))
+        np.add.at(group_votes, group_codes[in_group], votes[in_group])
+        group_valid_votes = np.zeros((no_groups, len(years)))
+        np.add.at(group_valid_votes, group_codes[in_group], valid_votes[in_group])
+        group_seats = np.zeros((no_groups, len(years), no_parties), dtype=np.int64)
+        for year_no in range(0, len(years)):
+            has_winner = in_group & (winner_codes[:, year_no] >= 0)
+            cells = group_codes[has_winner]*no_parties + winner_codes[has_winner, year_no]
+            group_seats[:, year_no, :] = np.bincount(cells, minlength=no_groups*no_parties).reshape(no_groups, no_parties)
+        
+        with np.errstate(divide="ignore", invalid="ignore"):
+            group_shares = np.where(has_column[np.newaxis, :, :], 100*group_votes/group_valid_votes[:, :, np.newaxis], np.nan)
+        group_votes = np.where(has_column[np.newaxis, :, :], group_votes, np.nan)
+        
+        # Compare each year with the one before it
+        compare_seats = np.full(group_seats.shape, np.nan)
+        compare_seats[:, 1:, :] = group_seats[:, :-1, :]
+        compare_shares = np.full(group_shares.shape, np.nan)
+        compare_shares[:, 1:, :] = group_shares[:, :-1, :]
+        
+        group_index, year_index, party_index = np.meshgrid(np.arange(no_groups), np.arange(len(years)), np.arange(no_parties), indexing="ij")
+        level_df = pd.DataFrame({
+            "level": level,
+            "group": np.asarray(group_labels, dtype=object)[group_index.ravel()],
+            "year": np.asarray(years, dtype=object)[year_index.ravel()],
+            "compare_year": np.asarray([None] + years[:-1], dtype=object)[year_index.ravel()],
+            "party": np.asarray(all_parties, dtype=object)[party_index.ravel()],
+            "seats": group_seats.ravel(),
+            "votes": group_votes.ravel(),
+            "share": group_shares.ravel(),
+            "compare_seats": compare_seats.ravel(),
+            "compare_share": compare_shares.ravel()
+        })
+        level_df["seat_change"] = level_df["seats"] - level_df["compare_seats"]
+        level_df["share_change"] = level_df["share"] - level_df["compare_share"]
+        # Drop parties that neither stood nor won a seat in the group that year
+        level_df = level_df[(level_df["seats"] > 0) | has_column[year_index.ravel(), party_index.ravel()]]
+        level_dfs.append(level_df)
+    
+    cube_df = pd.concat(level_dfs, ignore_index=True)
+    if (cache_key is not None):
+        summary_cube_cache[cache_key] = cube_df
+        while (len(summary_cube_cache) > summary_cube_cache_size):
+            summary_cube_cache.pop(next(iter(summary_cube_cache)))
+    return cube_df
+
+def compare_summary_years(cube_df, year, compare_year):
+    # The rows of a summary cube for year with the compare columns filled in from compare_year instead of the previous
+    # year, looked up from the cube rather than worked out again. Both years have to be in the cube.
+    year = str(year)
+    compare_year = str(compare_year)
+    for cube_year in [year, compare_year]:
+        if (cube_year not in cube_df["year"].values):
+            raise Exception("year " + cube_year + " not recognised")
+    year_df = cube_df[cube_df["year"] == year].drop(columns=["compare_year", "compare_seats", "compare_share", "seat_change", "share_change"])
+    compare_df = cube_df[cube_df["year"] == compare_year][["level", "group", "party", "seats", "share"]].rename(columns={"seats": "compare_seats", "share": "compare_share"})
+    compared_df = year_df.merge(compare_df, on=["level", "group", "party"], how="left")
+    compared_df.insert(3, "compare_year", compare_year)
+    compared_df["seat_change"] = compared_df["seats"] - compared_df["compare_seats"]
+    compared_df["share_change"] = compared_df["share"] - compared_df["compare_share"]
+    return compared_df
+
+def print_summary_election_result(df, year, compare_df=None, compare_year=None, additional_title=None):
+    year = str(year)
+    this_election_df = calculate_election_summary_cube(df, [year], {"uk": None})
+    # Seats are listed in value_counts order, as they always have been, so ties keep their order
+    seat_order = get_election_frame(df)[year + "_first_party"].value_counts().index
+    seats_won = this_election_df.set_index("party").loc[seat_order, "seats"]
+    
+    if ((compare_df is not None) and (compare_year != None)):
+        compare_year = str(compare_year)
+        compare_election_df = calculate_election_summary_cube(compare_df, [compare_year], {"uk": None}).set_index("party")
+        
+        print("====================================================================================================")
+        print("=== " + year + " general election summary (compared with " + compare_year + ")")
+        if (additional_title != None):
+            print("=== " + additional_title)
+        print("===================================================================================================")
+    
+        if (df.shape[0] != compare_df.shape[0]):
+            print("(constituency changes occured, difference of " + '{0:+}'.format(df.shape[0] - compare_df.shape[0]) + ")")
+        print("\nSEATS WON: ")
+        for party, seats in seats_won.items():
+            if ((party in compare_election_df.index) and (compare_election_df.at[party, "seats"] > 0)):
+                print('{:10s}'.format(party) + str(seats) + " (" + '{0:+}'.format(seats - compare_election_df.at[party, "seats"]) + ")")
+            else:
+                print('{:10s}'.format(party) + str(seats))
+        print("\nVOTE SHARE:")
+        for party, share in zip(this_election_df["party"], this_election_df["share"]):
+            if (np.isnan(share)):
+                continue
+            if ((party in compare_election_df.index) and (not np.isnan(compare_election_df.at[party, "share"]))):
+                print('{:10s}'.format(party) + str(round(float(share), 1)) + "% (" + '{0:+}'.format(round(float(share - compare_election_df.at[party, "share"]), 1)) + "%)")
+            else:
+                print('{:10s}'.format(party) + str(round(float(share), 1)) + "%")
+    else:
+        print("====================================================================================================")
+        print("=== " + year + " general election summary")
+        print("===================================================================================================")
+        print("\nSEATS WON: ")
+        print(pd.Series(seats_won.values, index=seats_won.index.values).to_string())
+        print("\nVOTE SHARE:")
+        for party, share in zip(this_election_df["party"], this_election_df["share"]):
+            if (not np.isnan(share)):
+                print('{:10s}'.format(party) + str(round(float(share), 1)) + "%")
+    
+    print()
+            
+def get_vote_matrix(df, years, parties=None):
+    # Returns a (constituencies x years x parties) float matrix of votes along with the party names.
+    # Parties that didn't stand in a given year (no column) are left as NaN.
+    years = [str(year) for year in years]
+    if (parties is None):
+        parties = []
+        for year in years:
+            for party in get_election_parties(df, year):
+                if (party not in parties):
+                    parties.append(party)
+    
+    votes = np.full((df.shape[0], len(years), len(parties)), np.nan)
+    for year_no in range(0, len(years)):
+        for party_no in range(0, len(parties)):
+            col_name = years[year_no] + "_" + parties[party_no]
+            if (col_name in df.columns):
+                votes[:, year_no, party_no] = pd.to_numeric(df[col_name], errors="coerce")
+    return votes, parties
+
+def calculate_results_from_vote_matrix(votes, parties, valid_votes=None):
+    # Works out the first and second party, majority and margin (majority as a % of valid votes) for every
+    # row of a (... x parties) vote matrix in one go. NaN votes are treated as no candidate standing, rows with
+    # no candidates come out as "invalid" in the same way as calculate_constit_winners.
+    votes = np.asarray(votes, dtype=float)
+    party_names = np.array(list(parties) + ["invalid"], dtype=object)
+    
+    # A stable sort keeps the earliest party in the list ahead on a tie, the same as the old row by row loop
+    ranked_votes = np.where(np.isnan(votes), -np.inf, votes)
+    order = np.argsort(-ranked_votes, axis=-1, kind="stable")
+    
+    first_votes = np.take_along_axis(ranked_votes, order[..., :1], axis=-1)[..., 0]
+    first_index = np.where(np.isneginf(first_votes), len(parties), order[..., 0])
+    if (len(parties) > 1):
+        second_votes = np.take_along_axis(ranked_votes, order[..., 1:2], axis=-1)[..., 0]
+        second_index = np.where(np.isneginf(second_votes), len(parties), order[..., 1])
+    else:
+        second_votes = np.full(first_votes.shape, -np.inf)
+        second_index = np.full(first_index.shape, len(parties))
+    
+    first_votes = np.where(np.isneginf(first_votes), np.nan, first_votes)
+    second_votes = np.where(np.isneginf(second_votes), np.nan, second_votes)
+    majority = first_votes - second_votes
+    
+    if (valid_votes is None):
+        valid_votes = np.nansum(votes, axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        margin = 100*majority/np.asarray(valid_votes, dtype=float)
+    
+    return {
+        "first_party": party_names[first_index],
+        "second_party": party_names[second_index],
+        "majority": majority,
+        "margin": margin
+    }
+
+def calculate_constit_results(df, years, parties=None):
+    # Returns a DataFrame (indexed like df) with <year>_first_party, <year>_second_party, <year>_majority
+    # and <year>_margin columns for every year, computed in a single pass over the vote matrix.
+    years = [str(year) for year in years]
+    votes, parties = get_vote_matrix(df, years, parties)
+    
+    valid_votes = np.full((df.shape[0], len(years)), np.nan)
+    for year_no in range(0, len(years)):
+        col_name = years[year_no] + "_valid_votes"
+        if (col_name in df.columns):
+            valid_votes[:, year_no] = pd.to_numeric(df[col_name], errors="coerce")
+    # Fall back on the sum of the party votes where we don't have a valid votes figure
+    valid_votes = np.where(np.isnan(valid_votes), np.nansum(votes, axis=-1), valid_votes)
+    
+    results = calculate_results_from_vote_matrix(votes, parties, valid_votes)
+    
+    results_df = pd.DataFrame(index=df.index)
+    for year_no in range(0, len(years)):
+        year = years[year_no]
+        results_df[year + "_first_party"] = pd.Series(results["first_party"][:, year_no], index=df.index).str.lower()
+        results_df[year + "_second_party"] = pd.Series(results["second_party"][:, year_no], index=df.index).str.lower()
+        results_df[year + "_majority"] = results["majority"][:, year_no]
+        results_df[year + "_margin"] = results["margin"][:, year_no]
+    return results_df
+
+def _calculate_row_results(row, year, parties):
+    votes = pd.to_numeric(pd.Series([row[year + "_" + party] for party in parties]), errors="coerce").values
+    return calculate_results_from_vote_matrix(votes[np.newaxis, :], parties)
+
+def calculate_constit_winners(row, year, parties):
+    return _calculate_row_results(row, year, parties)["first_party"][0].lower()
+
+def calculate_constit_runnerup(row, year, parties):
+    return _calculate_row_results(row, year, parties)["second_party"][0]
+
+def calculate_share_change(row, recent_year, distant_year, party):
+    recent_election_party_votes_col = recent_year + "_" + party
+    recent_election_valid_votes_col = recent_year + "_valid_votes"
+    distant_election_party_votes_col = distant_year + "_" + party
+    distant_election_valid_votes_col = distant_year + "_valid_votes"
+    return 100*(row[recent_election_party_votes_col]/row[recent_election_valid_votes_col] - row[distant_election_party_votes_col]/row[distant_election_valid_votes_col])
+
+# Won't work perfectly for comparing using 2010 or earlier as the base year
+def calculate_net_volatility(df, compare_year, year):
+    total_votes_this_election = get_vote_column(df, year + "_valid_votes").sum(skipna=True)
+    total_votes_last_election = get_vote_column(df, compare_year + "_valid_votes").sum(skipna=True)
+    parties_this_election = get_election_parties(df, year)
+    
+    pederson_sum = 0
+    for party in parties_this_election:
+        party_votes_this_election = get_vote_column(df, year + "_" + party).sum(skipna=True)
+        party_share_this_election = 100*party_votes_this_election/total_votes_this_election
+        party_votes_last_election = get_vote_column(df, compare_year + "_" + party).sum(skipna=True)
+        party_share_last_election = 100*party_votes_last_election/total_votes_last_election
+        pederson_sum = pederson_sum + abs(party_share_this_election-party_share_last_election)
+        
+    return pederson_sum/2
+
+individual_volatility_dont_include = ["Didn't vote", "Don't know", " "]
+
+def get_group_codes(df, group_by):
+    # Integer group code for every row (-1 where a key is missing) along with the group labels
+    if (group_by is None):
+        return np.zeros(df.shape[0], dtype=np.int64), None
+    if (isinstance(group_by, str)):
+        group_by = [group_by]
+    if (len(group_by) == 1):
+        codes, labels = pd.factorize(df[group_by[0]], sort=True)
+        return codes, pd.Index(labels, name=group_by[0])
+    codes, labels = pd.factorize(pd.MultiIndex.from_frame(df[group_by]), sort=True)
+    labels.names = group_by
+    return codes, labels
+
+# Won't work perfectly for comparing using 2010 or earlier as the base year
+def calculate_individual_volatility(df, column_pairs, weight_column, group_by=None, dont_include=individual_volatility_dont_include):
+    # Weighted % of respondents who switched party for every (past election column, current election column) pair,
+    # optionally split by one or more group_by columns. Returns a tidy DataFrame with a row per pair and group.
+    # Respondents with a missing or dont_include answer at either election, or a missing, zero or negative weight, are
+    # left out, including from the respondents and effective sample size counts. Zero and missing weights never
+    # changed the volatility, but the old row by row loop counted a missing answer as a switch and a negative weight
+    # in the total.
+    group_codes, group_labels = get_group_codes(df, group_by)
+    no_groups = 1 if (group_labels is None) else len(group_labels)
+    
+    weights = pd.to_numeric(df[weight_column], errors="coerce").fillna(0).values.astype(float)
+    weights = np.where(weights > 0, weights, 0)
+    has_group = group_codes >= 0
+    
+    results = []
+    for past_election_column, current_election_column in column_pairs:
+        past_votes = df[past_election_column]
+        current_votes = df[current_election_column]
+        included = (has_group & (weights > 0) & past_votes.notna().values & current_votes.notna().values
+            & ~past_votes.isin(dont_include).values & ~current_votes.isin(dont_include).values)
+        switched = included & (past_votes.values != current_votes.values)
+        
+        codes = group_codes[included]
+        included_weights = weights[included]
+        total_weight = np.bincount(codes, weights=included_weights, minlength=no_groups)
+        switcher_weight = np.bincount(group_codes[switched], weights=weights[switched], minlength=no_groups)
+        squared_weight = np.bincount(codes, weights=included_weights**2, minlength=no_groups)
+        respondents = np.bincount(codes, minlength=no_groups)
+        
+        with np.errstate(divide="ignore", invalid="ignore"):
+            pair_results = pd.DataFrame({
+                "past_election_column": past_election_column,
+                "current_election_column": current_election_column,
+                "volatility": 100*switcher_weight/total_weight,
+                "switcher_weight": switcher_weight,
+                "total_weight": total_weight,
+                "respondents": respondents,
+                # Kish's effective sample size
+                "effective_sample_size": total_weight**2/squared_weight
+            })
+        if (group_labels is not None):
+            pair_results.index = group_labels
+            pair_results = pair_results.reset_index()
+        results.append(pair_results)
+    
+    return pd.concat(results, ignore_index=True)
+
+# Won't work perfectly for comparing using 2010 or earlier as the base year
+def estimate_individual_volatility(df, past_election_column, current_election_column, weight_column):
+    # Single pair, no groups version of calculate_individual_volatility (so the same respondents are left out)
+    return calculate_individual_volatility(df, [(past_election_column, current_election_column)], weight_column)["volatility"].values[0]
+
+bes_invalid_values = ["9999", "", " ", 9999, np.nan, 99, 98]
+
+def get_invalid_answer_mask(df, columns, invalid_values=bes_invalid_values):
+    answers = df[columns]
+    return answers.isin(invalid_values).values | answers.isna().values
+
+def coalesce_answers(answers, invalid_mask):
+    # Picks the first valid answer along each row of an (respondents x waves) array
+    valid_mask = ~invalid_mask
+    first_valid = valid_mask.argmax(axis=1)
+    values = answers[np.arange(answers.shape[0]), first_valid]
+    return np.where(valid_mask.any(axis=1), values, None)
+
+def find_most_recent_answer(df, columns, invalid_values=bes_invalid_values, numeric=False):
+    # Returns an array of respondents' most recent answer to a survey question. None represents a respondent not giving an answer.
+    #
+    # Parameters:
+    # - df (DataFrame): dataframe to use for getting responses
+    # - columns (array of strings): ordered array of survey question column names to inspect for answers going from the most recent to least recent
+    # - invalid_values (array of strings): a list of values to deem as invalid repsonses and thus ignore
+    # - numeric (bool): convert the answers to numbers, with no answer becoming NaN
+    answers = coalesce_answers(df[columns].to_numpy(dtype=object), get_invalid_answer_mask(df, columns, invalid_values))
+    if (numeric):
+        return pd.to_numeric(answers, errors="coerce")
+    return answers
+
+def build_most_recent_answer_features(df, feature_columns, invalid_values=bes_invalid_values, numeric=True):
+    # Builds a DataFrame of features from a mapping of feature name -> ordered list of wave columns (most recent first),
+    # using find_most_recent_answer for each one. The invalid answer mask is worked out once for every column involved.
+    all_columns = []
+    for columns in feature_columns.values():
+        for column in columns:
+            if (column not in all_columns):
+                all_columns.append(column)
+    column_positions = {column: position for position, column in enumerate(all_columns)}
+    
+    all_answers = df[all_columns].to_numpy(dtype=object)
+    all_invalid = get_invalid_answer_mask(df, all_columns, invalid_values)
+    
+    features_df = pd.DataFrame(index=df.index)
+    for feature, columns in feature_columns.items():
+        positions = [column_positions[column] for column in columns]
+        answers = coalesce_answers(all_answers[:, positions], all_invalid[:, positions])
+        if (numeric):
+            answers = pd.to_numeric(answers, errors="coerce")
+        features_df[feature] = answers
+    return features_df
+
+def print_descriptive_summary_statistics(column):
+    # All worked out in one pass, see streaming_stats for the grouped and chunked csv versions
+    stats = streaming_stats.describe_series(column)
+    if (column.dtype.kind in "iu"):
+        for stat_name in ["min", "max", "mode"]:
+            stats[stat_name] = column.dtype.type(stats[stat_name])
+    print("Min:    " + str(stats["min"]))
+    print("Q1:     " + str(stats["q1"]))
+    print("Median: " + str(stats["median"]))
+    print("Q3:     " + str(stats["q3"]))
+    print("Max:    " + str(stats["max"]))
+    print("Mean:   " + str(stats["mean"]))
+    print("Mode:   " + str(stats["mode"]))
+    print("SD:     " + str(stats["sd"]))
+    print("Skew:   " + str(stats["skew"]))
+    print("Kurto:  " + str(stats["kurtosis"]))
+
+def get_ge_colour_map():
+    return {
+    "con": "blue",
+    "lab": "red",
+    "ld": "orange",
+    "brexit": "lightblue",
+    "ukip": "purple",
+    "green": "green",
+    "snp": "yellow",
+    "pc": "lightgreen",
+    "sf": "darkgreen",
+    "spk": "lightgray",
+    "dup": "#ad494a",
+    "sdlp": "#dcc451",
+    "uup": "darkblue",
+    "alliance": "gold",
+    "ind": "gray",
+    "other": "gray",
+    "invalid": "black",
+    "na": "white"
+}
+
+def get_regions_colour_map():
+    return {
+    "scotland": "blue",
+    "wales": "red",
+    "northern ireland": "lightgreen",
+    "north east": "green",
+    "north west": "pink",
+    "london": "cyan",
+    "south east": "orange",
+    "west midlands": "yellow",
+    "south west": "purple",
+    "east": "white",
+    "east midlands": "lightblue",
+    "yorkshire and the humber": "lightgray"
+}
+
+profiling.profile_from_environment(__name__)
@@ -0,0 +1,170 @@
+import os
+import re
+import glob
+import pickle
+import hashlib
+import pandas as pd
+import numpy as np
+
+# Any column containing one of these isn't a party's vote count
+non_party_column_markers = ["elect", "id", "cons", "region", "country", "valid", "party", "share", "bound", "result", "majority", "margin"]
+# Non party columns that still hold vote counts and should be stored as numbers
+numeric_count_suffixes = ["_valid_votes", "_invalid_votes", "_electorate", "_majority"]
+
+year_column_pattern = re.compile(r"^(\d{4})_")
+
+cache_format_version = 1
+
+def is_party_column(col, year):
+    year = str(year)
+    if (year not in col):
+        return False
+    for marker in non_party_column_markers:
+        if (marker in col):
+            return False
+    return True
+
+def get_column_years(df):
+    years = []
+    for col in df.columns:
+        match = year_column_pattern.match(col)
+        if ((match is not None) and (match.group(1) not in years)):
+            years.append(match.group(1))
+    return sorted(years)
+
+def coerce_vote_columns(df):
+    # Puts every vote column into a compact numeric form. float32 holds any constituency vote count exactly and keeps
+    # NaN for parties that didn't stand, but not national totals, so sums over the columns are done in float64.
+    df = df.copy()
+    for year in get_column_years(df):
+        for col in df.columns:
+            if (is_party_column(col, year) or any(col == year + suffix for suffix in numeric_count_suffixes)):
+                if (df[col].dtype != np.float32):
+                    df[col] = pd.to_numeric(df[col], errors="coerce").astype(np.float32)
+    return df
+
+def get_frame_version(df, name=None):
+    # Hash of the name, columns and every value (not the object's identity), so any change to the frame, in place or
+    # not, gives a new version and the caches keyed on it never hand back results for the old data
+    frame_hash = hashlib.sha1(repr((name, list(df.columns), [str(dtype) for dtype in df.dtypes])).encode())
+    frame_hash.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+    return frame_hash.hexdigest()[:16]
+
+def get_source_signature(csv_path):
+    stat = os.stat(csv_path)
+    return (os.path.abspath(csv_path), stat.st_size, stat.st_mtime_ns)
+
+class ElectionStore:
+    # Holds one election results table with numeric vote columns and a (year, party) -> column position index so
+    # that the schema only has to be worked out once. Accepted by the utilities summary functions in place of a DataFrame.
+
+    def __init__(self, df, name=None, coerce=True, column_index=None):
+        if (coerce):
+            df = coerce_vote_columns(df)
+        self.df = df
+        self.name = name
+        self.years = get_column_years(df)
+
+        if (column_index is None):
+            column_index = {}
+            for year in self.years:
+                for col_no in range(0, len(df.columns)):
+                    col = df.columns[col_no]
+                    if (is_party_column(col, year)):
+                        column_index[(year, col.replace(year + "_", ""))] = col_no
+        self.column_index = column_index
+
+    @property
+    def version(self):
+        # Worked out from the contents every time it's asked for, as self.df can be changed in place
+        return get_frame_version(self.df, self.name)
+
+    def __len__(self):
+        return self.df.shape[0]
+
+    def __getitem__(self, col):
+        return self.df[col]
+
+    @property
+    def columns(self):
+        return self.df.columns
+
+    @property
+    def index(self):
+        return self.df.index
+
+    @property
+    def shape(self):
+        return self.df.shape
+
+    def parties(self, year):
+        year = str(year)
+        return [party for (party_year, party) in self.column_index.keys() if party_year == year]
+
+    def column(self, year, party):
+        return self.df.columns[self.column_index[(str(year), party)]]
+
+    def votes(self, year, party):
+        return self.df.iloc[:, self.column_index[(str(year), party)]]
+
+    def vote_matrix(self, year, parties=None):
+        # (constituencies x parties) vote counts for a year in a single block
+        if (parties is None):
+            parties = self.parties(year)
+        col_positions = [self.column_index[(str(year), party)] for party in parties]
+        return self.df.iloc[:, col_positions].to_numpy(dtype=float), parties
+
+    def filter(self, mask):
+        # Returns a store over a subset of rows. The columns don't change so the index is shared rather than rebuilt.
+        return ElectionStore(self.df[mask], name=self.name, coerce=False, column_index=self.column_index)
+
+    def save_cache(self, cache_path, source_signature):
+        os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+        with open(cache_path, "wb") as cache_file:
+            pickle.dump({
+                "format_version": cache_format_version,
+                "source_signature": source_signature,
+                "name": self.name,
+                "column_index": self.column_index,
+                "df": self.df
+            }, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load_cache(cls, cache_path, source_signature):
+        # Returns None if there's no cache or it was built from a different version of the source csv
+        if (not os.path.exists(cache_path)):
+            return None
+        try:
+            with open(cache_path, "rb") as cache_file:
+                cached = pickle.load(cache_file)
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            return None
+        if ((cached.get("format_version") != cache_format_version) or (tuple(cached.get("source_signature", ())) != tuple(source_signature))):
+            return None
+        return cls(cached["df"], name=cached["name"], coerce=False, column_index=cached["column_index"])
+
+    @classmethod
+    def from_csv(cls, csv_path, cache_dir=None, use_cache=True):
+        name = os.path.splitext(os.path.basename(csv_path))[0]
+        if (cache_dir is None):
+            cache_dir = os.path.join(os.path.dirname(csv_path), ".cache")
+        cache_path = os.path.join(cache_dir, name + ".pkl")
+        source_signature = get_source_signature(csv_path)
+
+        if (use_cache):
+            store = cls.load_cache(cache_path, source_signature)
+            if (store is not None):
+                return store
+
+        store = cls(pd.read_csv(csv_path, low_memory=False), name=name)
+        if (use_cache):
+            store.save_cache(cache_path, source_signature)
+        return store
+
+def load_election_stores(directory="csvs/final_datasets", cache_dir=None, use_cache=True):
+    # Builds (or loads from cache) a store for every csv in the directory, keyed by file name e.g. "constits"
+    stores = {}
+    for csv_path in sorted(glob.glob(os.path.join(directory, "*.csv"))):
+        store = ElectionStore.from_csv(csv_path, cache_dir=cache_dir, use_cache=use_cache)
+        stores[store.name] = store
+    return stores
@@ -0,0 +1,179 @@
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+import election_core
+
+# Scoring trained voter choice models over large feature frames (e.g. a poststratification frame with a row per
+# constituency and demographic cell) and turning the predictions into constituency results.
+#
+# Works with anything that has sklearn's predict_proba, or a keras style predict that returns class probabilities
+# (softmax outputs, or a single sigmoid column for two classes). Models that only give labels are scored as a
+# probability of 1 for the predicted class.
+#
+# The frame is scored chunk_size rows at a time, across a process pool when there's more than one worker, with
+# the model sent to each worker once and a bounded number of chunks in flight. Everything after that (argmax,
+# label decoding and the weighted sums per constituency) is done on whole arrays.
+
+# Model used by the scoring jobs, set once per worker process by set_worker_model
+worker_state = {}
+
+def calculate_binary_targets(targets, zero_class="con"):
+    # 0 for zero_class and 1 for anything else, as floats
+    return np.where(np.asarray(targets, dtype=object) == zero_class, 0.0, 1.0)
+
+def encode_labels(targets, labels):
+    # Position of each target in labels (e.g. "lab" -> 1 for labels ["con", "lab", "ld"])
+    codes = pd.Categorical(np.asarray(targets, dtype=object), categories=list(labels)).codes.astype(np.int64)
+    if ((codes < 0).any()):
+        unknown = pd.unique(np.asarray(targets, dtype=object)[codes < 0])
+        raise Exception("labels " + ", ".join(str(label) for label in unknown) + " not recognised")
+    return codes
+
+def get_model_labels(model, labels=None):
+    if (labels is not None):
+        return np.asarray(labels, dtype=object)
+    if (hasattr(model, "classes_")):
+        return np.asarray(model.classes_, dtype=object)
+    return None
+
+def get_chunk_probabilities(model, features, labels=None):
+    # (rows x classes) class probabilities for one chunk of features
+    if (hasattr(model, "predict_proba")):
+        return np.asarray(model.predict_proba(features), dtype=float)
+
+    predictions = np.asarray(model.predict(features))
+    if ((predictions.ndim == 2) and (predictions.shape[1] > 1)):
+        return predictions.astype(float)
+    # A single sigmoid output is the probability of the second class. A flat array is only taken as one if it's two
+    # class and every value is a probability, otherwise it's labels (which may be floats, e.g. 0.0, 1.0 and 2.0).
+    is_sigmoid = (predictions.ndim == 2)
+    if ((predictions.ndim == 1) and np.issubdtype(predictions.dtype, np.floating) and (labels is not None) and (len(labels) == 2)):
+        is_sigmoid = bool(((predictions >= 0) & (predictions <= 1)).all())
+    if (is_sigmoid):
+        positive = predictions.reshape(-1).astype(float)
+        return np.column_stack([1 - positive, positive])
+    if (labels is None):
+        raise Exception("labels are needed for a model that only predicts labels")
+    probabilities = np.zeros((len(predictions), len(labels)))
+    probabilities[np.arange(len(predictions)), encode_labels(predictions, labels)] = 1
+    return probabilities
+
+def set_worker_model(model, labels):
+    worker_state["model"] = model
+    worker_state["labels"] = labels
+
+def score_chunk(features):
+    return get_chunk_probabilities(worker_state["model"], features, worker_state["labels"])
+
+def get_feature_chunks(features, chunk_size):
+    for start in range(0, features.shape[0], chunk_size):
+        if (isinstance(features, pd.DataFrame)):
+            yield features.iloc[start:start + chunk_size]
+        else:
+            yield features[start:start + chunk_size]
+
+def predict_probabilities(model, features, labels=None, chunk_size=100000, n_workers=None):
+    # Class probabilities for every row of features (a DataFrame or array), scored chunk_size rows at a time.
+    # With more than one worker the chunks are scored in a process pool, so the model has to be picklable.
+    labels = get_model_labels(model, labels)
+    no_chunks = int(np.ceil(features.shape[0]/chunk_size))
+    if (n_workers is None):
+        n_workers = os.cpu_count() or 1
+    n_workers = min(n_workers, no_chunks)
+
+    if (n_workers <= 1):
+        chunk_probabilities = [get_chunk_probabilities(model, chunk, labels) for chunk in get_feature_chunks(features, chunk_size)]
+    else:
+        chunk_probabilities = []
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=set_worker_model, initargs=(model, labels)) as executor:
+            in_flight = []
+            for chunk in get_feature_chunks(features, chunk_size):
+                in_flight.append(executor.submit(score_chunk, chunk))
+                if (len(in_flight) >= 2*n_workers):
+                    chunk_probabilities.append(in_flight.pop(0).result())
+            for future in in_flight:
+                chunk_probabilities.append(future.result())
+
+    if (len(chunk_probabilities) == 0):
+        return np.zeros((0, 0 if labels is None else len(labels)))
+    return np.concatenate(chunk_probabilities)
+
+def decode_predictions(probabilities, labels=None):
+    # Most likely class for every row, as codes and (if labels are given) as labels. Ties go to the earliest class,
+    # as the notebook's loop did.
+    codes = np.asarray(probabilities).argmax(axis=1)
+    if (labels is None):
+        return codes, None
+    return codes, np.asarray(labels, dtype=object)[codes]
+
+def score_model(model, features, labels=None, chunk_size=100000, n_workers=None):
+    # Returns a dict with the class probabilities, the predicted class codes and the predicted labels
+    labels = get_model_labels(model, labels)
+    probabilities = predict_probabilities(model, features, labels, chunk_size, n_workers)
+    codes, predictions = decode_predictions(probabilities, labels)
+    return {
+        "probabilities": probabilities,
+        "codes": codes,
+        "predictions": predictions,
+        "labels": labels
+    }
+
+def aggregate_constit_predictions(probabilities, cell_constits, cell_weights, parties, year="predicted", constit_ids=None, constit_electorates=None, method="probability"):
+    # Weighted constituency results from the scored rows of a poststratification frame. Returns a DataFrame with a
+    # row per constituency laid out like constits_df, so the usual functions work on it:
+    # - <year>_<party>: expected votes (shares of 1 unless constit_electorates is given)
+    # - <year>_valid_votes, <year>_<party>_share (%)
+    # - <year>_first_party and <year>_second_party from calculate_constit_results, i.e. what
+    #   calculate_constit_winners would give for the same votes
+    #
+    # Parameters:
+    # - probabilities (rows x parties array): from predict_probabilities, columns in the same order as parties
+    # - cell_constits (array): constituency (e.g. ons_id) of each row
+    # - cell_weights (array of floats): proportion of the constituency's electorate in each row
+    # - method (string): "probability" sums the probabilities, "label" gives each row's weight to its most likely party
+    probabilities = np.asarray(probabilities, dtype=float)
+    parties = list(parties)
+    if (probabilities.shape[1] != len(parties)):
+        raise Exception("probabilities have " + str(probabilities.shape[1]) + " columns for " + str(len(parties)) + " parties")
+    if (method == "label"):
+        codes = decode_predictions(probabilities)[0]
+        probabilities = np.zeros(probabilities.shape)
+        probabilities[np.arange(len(codes)), codes] = 1
+    elif (method != "probability"):
+        raise Exception("method " + method + " not recognised")
+
+    if (constit_ids is None):
+        constit_codes, constit_ids = pd.factorize(np.asarray(cell_constits), sort=True)
+    else:
+        constit_codes = pd.Index(constit_ids).get_indexer(np.asarray(cell_constits))
+        if ((constit_codes < 0).any()):
+            raise Exception("cell constituencies not in constit_ids")
+    no_constits = len(constit_ids)
+
+    cell_weights = np.asarray(cell_weights, dtype=float)
+    if (constit_electorates is not None):
+        cell_weights = cell_weights*np.asarray(constit_electorates, dtype=float)[constit_codes]
+    votes = np.column_stack([np.bincount(constit_codes, weights=probabilities[:, party_no]*cell_weights, minlength=no_constits) for party_no in range(0, len(parties))])
+    valid_votes = votes.sum(axis=1)
+
+    year = str(year)
+    results_df = pd.DataFrame(votes, index=pd.Index(constit_ids, name="ons_id"), columns=[year + "_" + party for party in parties])
+    results_df[year + "_valid_votes"] = valid_votes
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for party_no in range(0, len(parties)):
+            results_df[year + "_" + parties[party_no] + "_share"] = 100*votes[:, party_no]/valid_votes
+    # Constituencies with no weight don't have a winner
+    constit_results = election_core.calculate_constit_results(results_df.where(results_df[year + "_valid_votes"] > 0), [year], parties)
+    results_df[year + "_first_party"] = constit_results[year + "_first_party"]
+    results_df[year + "_second_party"] = constit_results[year + "_second_party"]
+    return results_df
+
+def score_poststratification_frame(model, features, cell_constits, cell_weights, parties, labels=None, year="predicted", constit_ids=None, constit_electorates=None, method="probability", chunk_size=100000, n_workers=None):
+    # score_model and aggregate_constit_predictions in one go. The probability columns are reordered to follow
+    # parties, so the model's classes can be in any order.
+    labels = get_model_labels(model, labels)
+    probabilities = predict_probabilities(model, features, labels, chunk_size, n_workers)
+    if (labels is not None):
+        probabilities = probabilities[:, encode_labels(parties, labels)]
+    return aggregate_constit_predictions(probabilities, cell_constits, cell_weights, parties, year, constit_ids, constit_electorates, method)
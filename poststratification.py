@@ -0,0 +1,165 @@
+import pandas as pd
+import numpy as np
+
+# MRP poststratification over every posterior draw.
+#
+# The trace can be anything indexed by variable name that gives arrays with the draws as the first axis, e.g. a
+# pymc3 MultiTrace or a plain dict of NumPy arrays:
+# - intercept:         (draws x parties)
+# - cell effects:      (draws x levels x parties), indexed per poststratification cell (sex, age, education...)
+# - constit effects:   (draws x levels x parties), indexed per constituency (incumbent party, constituency...)
+# - constit slopes:    (draws x parties) with a constituency covariate of shape (constituencies,), or
+#                      (draws x variables x parties) with covariates of shape (constituencies x variables)
+
+def softmax(predictions):
+    predictions = predictions - predictions.max(axis=-1, keepdims=True)
+    exp_predictions = np.exp(predictions)
+    return exp_predictions/exp_predictions.sum(axis=-1, keepdims=True)
+
+def get_no_draws_and_parties(trace, names):
+    shape = np.shape(trace[names[0]])
+    return shape[0], shape[-1]
+
+def get_no_constits(cell_constits, constit_effects, constit_slopes, constit_electorates):
+    # Constituencies after the last one with cells still need a row, so go by the per constituency arrays if there
+    # are any
+    if (constit_electorates is not None):
+        return len(constit_electorates)
+    for levels in list(constit_effects.values()) + list(constit_slopes.values()):
+        return len(levels)
+    return int(cell_constits.max()) + 1
+
+def calculate_constit_terms(trace, draws, no_constits, no_parties, constit_effects, constit_slopes):
+    # The constituency level part of the linear predictor for a slice of draws, (draws x constituencies x parties)
+    constit_terms = np.zeros((draws.stop - draws.start, no_constits, no_parties))
+    for name, levels in constit_effects.items():
+        constit_terms += np.asarray(trace[name])[draws][:, np.asarray(levels, dtype=np.int64), :]
+    for name, covariates in constit_slopes.items():
+        coeffs = np.asarray(trace[name])[draws]
+        covariates = np.asarray(covariates, dtype=float)
+        if (covariates.ndim == 1):
+            constit_terms += covariates[np.newaxis, :, np.newaxis]*coeffs[:, np.newaxis, :]
+        else:
+            constit_terms += np.einsum("cv,dvp->dcp", covariates, coeffs)
+    return constit_terms
+
+def poststratify(
+    trace,
+    cell_constits,
+    cell_weights,
+    cell_effects,
+    intercept = None,
+    constit_effects = {},
+    constit_slopes = {},
+    constit_electorates = None,
+    draw_chunk_size = 100,
+    max_chunk_elements = 2000000):
+
+    # Returns the expected votes for every (draw, constituency, party) along with vote shares and the winning party
+    # index for every draw and constituency (-1 if the constituency has no cells).
+    #
+    # Parameters:
+    # - trace: posterior draws (see above)
+    # - cell_constits (array of ints): constituency number (0..constituencies - 1) for each poststratification cell
+    # - cell_weights (array of floats): proportion of the constituency's electorate in each cell
+    # - cell_effects (dict): trace variable name -> array of level numbers for each cell
+    # - intercept (string): trace variable name of the party intercept
+    # - constit_effects (dict): trace variable name -> array of level numbers for each constituency
+    # - constit_slopes (dict): trace variable name -> constituency covariate values
+    # - constit_electorates (array of floats): electorate of each constituency, defaults to 1 so the votes are shares
+    # - draw_chunk_size, max_chunk_elements: bound the size of the (draws x cells x parties) block worked on at once.
+    #   A few float64 arrays of that size are alive at once, so the default of 2,000,000 peaks at around 70MB.
+
+    variable_names = ([intercept] if intercept is not None else []) + list(cell_effects.keys()) + list(constit_effects.keys()) + list(constit_slopes.keys())
+    no_draws, no_parties = get_no_draws_and_parties(trace, variable_names)
+
+    cell_constits = np.asarray(cell_constits, dtype=np.int64)
+    cell_weights = np.asarray(cell_weights, dtype=float)
+    no_constits = get_no_constits(cell_constits, constit_effects, constit_slopes, constit_electorates)
+    if (constit_electorates is None):
+        constit_electorates = np.ones(no_constits)
+    constit_electorates = np.asarray(constit_electorates, dtype=float)
+
+    # Sort the cells by constituency so each constituency's cells can be summed with reduceat
+    cell_order = np.argsort(cell_constits, kind="stable")
+    cell_constits = cell_constits[cell_order]
+    cell_voters = cell_weights[cell_order]*constit_electorates[cell_constits]
+    cell_levels = {name: np.asarray(levels, dtype=np.int64)[cell_order] for name, levels in cell_effects.items()}
+
+    # Split the cells into blocks of whole constituencies that keep the working arrays under max_chunk_elements
+    constit_starts = np.flatnonzero(np.r_[True, cell_constits[1:] != cell_constits[:-1]])
+    constit_ends = np.r_[constit_starts[1:], len(cell_constits)]
+    # Blocks hold at least one whole constituency, so use fewer draws at a time if the biggest wouldn't fit
+    draw_chunk_size = max(1, min(draw_chunk_size, int(max_chunk_elements/(np.max(constit_ends - constit_starts)*no_parties))))
+    max_cells = max(1, int(max_chunk_elements/(draw_chunk_size*no_parties)))
+    cell_blocks = []
+    block_start = 0
+    for constit_no in range(0, len(constit_starts)):
+        if ((constit_ends[constit_no] - constit_starts[block_start] > max_cells) and (constit_no > block_start)):
+            cell_blocks.append((block_start, constit_no))
+            block_start = constit_no
+    cell_blocks.append((block_start, len(constit_starts)))
+
+    votes = np.zeros((no_draws, no_constits, no_parties))
+
+    for draw_start in range(0, no_draws, draw_chunk_size):
+        draws = slice(draw_start, min(draw_start + draw_chunk_size, no_draws))
+        constit_terms = calculate_constit_terms(trace, draws, no_constits, no_parties, constit_effects, constit_slopes)
+        intercept_terms = np.asarray(trace[intercept])[draws][:, np.newaxis, :] if intercept is not None else 0
+
+        cell_effect_draws = {name: np.asarray(trace[name])[draws] for name in cell_levels.keys()}
+
+        for first_constit, last_constit in cell_blocks:
+            cells = slice(constit_starts[first_constit], constit_ends[last_constit - 1])
+            block_constits = cell_constits[cells]
+
+            predictions = constit_terms[:, block_constits, :] + intercept_terms
+            for name, levels in cell_levels.items():
+                predictions = predictions + cell_effect_draws[name][:, levels[cells], :]
+
+            cell_votes = softmax(predictions)*cell_voters[cells][np.newaxis, :, np.newaxis]
+            block_starts = constit_starts[first_constit:last_constit] - constit_starts[first_constit]
+            votes[draws, cell_constits[constit_starts[first_constit:last_constit]], :] = np.add.reduceat(cell_votes, block_starts, axis=1)
+
+    totals = votes.sum(axis=-1, keepdims=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        shares = votes/totals
+
+    # Constituencies with no cells don't have a winner
+    winners = np.where(totals[..., 0] > 0, votes.argmax(axis=-1), -1)
+
+    return {
+        "votes": votes,
+        "shares": shares,
+        "winners": winners
+    }
+
+def summarise_poststratification(results, parties, constit_ids=None, interval=0.9):
+    # Turns the per draw results into two DataFrames:
+    # - one row per constituency and party with the mean share, a credible interval and the probability of winning
+    # - one row per draw with the number of seats won by each party
+    parties = list(parties)
+    shares = results["shares"]
+    winners = results["winners"]
+    no_draws, no_constits, no_parties = shares.shape
+    if (constit_ids is None):
+        constit_ids = np.arange(no_constits)
+
+    alpha = (1 - interval)/2
+    win_counts = np.zeros((no_constits, no_parties))
+    for party_no in range(0, no_parties):
+        win_counts[:, party_no] = (winners == party_no).sum(axis=0)
+
+    constit_summary_df = pd.DataFrame({
+        "constituency_id": np.repeat(np.asarray(constit_ids), no_parties),
+        "party": np.tile(parties, no_constits),
+        "mean_share": np.nanmean(shares, axis=0).ravel(),
+        "lower_share": np.nanquantile(shares, alpha, axis=0).ravel(),
+        "upper_share": np.nanquantile(shares, 1 - alpha, axis=0).ravel(),
+        "win_probability": (win_counts/no_draws).ravel()
+    })
+
+    seats_df = pd.DataFrame(np.stack([(winners == party_no).sum(axis=1) for party_no in range(0, no_parties)], axis=1), columns=parties)
+    seats_df.index.name = "draw"
+
+    return constit_summary_df, seats_df
@@ -0,0 +1,250 @@
+import os
+import sys
+import csv
+import json
+import time
+import atexit
+import inspect
+import importlib
+import tracemalloc
+from functools import wraps
+
+# Opt-in profiling of the public functions in election_core and utilities, visualisations if it's already been
+# imported (profiling doesn't load the plotting libraries itself), and any other modules asked for.
+#
+# Turned on either for a block of code:
+#   with profiling.profile() as profiler:
+#       ...
+#   profiler.print_summary()
+#   profiler.save("profile.json")     # Chrome trace events, open in chrome://tracing or ui.perfetto.dev
+#   profiler.save("profile.csv")      # one row per call path
+#   profiler.save_folded("profile.folded")  # folded stacks for flamegraph.pl or speedscope
+#
+# or for a whole run by setting ELECTIONS_PROFILE=1 before utilities/visualisations are imported, in which case the
+# summary is printed and the trace saved to ELECTIONS_PROFILE_OUTPUT (default elections_profile.json) at exit.
+#
+# The functions are only wrapped while profiling is on, so when it's off nothing is added to any call.
+#
+# For each call path (e.g. utilities.create_vote_share_change_maps_and_columns;visualisations.create_continous_constit_map)
+# the wall time, time outside profiled children, number of calls, rows in the first DataFrame argument and peak
+# traced memory above the memory at the start of the call are recorded.
+
+profiled_module_names = ["election_core", "utilities", "visualisations"]
+headless_module_names = ["election_core", "utilities"]
+profile_environment_variable = "ELECTIONS_PROFILE"
+profile_output_environment_variable = "ELECTIONS_PROFILE_OUTPUT"
+
+def get_public_functions(module):
+    # Functions defined in the module, plus ones it re-exports from another profiled module (utilities re-exports
+    # election_core) so calls through either name are caught. Functions that are already wrapped are left alone.
+    functions = {}
+    for name, obj in vars(module).items():
+        if (name.startswith("_") or (not inspect.isfunction(obj)) or getattr(obj, "profiled", False)):
+            continue
+        if ((obj.__module__ == module.__name__) or (obj.__module__ in profiled_module_names)):
+            functions[name] = obj
+    return functions
+
+def get_default_module_names():
+    return headless_module_names + [module_name for module_name in profiled_module_names if ((module_name not in headless_module_names) and (module_name in sys.modules))]
+
+def count_rows(args):
+    # Rows in the first DataFrame or ElectionStore argument. Series aren't counted as apply passes each row as one.
+    for arg in args:
+        if (hasattr(arg, "columns") and hasattr(arg, "shape") and (not isinstance(arg, type))):
+            return int(arg.shape[0])
+    return 0
+
+class Profiler:
+    def __init__(self, module_names=None, memory=True, max_events=100000):
+        # Parameters:
+        # - module_names (array of strings): modules whose public functions are profiled, defaults to
+        #   get_default_module_names()
+        # - memory (bool): track peak memory with tracemalloc, which slows everything down a fair bit
+        # - max_events (int): individual calls kept for the JSON trace, the summary always counts every call
+        self.module_names = list(module_names) if module_names is not None else get_default_module_names()
+        self.memory = memory
+        self.max_events = max_events
+        self.stack = []
+        self.paths = {}
+        self.events = []
+        self.originals = {}
+        self.started_tracemalloc = False
+        self.start_time = None
+
+    def wrap(self, qualified_name, function):
+        profiler = self
+
+        @wraps(function)
+        def profiled_function(*args, **kwargs):
+            profiler.enter(qualified_name, args)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profiler.exit()
+        profiled_function.profiled = True
+        return profiled_function
+
+    def enter(self, qualified_name, args):
+        path = (self.stack[-1]["path"] + ";" if len(self.stack) > 0 else "") + qualified_name
+        frame = {"path": path, "name": qualified_name, "rows": count_rows(args), "child_time": 0.0, "start_memory": 0, "peak": 0}
+        if (self.memory):
+            current, peak = tracemalloc.get_traced_memory()
+            # Resetting the peak would lose the parent's, so hand it up first
+            if (len(self.stack) > 0):
+                self.stack[-1]["peak"] = max(self.stack[-1]["peak"], peak)
+            tracemalloc.reset_peak()
+            frame["start_memory"] = current
+        self.stack.append(frame)
+        frame["start"] = time.perf_counter()
+
+    def exit(self):
+        end = time.perf_counter()
+        frame = self.stack.pop()
+        elapsed = end - frame["start"]
+        peak = 0
+        if (self.memory):
+            peak = max(frame["peak"], tracemalloc.get_traced_memory()[1])
+            if (len(self.stack) > 0):
+                self.stack[-1]["peak"] = max(self.stack[-1]["peak"], peak)
+            peak = peak - frame["start_memory"]
+        if (len(self.stack) > 0):
+            self.stack[-1]["child_time"] += elapsed
+
+        if (frame["path"] not in self.paths):
+            self.paths[frame["path"]] = {"calls": 0, "total_seconds": 0.0, "self_seconds": 0.0, "rows": 0, "peak_memory_bytes": 0}
+        path_stats = self.paths[frame["path"]]
+        path_stats["calls"] += 1
+        path_stats["total_seconds"] += elapsed
+        path_stats["self_seconds"] += elapsed - frame["child_time"]
+        path_stats["rows"] += frame["rows"]
+        path_stats["peak_memory_bytes"] = max(path_stats["peak_memory_bytes"], peak)
+
+        if (len(self.events) < self.max_events):
+            self.events.append({
+                "name": frame["name"],
+                "ph": "X",
+                "ts": (frame["start"] - self.start_time)*1e6,
+                "dur": elapsed*1e6,
+                "pid": os.getpid(),
+                "tid": 0,
+                "args": {"rows": frame["rows"], "peak_memory_bytes": peak}
+            })
+
+    def start(self):
+        self.start_time = time.perf_counter()
+        if (self.memory and (not tracemalloc.is_tracing())):
+            tracemalloc.start()
+            self.started_tracemalloc = True
+        for module_name in self.module_names:
+            module = sys.modules.get(module_name) or importlib.import_module(module_name)
+            self.instrument(module)
+        return self
+
+    def instrument(self, module):
+        for name, function in get_public_functions(module).items():
+            if ((module.__name__, name) not in self.originals):
+                self.originals[(module.__name__, name)] = function
+                setattr(module, name, self.wrap(function.__module__ + "." + name, function))
+
+    def stop(self):
+        for (module_name, name), function in self.originals.items():
+            setattr(sys.modules[module_name], name, function)
+        self.originals = {}
+        if (self.started_tracemalloc):
+            tracemalloc.stop()
+            self.started_tracemalloc = False
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+    def summary(self):
+        # One row per call path, slowest first
+        rows = []
+        for path, path_stats in self.paths.items():
+            row = {"path": path, "function": path.split(";")[-1], "depth": path.count(";")}
+            row.update(path_stats)
+            rows.append(row)
+        return sorted(rows, key=lambda row: row["total_seconds"], reverse=True)
+
+    def function_summary(self):
+        # Totals per function over every path it was called from (time in recursive calls is counted once per level)
+        functions = {}
+        for row in self.summary():
+            if (row["function"] not in functions):
+                functions[row["function"]] = {"function": row["function"], "calls": 0, "total_seconds": 0.0, "self_seconds": 0.0, "rows": 0, "peak_memory_bytes": 0}
+            function_stats = functions[row["function"]]
+            for stat_name in ["calls", "total_seconds", "self_seconds", "rows"]:
+                function_stats[stat_name] += row[stat_name]
+            function_stats["peak_memory_bytes"] = max(function_stats["peak_memory_bytes"], row["peak_memory_bytes"])
+        return sorted(functions.values(), key=lambda row: row["self_seconds"], reverse=True)
+
+    def print_summary(self, max_depth=None):
+        # Flame style tree: each call path under its parent, children in order of time taken
+        rows = self.summary()
+        children = {}
+        for row in rows:
+            parent = row["path"].rsplit(";", 1)[0] if row["depth"] > 0 else None
+            children.setdefault(parent, []).append(row)
+        total_seconds = sum(row["total_seconds"] for row in children.get(None, []))
+
+        print('{:70s}'.format("function") + '{:>8s}'.format("calls") + '{:>11s}'.format("total s") + '{:>11s}'.format("self s") + '{:>8s}'.format("%") + '{:>11s}'.format("rows") + '{:>11s}'.format("peak MB"))
+        def print_rows(parent, depth):
+            for row in children.get(parent, []):
+                if ((max_depth is not None) and (depth > max_depth)):
+                    return
+                share = 100*row["total_seconds"]/total_seconds if total_seconds > 0 else 0
+                print('{:70s}'.format(("  "*depth + row["function"])[:70]) + '{:8d}'.format(row["calls"]) + '{:11.4f}'.format(row["total_seconds"])
+                      + '{:11.4f}'.format(row["self_seconds"]) + '{:8.1f}'.format(share) + '{:11d}'.format(row["rows"]) + '{:11.1f}'.format(row["peak_memory_bytes"]/1e6))
+                print_rows(row["path"], depth + 1)
+        print_rows(None, 0)
+
+    def save(self, path):
+        # .csv saves the per path summary, anything else a JSON trace with the summary included
+        if (path.endswith(".csv")):
+            rows = self.summary()
+            with open(path, "w", newline="") as csv_file:
+                writer = csv.DictWriter(csv_file, fieldnames=["path", "function", "depth", "calls", "total_seconds", "self_seconds", "rows", "peak_memory_bytes"])
+                writer.writeheader()
+                writer.writerows(rows)
+        else:
+            with open(path, "w") as json_file:
+                json.dump({"traceEvents": self.events, "displayTimeUnit": "ms", "summary": self.summary()}, json_file, indent=1)
+        return path
+
+    def save_folded(self, path):
+        # Folded stacks (path followed by self time in microseconds), the input format for flamegraph.pl and speedscope
+        with open(path, "w") as folded_file:
+            for row in self.summary():
+                folded_file.write(row["path"] + " " + str(int(round(row["self_seconds"]*1e6))) + "\n")
+        return path
+
+def profile(module_names=None, memory=True, max_events=100000):
+    return Profiler(module_names, memory, max_events)
+
+# Profiler started by the environment variable, shared by every module that calls profile_from_environment
+environment_profiler = {}
+
+def profile_from_environment(module_name):
+    # Called at the end of each profiled module so its functions are wrapped as it's imported when ELECTIONS_PROFILE is
+    # set. ELECTIONS_PROFILE=nomemory skips the memory tracking.
+    setting = os.environ.get(profile_environment_variable, "")
+    if (setting in ["", "0"]):
+        return
+    if ("profiler" not in environment_profiler):
+        profiler = Profiler([], memory=(setting != "nomemory"))
+        profiler.start()
+        environment_profiler["profiler"] = profiler
+        atexit.register(finish_environment_profile)
+    environment_profiler["profiler"].instrument(sys.modules[module_name])
+
+def finish_environment_profile():
+    profiler = environment_profiler.pop("profiler")
+    profiler.stop()
+    output_path = os.environ.get(profile_output_environment_variable, "elections_profile.json")
+    profiler.print_summary()
+    print("Profile saved to " + profiler.save(output_path))
@@ -0,0 +1,312 @@
+import os
+import json
+import asyncio
+import argparse
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlsplit, parse_qsl, unquote
+import numpy as np
+import pandas as pd
+import election_core
+from election_store import ElectionStore, get_column_years
+from constit_linker import normalise_constituency_name
+
+# A long lived local HTTP service answering questions about constituency results from memory, so they don't need a
+# notebook re-run each time. The results are loaded and indexed once at start up, answers are kept in an LRU cache
+# and hex maps are drawn in a process pool so a render never holds up the other requests.
+#
+# Usage (from the repository root):
+#   python query_service.py --port 8050
+#
+# Queries (all GET, answers are JSON apart from /map):
+#   /constituency/<ons id or name>               every year's result, e.g. /constituency/Edinburgh%20North%20and%20Leith
+#   /constituency/<ons id or name>?year=2010     one year, including who came second
+#   /filter?year=2015&winner=ld&previous_winner=con&region=south%20west
+#                                                seats matching every filter given, previous_year defaults to the
+#                                                election before year
+#   /aggregate?year=2015&group_by=region&previous_winner=con
+#                                                seats won by each party in each group of the filtered seats
+#   /map?column=2015_first_party&kind=discrete   a PNG hex map of any column (kind is discrete or continuous)
+#   /health
+
+class LRUCache:
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        if (key not in self.items):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.items.move_to_end(key)
+        return self.items[key]
+
+    def put(self, key, value):
+        self.items[key] = value
+        self.items.move_to_end(key)
+        while (len(self.items) > self.max_size):
+            self.items.popitem(last=False)
+
+class QueryError(Exception):
+    def __init__(self, message, status=400):
+        Exception.__init__(self, message)
+        self.status = status
+
+def get_float_param(params, name):
+    try:
+        return float(params[name])
+    except ValueError:
+        raise QueryError(name + " " + params[name] + " not recognised")
+
+def to_records(df):
+    # JSON friendly records, with NaN as null and NumPy scalars as plain Python values
+    return json.loads(df.to_json(orient="records"))
+
+class ConstituencyIndex:
+    def __init__(self, df, name_column="constituency_name", region_column="region_name"):
+        frame = election_core.get_election_frame(df).reset_index(drop=True)
+        self.years = [year for year in get_column_years(frame) if (year + "_valid_votes") in frame.columns]
+        self.name_column = name_column
+        self.region_column = region_column
+
+        # Winners, runners up, majorities and margins for every year, worked out once. Columns already in the data
+        # (e.g. winners that include the speaker) are kept as they are.
+        results_df = election_core.calculate_constit_results(frame, self.years)
+        for col in results_df.columns:
+            if (col not in frame.columns):
+                frame[col] = results_df[col]
+        self.frame = frame
+
+        self.by_ons_id = {ons_id: row_no for row_no, ons_id in enumerate(frame["ons_id"])}
+        self.by_name = {}
+        if (name_column in frame.columns):
+            for row_no, constit_name in enumerate(frame[name_column]):
+                self.by_name.setdefault(normalise_constituency_name(constit_name), []).append(row_no)
+        self.by_region = {}
+        if (region_column in frame.columns):
+            for region_name, row_nos in frame.groupby(region_column).indices.items():
+                self.by_region[region_name] = row_nos
+        self.by_winner = {}
+        for year in self.years:
+            for party, row_nos in frame.groupby(year + "_first_party").indices.items():
+                self.by_winner[(year, party)] = row_nos
+
+    def get_year(self, year):
+        if (year not in self.years):
+            raise QueryError("year " + str(year) + " not recognised")
+        return year
+
+    def get_previous_year(self, year):
+        year_no = self.years.index(self.get_year(year))
+        if (year_no == 0):
+            raise QueryError("there's no election before " + year + " to compare with")
+        return self.years[year_no - 1]
+
+    def find_constituency(self, key):
+        if (key in self.by_ons_id):
+            return [self.by_ons_id[key]]
+        row_nos = self.by_name.get(normalise_constituency_name(key))
+        if (row_nos is None):
+            raise QueryError("constituency " + key + " not recognised", 404)
+        return row_nos
+
+    def get_result_columns(self, year):
+        columns = [year + "_first_party", year + "_second_party", year + "_majority", year + "_margin", year + "_valid_votes"]
+        columns += [year + "_" + party for party in election_core.get_election_parties(self.frame, year)]
+        return [col for col in dict.fromkeys(columns) if col in self.frame.columns]
+
+    def get_id_columns(self):
+        return [col for col in ["ons_id", self.name_column, self.region_column] if col in self.frame.columns]
+
+    def constituency(self, key, year=None):
+        row_nos = self.find_constituency(key)
+        years = self.years if year is None else [self.get_year(year)]
+        columns = self.get_id_columns()
+        for result_year in years:
+            columns += self.get_result_columns(result_year)
+        return to_records(self.frame.iloc[row_nos][columns])
+
+    def filter_rows(self, year=None, winner=None, previous_winner=None, previous_year=None, region=None):
+        # Row numbers matching every filter given, by intersecting the indexes
+        row_nos = np.arange(self.frame.shape[0])
+        if (year is not None):
+            self.get_year(year)
+        if (region is not None):
+            if (region not in self.by_region):
+                raise QueryError("region " + region + " not recognised")
+            row_nos = np.intersect1d(row_nos, self.by_region[region])
+        if (((winner is not None) or (previous_winner is not None)) and (year is None)):
+            raise QueryError("winner filters need a year")
+        if (winner is not None):
+            row_nos = np.intersect1d(row_nos, self.by_winner.get((self.get_year(year), winner), []))
+        if (previous_winner is not None):
+            if (previous_year is None):
+                previous_year = self.get_previous_year(year)
+            row_nos = np.intersect1d(row_nos, self.by_winner.get((self.get_year(previous_year), previous_winner), []))
+        return row_nos.astype(np.int64)
+
+    def filter(self, year=None, winner=None, previous_winner=None, previous_year=None, region=None):
+        row_nos = self.filter_rows(year, winner, previous_winner, previous_year, region)
+        columns = self.get_id_columns()
+        if (year is not None):
+            if ((previous_winner is not None) and (previous_year is None)):
+                previous_year = self.get_previous_year(year)
+            if (previous_year is not None):
+                columns += [previous_year + "_first_party"]
+            columns += self.get_result_columns(year)
+        return {"count": int(len(row_nos)), "constituencies": to_records(self.frame.iloc[row_nos][columns])}
+
+    def aggregate(self, year, group_by="region", winner=None, previous_winner=None, previous_year=None, region=None):
+        year = self.get_year(year)
+        group_columns = {"region": self.region_column, "country": "country_name", "none": None}
+        if (group_by not in group_columns):
+            raise QueryError("group_by " + group_by + " not recognised")
+        row_nos = self.filter_rows(year, winner, previous_winner, previous_year, region)
+        subset = self.frame.iloc[row_nos]
+        if (group_columns[group_by] is None):
+            seats = subset[year + "_first_party"].value_counts()
+            return {"count": int(len(row_nos)), "seats": {party: int(count) for party, count in seats.items()}}
+        seats = subset.groupby([group_columns[group_by], year + "_first_party"]).size()
+        groups = {}
+        for (group, party), count in seats.items():
+            groups.setdefault(group, {})[party] = int(count)
+        return {"count": int(len(row_nos)), "seats": groups}
+
+def render_map(panel):
+    import batch_render
+    return batch_render.render_panel_bytes(panel)
+
+def start_map_worker(constits_df, constit_hex_coords_df, figsize, dpi):
+    import batch_render
+    batch_render.start_render_worker(constits_df, constit_hex_coords_df, figsize, dpi)
+
+class QueryService:
+    def __init__(self, constits_df, constit_hex_coords_path="csvs/constit_hex_coords.csv", cache_size=256, n_workers=None, figsize=(10, 12), dpi=80):
+        self.index = ConstituencyIndex(constits_df)
+        self.cache = LRUCache(cache_size)
+        self.constit_hex_coords_path = constit_hex_coords_path
+        self.n_workers = n_workers if n_workers is not None else min(4, os.cpu_count() or 1)
+        self.figsize = figsize
+        self.dpi = dpi
+        self.render_pool = None
+
+    def get_render_pool(self):
+        # Only started on the first map request, so a service only answering data queries never loads matplotlib.
+        # The workers are spawned rather than forked, as forked workers would hold on to copies of the open client
+        # sockets and keep those connections from closing.
+        if (self.render_pool is None):
+            constit_hex_coords_df = pd.read_csv(self.constit_hex_coords_path)
+            self.render_pool = ProcessPoolExecutor(max_workers=self.n_workers, mp_context=multiprocessing.get_context("spawn"), initializer=start_map_worker, initargs=(self.index.frame, constit_hex_coords_df, self.figsize, self.dpi))
+        return self.render_pool
+
+    def close(self):
+        if (self.render_pool is not None):
+            self.render_pool.shutdown()
+            self.render_pool = None
+
+    async def answer(self, path, params):
+        # Returns (status, content type, body bytes)
+        cache_key = (path, tuple(sorted(params.items())))
+        cached = self.cache.get(cache_key)
+        if (cached is not None):
+            return cached
+
+        parts = [unquote(part) for part in path.split("/") if part != ""]
+        if ((len(parts) == 2) and (parts[0] == "constituency")):
+            response = self.json_response(self.index.constituency(parts[1], params.get("year")))
+        elif (parts == ["filter"]):
+            response = self.json_response(self.index.filter(params.get("year"), params.get("winner"), params.get("previous_winner"), params.get("previous_year"), params.get("region")))
+        elif (parts == ["aggregate"]):
+            if ("year" not in params):
+                raise QueryError("aggregate needs a year")
+            response = self.json_response(self.index.aggregate(params["year"], params.get("group_by", "region"), params.get("winner"), params.get("previous_winner"), params.get("previous_year"), params.get("region")))
+        elif (parts == ["map"]):
+            response = await self.render(params)
+        elif (parts == ["health"]):
+            # Not cached, the cache counts change
+            return self.json_response({"status": "ok", "constituencies": self.index.frame.shape[0], "years": self.index.years, "cache_hits": self.cache.hits, "cache_misses": self.cache.misses})
+        else:
+            raise QueryError("path " + path + " not recognised", 404)
+
+        self.cache.put(cache_key, response)
+        return response
+
+    async def render(self, params):
+        if (params.get("column") not in self.index.frame.columns):
+            raise QueryError("column " + str(params.get("column")) + " not recognised")
+        panel = {"column": params["column"], "kind": params.get("kind", "continuous"), "title": params.get("title")}
+        if (panel["kind"] not in ["discrete", "continuous"]):
+            raise QueryError("kind " + panel["kind"] + " not recognised")
+        if (("min" in params) and ("max" in params)):
+            panel["limits"] = (get_float_param(params, "min"), get_float_param(params, "max"))
+        loop = asyncio.get_running_loop()
+        image = await loop.run_in_executor(self.get_render_pool(), render_map, panel)
+        return 200, "image/png", image
+
+    def json_response(self, content, status=200):
+        return status, "application/json", json.dumps(content).encode()
+
+    async def handle_connection(self, reader, writer):
+        try:
+            request_line = (await reader.readline()).decode("latin-1").strip()
+            # Skip the headers, there's no request body for GETs
+            while True:
+                header_line = await reader.readline()
+                if (header_line in [b"\r\n", b"\n", b""]):
+                    break
+            request_parts = request_line.split(" ")
+            if (len(request_parts) < 2):
+                status, content_type, body = self.json_response({"error": "bad request"}, 400)
+            elif (request_parts[0] != "GET"):
+                status, content_type, body = self.json_response({"error": "only GET requests are supported"}, 405)
+            else:
+                url = urlsplit(request_parts[1])
+                try:
+                    status, content_type, body = await self.answer(url.path, dict(parse_qsl(url.query)))
+                except QueryError as error:
+                    status, content_type, body = self.json_response({"error": str(error)}, error.status)
+                except Exception as error:
+                    status, content_type, body = self.json_response({"error": repr(error)}, 500)
+
+            reasons = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+            header = "HTTP/1.1 " + str(status) + " " + reasons.get(status, "") + "\r\n"
+            header += "Content-Type: " + content_type + "\r\n"
+            header += "Content-Length: " + str(len(body)) + "\r\n"
+            header += "Connection: close\r\n\r\n"
+            writer.write(header.encode("latin-1") + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8050):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        async with server:
+            await server.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve constituency result queries over HTTP")
+    parser.add_argument("--constits", default="csvs/final_datasets/constits.csv")
+    parser.add_argument("--hex-coords", default="csvs/constit_hex_coords.csv")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8050)
+    parser.add_argument("--cache-size", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    service = QueryService(ElectionStore.from_csv(args.constits), args.hex_coords, args.cache_size, args.workers)
+    print("Serving " + str(service.index.frame.shape[0]) + " constituencies on http://" + args.host + ":" + str(args.port))
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+import os
+import pandas as pd
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+import election_core
+
+# Monte Carlo seat projections from a base election in constits_df and hypothetical national/regional polls.
+# Simulations are run in batches with every batch folded into running totals (seat count histograms, win counts and
+# tipping point counts), so memory depends on the batch size and not on how many simulations are run.
+
+def get_base_shares(df, base_year, parties):
+    # (constituencies x parties) % vote shares in the base year, NaN where a party didn't stand
+    votes, parties = election_core.get_vote_matrix(df, [base_year], parties)
+    votes = votes[:, 0, :]
+    valid_votes = pd.to_numeric(election_core.get_election_frame(df)[str(base_year) + "_valid_votes"], errors="coerce").values
+    return 100*votes/valid_votes[:, np.newaxis], votes, valid_votes
+
+def calculate_projected_shares(base_shares, base_national_shares, national_polls, constit_regions=None, base_regional_shares=None, regional_polls=None, swing="uniform"):
+    # Applies the swing from the base result to the polls. Where there's a regional poll it's used for that region's
+    # constituencies instead of the national one.
+    poll_shares = np.tile(national_polls, (base_shares.shape[0], 1))
+    base_poll_shares = np.tile(base_national_shares, (base_shares.shape[0], 1))
+    if (regional_polls is not None):
+        for region_no in range(0, regional_polls.shape[0]):
+            in_region = constit_regions == region_no
+            has_poll = ~np.isnan(regional_polls[region_no])
+            poll_shares[np.ix_(in_region, has_poll)] = regional_polls[region_no, has_poll]
+            base_poll_shares[np.ix_(in_region, has_poll)] = base_regional_shares[region_no, has_poll]
+
+    if (swing == "uniform"):
+        return base_shares + (poll_shares - base_poll_shares)
+    elif (swing == "proportional"):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return base_shares*np.where(base_poll_shares > 0, poll_shares/base_poll_shares, 1)
+    else:
+        raise Exception("swing not recognised")
+
+def simulate_batch(projected_shares, standing, constit_regions, no_regions, region_noise_sd, constit_noise_sd, majority_seats, no_simulations, rng):
+    no_constits, no_parties = projected_shares.shape
+
+    shares = np.broadcast_to(projected_shares, (no_simulations, no_constits, no_parties)).copy()
+    if (region_noise_sd > 0):
+        region_noise = rng.normal(0, region_noise_sd, size=(no_simulations, no_regions, no_parties))
+        shares += region_noise[:, constit_regions, :]
+    if (constit_noise_sd > 0):
+        shares += rng.normal(0, constit_noise_sd, size=(no_simulations, no_constits, no_parties))
+    # Parties that didn't stand in the base year can't win and vote shares can't go negative
+    shares = np.where(standing, np.maximum(shares, 0), -np.inf)
+
+    # Seats where none of the parties stood (e.g. the Speaker's) have no winner (-1), so they count towards nobody's
+    # seats and can't be anybody's tipping point
+    contested = standing.any(axis=-1)
+    winners = np.where(contested, shares.argmax(axis=-1), -1)
+
+    seat_counts = np.zeros((no_simulations, no_parties), dtype=np.int64)
+    for party_no in range(0, no_parties):
+        seat_counts[:, party_no] = (winners == party_no).sum(axis=1)
+
+    win_counts = np.zeros((no_constits, no_parties), dtype=np.int64)
+    for party_no in range(0, no_parties):
+        win_counts[:, party_no] = (winners == party_no).sum(axis=0)
+
+    # Tipping point: rank each party's seats by its margin over the best other party, the seat at position
+    # majority_seats is the one that would give (or deny) it a majority
+    sorted_shares = np.sort(shares, axis=-1)
+    tipping_counts = np.zeros((no_constits, no_parties), dtype=np.int64)
+    for party_no in range(0, no_parties):
+        party_shares = shares[:, :, party_no]
+        best_other = np.where(party_shares >= sorted_shares[:, :, -1], sorted_shares[:, :, -2], sorted_shares[:, :, -1])
+        margins = np.full(party_shares.shape, -np.inf)
+        margins[:, contested] = party_shares[:, contested] - best_other[:, contested]
+        tipping_seats = np.argpartition(-margins, majority_seats - 1, axis=1)[:, majority_seats - 1]
+        tipping_counts[:, party_no] = np.bincount(tipping_seats[contested[tipping_seats]], minlength=no_constits)
+
+    return seat_counts, win_counts, tipping_counts
+
+def run_simulation_shard(args):
+    (projected_shares, standing, constit_regions, no_regions, region_noise_sd, constit_noise_sd, majority_seats, no_simulations, batch_size, seed_sequence) = args
+    rng = np.random.default_rng(seed_sequence)
+    no_constits, no_parties = projected_shares.shape
+
+    seat_histogram = np.zeros((no_constits + 1, no_parties), dtype=np.int64)
+    win_counts = np.zeros((no_constits, no_parties), dtype=np.int64)
+    tipping_counts = np.zeros((no_constits, no_parties), dtype=np.int64)
+    majority_counts = np.zeros(no_parties, dtype=np.int64)
+
+    for batch_start in range(0, no_simulations, batch_size):
+        batch_simulations = min(batch_size, no_simulations - batch_start)
+        batch_seats, batch_wins, batch_tipping = simulate_batch(projected_shares, standing, constit_regions, no_regions, region_noise_sd, constit_noise_sd, majority_seats, batch_simulations, rng)
+        for party_no in range(0, no_parties):
+            seat_histogram[:, party_no] += np.bincount(batch_seats[:, party_no], minlength=no_constits + 1)
+        majority_counts += (batch_seats >= majority_seats).sum(axis=0)
+        win_counts += batch_wins
+        tipping_counts += batch_tipping
+
+    return seat_histogram, win_counts, tipping_counts, majority_counts
+
+def project_seats(
+    df,
+    base_year,
+    national_polls,
+    parties = None,
+    regional_polls = None,
+    region_column = "region_name",
+    swing = "uniform",
+    region_noise_sd = 2.0,
+    constit_noise_sd = 3.0,
+    no_simulations = 10000,
+    batch_size = 500,
+    n_workers = None,
+    majority_seats = None,
+    seed = None):
+
+    # Returns a dict of DataFrames:
+    # - seat_distribution: probability of each party winning each number of seats
+    # - win_probabilities: probability of each party winning each constituency
+    # - tipping_points: how often each constituency was each party's tipping point seat
+    # - summary: expected seats, 5th/95th percentile seats and probability of a majority for each party
+    #
+    # Parameters:
+    # - df (DataFrame or ElectionStore): constituency results including <base_year>_<party> and <base_year>_valid_votes
+    # - national_polls (dict): party -> % vote share, parties missing from the poll keep their base year share
+    # - regional_polls (dict): region name -> {party -> % vote share}, used instead of the national poll in that region
+    # - swing (string): "uniform" or "proportional"
+    # - region_noise_sd, constit_noise_sd (floats): standard deviation in % points of the error shared by a region,
+    #   and of each constituency's own error
+    # - n_workers (int): processes to shard the simulations over, defaults to the number of cores
+    base_year = str(base_year)
+    if (parties is None):
+        parties = election_core.get_election_parties(df, base_year)
+    frame = election_core.get_election_frame(df)
+
+    base_shares, base_votes, valid_votes = get_base_shares(df, base_year, parties)
+    standing = ~np.isnan(base_shares)
+    base_shares = np.nan_to_num(base_shares)
+    base_votes = np.nan_to_num(base_votes)
+
+    base_national_shares = 100*base_votes.sum(axis=0)/np.nansum(valid_votes)
+    national_poll_shares = np.array([national_polls.get(party, base_national_shares[party_no]) for party_no, party in enumerate(parties)], dtype=float)
+
+    constit_regions, region_names = pd.factorize(frame[region_column])
+    constit_regions = np.where(constit_regions < 0, len(region_names), constit_regions)
+    no_regions = len(region_names) + 1
+
+    regional_poll_shares = None
+    base_regional_shares = None
+    if (regional_polls is not None):
+        regional_poll_shares = np.full((no_regions, len(parties)), np.nan)
+        base_regional_shares = np.full((no_regions, len(parties)), np.nan)
+        for region_no in range(0, len(region_names)):
+            in_region = constit_regions == region_no
+            base_regional_shares[region_no] = 100*base_votes[in_region].sum(axis=0)/np.nansum(valid_votes[in_region])
+            region_poll = regional_polls.get(region_names[region_no], {})
+            for party_no in range(0, len(parties)):
+                if (parties[party_no] in region_poll):
+                    regional_poll_shares[region_no, party_no] = region_poll[parties[party_no]]
+
+    projected_shares = calculate_projected_shares(base_shares, base_national_shares, national_poll_shares, constit_regions, base_regional_shares, regional_poll_shares, swing)
+
+    no_constits = base_shares.shape[0]
+    if (majority_seats is None):
+        majority_seats = int(no_constits/2) + 1
+
+    if (n_workers is None):
+        n_workers = os.cpu_count() or 1
+    n_shards = max(1, min(n_workers, int(np.ceil(no_simulations/batch_size))))
+    shard_sizes = [len(shard) for shard in np.array_split(np.arange(no_simulations), n_shards)]
+    seed_sequences = np.random.SeedSequence(seed).spawn(n_shards)
+    shard_args = [(projected_shares, standing, constit_regions, no_regions, region_noise_sd, constit_noise_sd, majority_seats, shard_sizes[shard_no], batch_size, seed_sequences[shard_no]) for shard_no in range(0, n_shards)]
+
+    if (n_shards == 1):
+        shard_results = [run_simulation_shard(shard_args[0])]
+    else:
+        with ProcessPoolExecutor(max_workers=n_shards) as executor:
+            shard_results = list(executor.map(run_simulation_shard, shard_args))
+
+    seat_histogram = sum(result[0] for result in shard_results)
+    win_counts = sum(result[1] for result in shard_results)
+    tipping_counts = sum(result[2] for result in shard_results)
+    majority_counts = sum(result[3] for result in shard_results)
+
+    constit_index = frame["ons_id"].values if ("ons_id" in frame.columns) else frame.index
+    seat_distribution = pd.DataFrame(seat_histogram/no_simulations, columns=parties)
+    seat_distribution.index.name = "seats"
+
+    cumulative = seat_distribution.cumsum()
+    seat_numbers = seat_distribution.index.values
+    summary_df = pd.DataFrame({
+        "expected_seats": (seat_distribution.values*seat_numbers[:, np.newaxis]).sum(axis=0),
+        "seats_5th_percentile": [seat_numbers[np.searchsorted(cumulative[party].values, 0.05)] for party in parties],
+        "seats_95th_percentile": [seat_numbers[min(np.searchsorted(cumulative[party].values, 0.95), len(seat_numbers) - 1)] for party in parties],
+        "majority_probability": majority_counts/no_simulations
+    }, index=pd.Index(parties, name="party"))
+
+    return {
+        "seat_distribution": seat_distribution,
+        "win_probabilities": pd.DataFrame(win_counts/no_simulations, index=constit_index, columns=parties),
+        "tipping_points": pd.DataFrame(tipping_counts/no_simulations, index=constit_index, columns=parties),
+        "summary": summary_df
+    }
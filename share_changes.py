@@ -0,0 +1,123 @@
+import pandas as pd
+import numpy as np
+import election_core
+from election_store import ElectionStore, get_column_years
+
+# Vote share changes and Pedersen volatility between any pair of elections, at constituency, region or national
+# level. The (constituencies x years x parties) votes are read into a ShareTensor once and everything else is worked
+# out from it when first asked for and kept, so drawing several maps or tables from the same data doesn't redo it.
+#
+# Pedersen volatility is half the sum over parties of the absolute change in % vote share. A party that only stood
+# in one of the two elections counts as a 0% share in the other.
+
+share_tensor_cache = {}
+share_tensor_cache_size = 32
+
+class ShareTensor:
+    def __init__(self, df, years=None, parties=None, region_column="region_name"):
+        frame = election_core.get_election_frame(df)
+        if (years is None):
+            years = [year for year in get_column_years(frame) if (year + "_valid_votes") in frame.columns]
+        self.years = [str(year) for year in years]
+        self.index = frame.index
+        self.year_numbers = {year: year_no for year_no, year in enumerate(self.years)}
+
+        self.votes, self.parties = election_core.get_vote_matrix(df, self.years, parties)
+        self.party_numbers = {party: party_no for party_no, party in enumerate(self.parties)}
+        # A party with a column stood, even if it has no votes in these rows (e.g. pc in a Scotland only frame)
+        self.has_column = np.array([[(year + "_" + party) in frame.columns for party in self.parties] for year in self.years], dtype=bool).reshape(len(self.years), len(self.parties))
+        self.valid_votes = np.column_stack([pd.to_numeric(frame[year + "_valid_votes"], errors="coerce").values.astype(float) for year in self.years])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.shares = 100*self.votes/self.valid_votes[:, :, np.newaxis]
+
+        self.group_codes = {"national": (np.zeros(frame.shape[0], dtype=np.int64), ["national"])}
+        if (region_column in frame.columns):
+            region_codes, region_names = pd.factorize(frame[region_column], sort=True)
+            self.group_codes["region"] = (region_codes, list(region_names))
+
+        self.cache = {}
+
+    def get_year_number(self, year):
+        year = str(year)
+        if (year not in self.year_numbers):
+            raise Exception("year " + year + " not recognised")
+        return self.year_numbers[year]
+
+    def share_change(self, year, compare_year):
+        # (constituencies x parties) change in % vote share from compare_year to year, NaN where the party didn't
+        # stand in one of them
+        key = ("share_change", str(year), str(compare_year))
+        if (key not in self.cache):
+            self.cache[key] = self.shares[:, self.get_year_number(year), :] - self.shares[:, self.get_year_number(compare_year), :]
+        return self.cache[key]
+
+    def share_change_df(self, year, compare_year, parties=None):
+        # The share changes as <year>_<party>_share_change columns, indexed like the source df
+        if (parties is None):
+            parties = self.parties
+        share_change = self.share_change(year, compare_year)
+        return pd.DataFrame({
+            str(year) + "_" + party + "_share_change": share_change[:, self.party_numbers[party]] for party in parties
+        }, index=self.index)
+
+    def group_shares(self, year_no, level):
+        # (groups x parties) % vote shares with the votes and valid votes summed over each group first
+        key = ("group_shares", year_no, level)
+        if (key not in self.cache):
+            group_codes, group_names = self.group_codes[level]
+            in_group = group_codes >= 0
+            group_votes = np.zeros((len(group_names), len(self.parties)))
+            np.add.at(group_votes, group_codes[in_group], np.nan_to_num(self.votes[in_group, year_no, :]))
+            group_valid_votes = np.bincount(group_codes[in_group], weights=np.nan_to_num(self.valid_votes[in_group, year_no]), minlength=len(group_names))
+            with np.errstate(divide="ignore", invalid="ignore"):
+                self.cache[key] = 100*group_votes/group_valid_votes[:, np.newaxis]
+        return self.cache[key]
+
+    def pedersen_volatility(self, year, compare_year, level="constituency"):
+        # Returns a Series indexed like the source df for level="constituency", a Series indexed by region for
+        # level="region" and a float for level="national"
+        key = ("pedersen_volatility", str(year), str(compare_year), level)
+        if (key in self.cache):
+            return self.cache[key]
+
+        year_no = self.get_year_number(year)
+        compare_year_no = self.get_year_number(compare_year)
+        stood = self.has_column[year_no] | self.has_column[compare_year_no]
+
+        if (level == "constituency"):
+            share_changes = np.nan_to_num(self.shares[:, year_no, stood]) - np.nan_to_num(self.shares[:, compare_year_no, stood])
+            has_results = (self.valid_votes[:, year_no] > 0) & (self.valid_votes[:, compare_year_no] > 0)
+            volatility = pd.Series(np.where(has_results, np.abs(share_changes).sum(axis=1)/2, np.nan), index=self.index)
+        elif (level in self.group_codes):
+            share_changes = self.group_shares(year_no, level)[:, stood] - self.group_shares(compare_year_no, level)[:, stood]
+            volatility = pd.Series(np.abs(share_changes).sum(axis=1)/2, index=self.group_codes[level][1])
+            if (level == "national"):
+                volatility = float(volatility.values[0])
+        else:
+            raise Exception("level " + level + " not recognised")
+
+        self.cache[key] = volatility
+        return volatility
+
+    def pedersen_volatility_matrix(self, level="national"):
+        # National (or a single region's) volatility between every pair of years as a (years x years) DataFrame
+        matrix = pd.DataFrame(np.nan, index=pd.Index(self.years, name="year"), columns=pd.Index(self.years, name="compare_year"))
+        for year in self.years:
+            for compare_year in self.years:
+                volatility = self.pedersen_volatility(year, compare_year, "national" if level == "national" else "region")
+                matrix.at[year, compare_year] = volatility if level == "national" else volatility[level]
+        return matrix
+
+def get_share_tensor(df, years=None, parties=None, region_column="region_name"):
+    # ShareTensors for ElectionStores are memoized on the store version, for the share_tensor_cache_size most
+    # recently used. Plain DataFrames get a new one each time (build one and pass it around to reuse it).
+    if (not isinstance(df, ElectionStore)):
+        return ShareTensor(df, years, parties, region_column)
+    key = (df.version, None if years is None else tuple(str(year) for year in years), None if parties is None else tuple(parties), region_column)
+    if (key in share_tensor_cache):
+        share_tensor_cache[key] = share_tensor_cache.pop(key)
+        return share_tensor_cache[key]
+    share_tensor_cache[key] = ShareTensor(df, years, parties, region_column)
+    while (len(share_tensor_cache) > share_tensor_cache_size):
+        share_tensor_cache.pop(next(iter(share_tensor_cache)))
+    return share_tensor_cache[key]
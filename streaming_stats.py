@@ -0,0 +1,286 @@
+import os
+import io
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+# Grouped descriptive statistics (min, quartiles, median, max, mean, mode, sd, skew and kurtosis) worked out in one
+# pass over a column, or over a csv read in chunks so wide survey files never have to be loaded whole.
+#
+# Each (column, group) keeps:
+# - running moments (count, mean and the 2nd to 4th central moment sums) merged chunk by chunk with Pebay's
+#   pairwise update formulas
+# - a count of every distinct value, which gives exact quantiles and modes for the low cardinality answers that
+#   make up most survey columns. Once a column has more than max_exact_values distinct values the counts are
+#   rounded onto logarithmic buckets (within relative_accuracy of the true value), which bounds their size.
+#
+# Both merge by simple addition, so chunks can be summarised in parallel and merged in any order.
+
+stat_names = ["count", "min", "q1", "median", "q3", "max", "mean", "mode", "sd", "skew", "kurtosis"]
+
+def merge_moments(a, b):
+    # a and b are arrays of [count, mean, M2, M3, M4, min, max]
+    n_a, mean_a, m2_a, m3_a, m4_a, min_a, max_a = a
+    n_b, mean_b, m2_b, m3_b, m4_b, min_b, max_b = b
+    if (n_a == 0):
+        return b.copy()
+    if (n_b == 0):
+        return a.copy()
+    n = n_a + n_b
+    delta = mean_b - mean_a
+    mean = mean_a + delta*n_b/n
+    m2 = m2_a + m2_b + delta**2*n_a*n_b/n
+    m3 = m3_a + m3_b + delta**3*n_a*n_b*(n_a - n_b)/n**2 + 3*delta*(n_a*m2_b - n_b*m2_a)/n
+    m4 = (m4_a + m4_b + delta**4*n_a*n_b*(n_a**2 - n_a*n_b + n_b**2)/n**3
+          + 6*delta**2*(n_a**2*m2_b + n_b**2*m2_a)/n**2 + 4*delta*(n_a*m3_b - n_b*m3_a)/n)
+    return np.array([n, mean, m2, m3, m4, min(min_a, min_b), max(max_a, max_b)])
+
+def merge_value_counts(a, b):
+    merged = dict(a)
+    for value, count in b.items():
+        merged[value] = merged.get(value, 0) + count
+    return merged
+
+def bucket_values(values, relative_accuracy):
+    # Rounds values onto logarithmic buckets, each value lands on its bucket's midpoint which is within
+    # relative_accuracy of it. Zero stays as zero.
+    gamma = (1 + relative_accuracy)/(1 - relative_accuracy)
+    values = np.asarray(values, dtype=float)
+    magnitudes = np.abs(values)
+    with np.errstate(divide="ignore"):
+        buckets = np.ceil(np.log(magnitudes)/np.log(gamma))
+    return np.where(magnitudes > 0, np.sign(values)*2*gamma**buckets/(gamma + 1), 0.0)
+
+def calculate_quantile(values, cumulative_counts, q):
+    # Linearly interpolated quantile (as pandas does) from sorted distinct values and their cumulative counts
+    position = (cumulative_counts[-1] - 1)*q
+    lower = values[np.searchsorted(cumulative_counts, np.floor(position), side="right")]
+    upper = values[np.searchsorted(cumulative_counts, np.ceil(position), side="right")]
+    return lower + (upper - lower)*(position - np.floor(position))
+
+class StreamingStats:
+    def __init__(self, columns, group_by=None, invalid_values=[], max_exact_values=1000, relative_accuracy=0.01):
+        # Parameters:
+        # - columns (array of strings): numeric columns to summarise, values that can't be read as numbers are skipped
+        # - group_by (string or array of strings): columns to group by (e.g. past vote or region), None for no groups
+        # - invalid_values (array): values to skip, e.g. utilities.bes_invalid_values for BES answers
+        # - max_exact_values (int): distinct values kept per (column, group) before switching to buckets, None to
+        #   always keep them all
+        # - relative_accuracy (float): accuracy of the bucketed quantiles and modes
+        self.columns = list(columns)
+        if (isinstance(group_by, str)):
+            group_by = [group_by]
+        self.group_by = list(group_by) if group_by is not None else []
+        self.invalid_values = list(invalid_values)
+        self.max_exact_values = max_exact_values
+        self.relative_accuracy = relative_accuracy
+        self.moments = {}
+        self.value_counts = {}
+        self.bucketed = set()
+
+    def get_chunk_groups(self, chunk):
+        # Group codes for each row (-1 for rows with a missing group key) and the group labels
+        if (len(self.group_by) == 0):
+            return np.zeros(chunk.shape[0], dtype=np.int64), [None]
+        if (len(self.group_by) == 1):
+            codes, labels = pd.factorize(chunk[self.group_by[0]])
+            return codes, list(labels)
+        codes, labels = pd.MultiIndex.from_frame(chunk[self.group_by]).factorize()
+        return codes, list(labels)
+
+    def update(self, chunk):
+        # Adds a DataFrame (or Series, for a single column with no groups) of rows to the running statistics
+        if (isinstance(chunk, pd.Series)):
+            chunk = chunk.to_frame(self.columns[0])
+        group_codes, group_labels = self.get_chunk_groups(chunk)
+        no_groups = len(group_labels)
+
+        for col in self.columns:
+            values = chunk[col]
+            if (len(self.invalid_values) > 0):
+                values = values.mask(values.isin(self.invalid_values))
+            values = pd.to_numeric(values, errors="coerce").values.astype(float)
+            valid = ~np.isnan(values) & (group_codes >= 0)
+            codes = group_codes[valid]
+            values = values[valid]
+
+            counts = np.bincount(codes, minlength=no_groups)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                means = np.bincount(codes, weights=values, minlength=no_groups)/counts
+            deviations = values - means[codes]
+            central_moments = [np.bincount(codes, weights=deviations**power, minlength=no_groups) for power in (2, 3, 4)]
+            minimums = np.full(no_groups, np.inf)
+            np.minimum.at(minimums, codes, values)
+            maximums = np.full(no_groups, -np.inf)
+            np.maximum.at(maximums, codes, values)
+
+            # Distinct value counts for each group from one sort of (group, value) pairs
+            order = np.lexsort((values, codes))
+            sorted_codes = codes[order]
+            sorted_values = values[order]
+            starts = np.flatnonzero(np.r_[True, (sorted_codes[1:] != sorted_codes[:-1]) | (sorted_values[1:] != sorted_values[:-1])])
+            run_counts = np.diff(np.r_[starts, len(sorted_values)])
+
+            for group_no in range(0, no_groups):
+                if (counts[group_no] == 0):
+                    continue
+                key = (col, group_labels[group_no])
+                chunk_moments = np.array([counts[group_no], means[group_no], central_moments[0][group_no], central_moments[1][group_no], central_moments[2][group_no], minimums[group_no], maximums[group_no]])
+                in_group = sorted_codes[starts] == group_no
+                chunk_counts = dict(zip(sorted_values[starts][in_group].tolist(), run_counts[in_group].tolist()))
+                self.add(key, chunk_moments, chunk_counts)
+        return self
+
+    def add(self, key, moments, value_counts, bucketed=False):
+        if (key in self.moments):
+            self.moments[key] = merge_moments(self.moments[key], moments)
+        else:
+            self.moments[key] = moments
+        if (bucketed and (key not in self.bucketed)):
+            self.value_counts[key] = self.bucket_counts(self.value_counts.get(key, {}))
+            self.bucketed.add(key)
+        if (key in self.bucketed):
+            # Already bucketed values land back on the same bucket
+            value_counts = self.bucket_counts(value_counts)
+        self.value_counts[key] = merge_value_counts(self.value_counts.get(key, {}), value_counts)
+        if ((key not in self.bucketed) and (self.max_exact_values is not None) and (len(self.value_counts[key]) > self.max_exact_values)):
+            self.value_counts[key] = self.bucket_counts(self.value_counts[key])
+            self.bucketed.add(key)
+
+    def bucket_counts(self, value_counts):
+        bucketed_counts = {}
+        for value, count in zip(bucket_values(list(value_counts.keys()), self.relative_accuracy).tolist(), value_counts.values()):
+            bucketed_counts[value] = bucketed_counts.get(value, 0) + count
+        return bucketed_counts
+
+    def merge(self, other):
+        # Folds another StreamingStats (e.g. from a different chunk of the same file) into this one
+        for key in other.moments.keys():
+            self.add(key, other.moments[key], other.value_counts[key], key in other.bucketed)
+        return self
+
+    def get_stats(self, key):
+        n, mean, m2, m3, m4, minimum, maximum = self.moments[key]
+        values = np.array(sorted(self.value_counts[key].keys()))
+        counts = np.array([self.value_counts[key][value] for value in values])
+        cumulative_counts = np.cumsum(counts)
+
+        # Sample sd and the bias corrected skew and excess kurtosis, as pandas gives
+        sd = np.sqrt(m2/(n - 1)) if n > 1 else np.nan
+        skew = np.nan
+        kurtosis = np.nan
+        if ((n > 2) and (m2 > 0)):
+            skew = np.sqrt(n*(n - 1))/(n - 2)*(m3/n)/(m2/n)**1.5
+        if ((n > 3) and (m2 > 0)):
+            kurtosis = (n - 1)/((n - 2)*(n - 3))*((n + 1)*((m4/n)/(m2/n)**2 - 3) + 6)
+
+        return {
+            "count": int(n),
+            "min": minimum,
+            "q1": calculate_quantile(values, cumulative_counts, 0.25),
+            "median": calculate_quantile(values, cumulative_counts, 0.5),
+            "q3": calculate_quantile(values, cumulative_counts, 0.75),
+            "max": maximum,
+            "mean": mean,
+            "mode": values[counts.argmax()],
+            "sd": sd,
+            "skew": skew,
+            "kurtosis": kurtosis,
+            "approximate_quantiles": key in self.bucketed
+        }
+
+    def result(self):
+        # One row per column and group
+        rows = []
+        for key in self.moments.keys():
+            row = {"column": key[0]}
+            for group_col_no in range(0, len(self.group_by)):
+                row[self.group_by[group_col_no]] = key[1] if len(self.group_by) == 1 else key[1][group_col_no]
+            row.update(self.get_stats(key))
+            rows.append(row)
+        return pd.DataFrame(rows, columns=["column"] + self.group_by + stat_names + ["approximate_quantiles"])
+
+def get_chunk_byte_ranges(csv_path, chunksize, block_size=2**20):
+    # (start, end) byte offsets splitting the rows of a csv into chunks of chunksize rows. Found by scanning the raw
+    # bytes for line ends that aren't inside quotes, which is far quicker than parsing the file.
+    chunk_starts = []
+    no_line_ends = 0
+    in_quotes = 0
+    file_size = 0
+    with open(csv_path, "rb") as csv_file:
+        while (True):
+            block = np.frombuffer(csv_file.read(block_size), dtype=np.uint8)
+            if (len(block) == 0):
+                break
+            quote_parity = (np.cumsum(block == ord('"')) + in_quotes) % 2
+            line_ends = np.flatnonzero((block == ord("\n")) & (quote_parity == 0))
+            # Line end number i (the first ends the header) is followed by row i
+            row_nos = no_line_ends + np.arange(len(line_ends))
+            chunk_starts.extend((file_size + line_ends[row_nos % chunksize == 0] + 1).tolist())
+            no_line_ends += len(line_ends)
+            in_quotes = int(quote_parity[-1])
+            file_size += len(block)
+    chunk_starts = [start for start in chunk_starts if start < file_size]
+    return list(zip(chunk_starts, chunk_starts[1:] + [file_size]))
+
+class ByteRangeReader(io.RawIOBase):
+    # Reads an open file from its current position up to no_bytes further on
+    def __init__(self, raw_file, no_bytes):
+        self.raw_file = raw_file
+        self.remaining = no_bytes
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.raw_file.read(min(len(buffer), self.remaining))
+        buffer[:len(data)] = data
+        self.remaining -= len(data)
+        return len(data)
+
+def summarise_byte_range(args):
+    # Workers read their own rows of the csv, so only the offsets are sent to them rather than pickled chunks
+    csv_path, start, end, names, usecols, stats_args = args
+    with open(csv_path, "rb") as csv_file:
+        csv_file.seek(start)
+        chunk = pd.read_csv(io.BufferedReader(ByteRangeReader(csv_file, end - start)), header=None, names=names, usecols=usecols, low_memory=False)
+    return StreamingStats(**stats_args).update(chunk)
+
+def describe_csv(csv_path, columns, group_by=None, invalid_values=[], chunksize=100000, n_workers=None, max_exact_values=1000, relative_accuracy=0.01):
+    # Grouped statistics for columns of a csv, read chunksize rows at a time with only the needed columns parsed.
+    # With more than one worker the file is split into byte ranges of chunksize rows, which the workers in a process
+    # pool read and summarise themselves. Their results are merged as they come back, with a bounded number of
+    # chunks in flight so memory stays at a few chunks.
+    if (isinstance(group_by, str)):
+        group_by = [group_by]
+    group_by = list(group_by) if group_by is not None else []
+    stats_args = {"columns": columns, "group_by": group_by, "invalid_values": invalid_values, "max_exact_values": max_exact_values, "relative_accuracy": relative_accuracy}
+    stats = StreamingStats(**stats_args)
+    usecols = list(dict.fromkeys(list(columns) + group_by))
+
+    if (n_workers is None):
+        n_workers = os.cpu_count() or 1
+    if (n_workers <= 1):
+        for chunk in pd.read_csv(csv_path, usecols=usecols, chunksize=chunksize, low_memory=False):
+            stats.update(chunk)
+        return stats.result()
+
+    names = list(pd.read_csv(csv_path, nrows=0).columns)
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        in_flight = []
+        for start, end in get_chunk_byte_ranges(csv_path, chunksize):
+            in_flight.append(executor.submit(summarise_byte_range, (csv_path, start, end, names, usecols, stats_args)))
+            if (len(in_flight) >= 2*n_workers):
+                stats.merge(in_flight.pop(0).result())
+        for future in in_flight:
+            stats.merge(future.result())
+    return stats.result()
+
+def describe_series(column, invalid_values=[]):
+    # The statistics for a single in memory Series as a dict, the series is already in memory so every distinct
+    # value is kept and the quantiles are exact
+    stats = StreamingStats([column.name if column.name is not None else 0], invalid_values=invalid_values, max_exact_values=None)
+    stats.update(column.rename(stats.columns[0]))
+    if (len(stats.moments) == 0):
+        return {stat_name: np.nan for stat_name in stat_names}
+    return stats.get_stats((stats.columns[0], None))
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+from PIL import Image
+import batch_render
+
+def make_map_data(tmp_path, no_constits=12):
+    rng = np.random.default_rng(0)
+    ons_ids = ["C" + str(constit_no) for constit_no in range(0, no_constits)]
+    hex_coords_path = str(tmp_path / "hex_coords.csv")
+    pd.DataFrame({"ons_id": ons_ids, "q": np.arange(no_constits) % 4, "r": np.arange(no_constits)//4}).to_csv(hex_coords_path, index=False)
+    constits_df = pd.DataFrame({
+        "ons_id": ons_ids,
+        "2017_con_share_change": rng.normal(size=no_constits),
+        "2019_con_share_change": rng.normal(size=no_constits),
+        "2019_first_party": rng.choice(["con", "lab", "snp"], no_constits)
+    })
+    panels = [
+        {"column": "2017_con_share_change", "title": "2017"},
+        {"column": "2019_con_share_change", "title": "2019"},
+        {"column": "2019_first_party", "kind": "discrete"}
+    ]
+    return constits_df, panels, hex_coords_path
+
+def read_pixels(path):
+    return np.asarray(Image.open(path).convert("RGB"))
+
+def test_serial_and_parallel_render_the_same_images(tmp_path):
+    constits_df, panels, hex_coords_path = make_map_data(tmp_path)
+    serial_paths = batch_render.render_map_batch(constits_df, panels, str(tmp_path / "serial"), n_workers=1, constit_hex_coords_path=hex_coords_path, figsize=(4, 4), dpi=50)
+    parallel_paths = batch_render.render_map_batch(constits_df, panels, str(tmp_path / "parallel"), n_workers=2, constit_hex_coords_path=hex_coords_path, figsize=(4, 4), dpi=50)
+    assert [len(paths) for paths in serial_paths] == [1, 1, 1]
+    for serial_path, parallel_path in zip(serial_paths, parallel_paths):
+        assert serial_path[0].endswith(".png")
+        assert np.array_equal(read_pixels(serial_path[0]), read_pixels(parallel_path[0]))
+
+def test_rendering_in_process_leaves_pyplot_alone(tmp_path, monkeypatch):
+    # A single panel is drawn in this process, which mustn't switch the caller's backend or go through pyplot's
+    # figure manager, where it could close or draw over the caller's figures
+    constits_df, panels, hex_coords_path = make_map_data(tmp_path)
+    fig = plt.figure()
+    def fail(*args, **kwargs):
+        raise Exception("pyplot used while rendering")
+    monkeypatch.setattr(matplotlib, "use", fail)
+    monkeypatch.setattr(plt, "switch_backend", fail)
+    monkeypatch.setattr(plt, "figure", fail)
+    monkeypatch.setattr(plt, "close", fail)
+    paths = batch_render.render_map_batch(constits_df, panels[:1], str(tmp_path / "maps"), n_workers=4, constit_hex_coords_path=hex_coords_path, figsize=(4, 4), dpi=50)
+    monkeypatch.undo()
+    assert len(paths) == 1
+    assert plt.get_fignums() == [fig.number]
+    plt.close(fig)
+
+def test_animation_has_a_frame_per_panel(tmp_path):
+    constits_df, panels, hex_coords_path = make_map_data(tmp_path)
+    output_path = str(tmp_path / "maps.gif")
+    assert batch_render.render_map_animation(constits_df, panels, output_path, frame_duration=500, n_workers=1, constit_hex_coords_path=hex_coords_path, figsize=(4, 4), dpi=50) == output_path
+    animation = Image.open(output_path)
+    assert animation.n_frames == len(panels)
+    # Every frame is padded to the largest one
+    frame_sizes = [Image.open(str(tmp_path / "maps_frames" / ("frame_" + str(frame_no).zfill(3) + ".png"))).size for frame_no in range(0, len(panels))]
+    assert animation.size == (max(size[0] for size in frame_sizes), max(size[1] for size in frame_sizes))
@@ -0,0 +1,48 @@
+import pandas as pd
+import bes_loader
+
+def write_bes_csv(tmp_path):
+    csv_path = str(tmp_path / "bes.csv")
+    pd.DataFrame({
+        "id": ["98", "99", "9999", "4", "5", "6"],
+        "age": ["99", "45", "9999.0", " ", "30", "98"],
+        "lr1W19": ["3", "9999", "10", "0", "99", "5"],
+        "p_past_vote_2019": ["Labour", "Conservative", "9999", "99", "Labour", " "],
+        "country": ["England", "Scotland", "England", "Wales", "England", "England"]
+    }).to_csv(csv_path, index=False)
+    return csv_path
+
+def test_sentinels_depend_on_the_column(tmp_path):
+    bes_df = bes_loader.load_bes_panel(write_bes_csv(tmp_path), ["id", "age", "lr1W19", "p_past_vote_2019"], use_cache=False)
+    assert list(bes_df["id"]) == [98, 99, 9999, 4, 5, 6]
+    # Ages of 98 and 99 are real answers, 9999 is don't know however it's formatted
+    assert list(bes_df["age"].astype(object).where(bes_df["age"].notna(), None)) == [99, 45, None, None, 30, 98]
+    assert bes_df["lr1W19"].isna().sum() == 1
+    assert list(bes_df["p_past_vote_2019"].cat.categories) == ["Conservative", "Labour"]
+    assert bes_df["p_past_vote_2019"].isna().sum() == 3
+
+def test_column_sentinel_values_override_the_defaults(tmp_path):
+    bes_df = bes_loader.load_bes_panel(write_bes_csv(tmp_path), ["age", "lr1W19"], column_sentinel_values={"lr1W19": ["9999", "99"]}, use_cache=False)
+    assert bes_df["lr1W19"].isna().sum() == 2
+    assert bes_df["age"].isna().sum() == 2
+
+def test_required_columns_drop_sentinel_answers(tmp_path):
+    csv_path = write_bes_csv(tmp_path)
+    for use_cache in [False, True, True]:
+        bes_df = bes_loader.load_bes_panel(csv_path, ["id", "country"], required_columns=["p_past_vote_2019"], filters={"country": ["England", "Scotland"]}, cache_dir=str(tmp_path / "cache"), use_cache=use_cache)
+        assert list(bes_df["id"]) == [98, 99, 5]
+        assert list(bes_df["p_past_vote_2019"]) == ["Labour", "Conservative", "Labour"]
+
+def test_certain_missing_answers_are_dropped_while_streaming(tmp_path):
+    # 9999 and blanks are missing for any column, 99 and 98 only once the column is known to be text
+    assert list(bes_loader.get_certain_missing(pd.Series(["9999.0", "99", " ", None, "Labour"]).values, bes_loader.bes_sentinel_values, bes_loader.bes_numeric_sentinel_values)) == [True, False, True, True, False]
+    assert list(bes_loader.get_certain_missing(pd.Series(["99", None]).values, [], [])) == [False, True]
+
+    csv_path = write_bes_csv(tmp_path)
+    expected_df = bes_loader.load_bes_panel(csv_path, ["id"], required_columns=["age", "p_past_vote_2019"], chunksize=20000, use_cache=False)
+    # An age of 99 is a real answer, ages and votes of 9999 or blank are dropped, and so is a vote of 99 once it's known
+    # to be a text column
+    assert list(expected_df["id"]) == [98, 99, 5]
+    for chunksize in [1, 2, 4]:
+        bes_df = bes_loader.load_bes_panel(csv_path, ["id"], required_columns=["age", "p_past_vote_2019"], chunksize=chunksize, use_cache=False)
+        pd.testing.assert_frame_equal(bes_df, expected_df)
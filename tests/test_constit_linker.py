@@ -0,0 +1,32 @@
+import constit_linker
+
+def test_normalised_key_examples():
+    assert constit_linker.normalise_constituency_name("Durham, City of") == constit_linker.normalise_constituency_name("City of Durham")
+    assert constit_linker.normalise_constituency_name("Edinburgh North & Leith") == constit_linker.normalise_constituency_name("Edinburgh North and Leith")
+
+def test_changed_targets_are_linked_again(tmp_path):
+    crosswalk_path = str(tmp_path / "crosswalk.csv")
+    source_names = ["Edinburgh North & Leith", "Durham, City of"]
+    old_targets = ["Edinburgh North and Leith", "City of Durham"]
+    crosswalk = constit_linker.link_constituency_names(source_names, old_targets, crosswalk_path)
+    assert list(crosswalk["target_name"]) == old_targets
+
+    # After the boundary change Edinburgh North and Leith is gone, Durham is unchanged
+    new_targets = ["Edinburgh North and Leith East", "City of Durham"]
+    crosswalk = constit_linker.link_constituency_names(source_names, new_targets, crosswalk_path)
+    assert list(crosswalk["target_name"]) == new_targets
+    assert list(crosswalk["method"]) == ["fuzzy", "exact"]
+
+def test_one_file_holds_several_target_sets(tmp_path):
+    crosswalk_path = str(tmp_path / "crosswalk.csv")
+    targets_2005 = ["Edinburgh North and Leith", "City of Durham"]
+    targets_2010 = ["Edinburgh North and Leith East", "City of Durham"]
+    constit_linker.link_constituency_names(["Edinburgh North & Leith"], targets_2005, crosswalk_path)
+    constit_linker.link_constituency_names(["Edinburgh North & Leith"], targets_2010, crosswalk_path)
+    assert len(constit_linker.load_crosswalk(crosswalk_path)) == 2
+
+    # Both mappings are still there to be reused, so the saved rows come back rather than being linked again
+    for target_names in [targets_2005, targets_2010]:
+        crosswalk = constit_linker.link_constituency_names(["Edinburgh North & Leith"], target_names, crosswalk_path)
+        assert list(crosswalk["target_name"]) == [target_names[0]]
+    assert len(constit_linker.load_crosswalk(crosswalk_path)) == 2
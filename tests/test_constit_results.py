@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+import election_core
+
+# The row by row loops utilities used before the vote matrix version, kept here as the reference
+
+def baseline_calculate_constit_winners(row, year, parties):
+    winning_party = "invalid"
+    winning_votes = -1
+    for party in parties:
+        col_name = year + "_" + party
+        party_votes = row[col_name]
+        if (party_votes != np.nan):
+            party_votes = float(party_votes)
+            if (party_votes > winning_votes):
+                winning_votes = party_votes
+                winning_party = party
+    return winning_party.lower()
+
+def baseline_calculate_constit_runnerup(row, year, parties):
+    party_1_votes = row[year + "_" + parties[0]]
+    party_2_votes = row[year + "_" + parties[1]]
+    if (party_1_votes > party_2_votes):
+        winning_party = parties[0]
+        winning_votes = party_1_votes
+        runner_up_party = parties[1]
+        runner_up_votes = party_2_votes
+    else:
+        winning_party = parties[1]
+        winning_votes = party_2_votes
+        runner_up_party = parties[0]
+        runner_up_votes = party_1_votes
+    for party in parties[2:]:
+        col_name = year + "_" + party
+        party_votes = row[col_name]
+        if (party_votes != np.nan):
+            if (party_votes > winning_votes):
+                runner_up_party = winning_party
+                runner_up_votes = winning_votes
+                winning_party = party
+                winning_votes = party_votes
+            elif (party_votes > runner_up_votes):
+                runner_up_party = party
+                runner_up_votes = party_votes
+    return runner_up_party
+
+parties = ["con", "lab", "ld", "snp"]
+
+def make_constits_df():
+    return pd.DataFrame({
+        "2019_con": [20000, 15000, 9000, 12000, 5000],
+        "2019_lab": [18000, 21000, 9000, 12000, 5000],
+        "2019_ld": [5000, 3000, 4000, 12000, 25000],
+        "2019_snp": [np.nan, np.nan, 9000, 1000, np.nan],
+        "2019_valid_votes": [43000, 39000, 31000, 37000, 35000]
+    })
+
+def test_winners_match_baseline_with_nan_parties_and_ties():
+    # Row 2 is a three way tie for first and row 3 a three way tie between the first three columns, the earliest
+    # party wins both as it always has
+    df = make_constits_df()
+    expected = df.apply(baseline_calculate_constit_winners, axis=1, args=("2019", parties))
+    assert (df.apply(election_core.calculate_constit_winners, axis=1, args=("2019", parties)) == expected).all()
+    assert (election_core.calculate_constit_results(df, ["2019"], parties)["2019_first_party"] == expected).all()
+
+def test_runnerups_match_baseline_without_ties_in_the_first_two_columns():
+    df = make_constits_df().iloc[[0, 1]]
+    expected = df.apply(baseline_calculate_constit_runnerup, axis=1, args=("2019", parties))
+    assert (df.apply(election_core.calculate_constit_runnerup, axis=1, args=("2019", parties)) == expected).all()
+    assert (election_core.calculate_constit_results(df, ["2019"], parties)["2019_second_party"] == expected).all()
+
+def test_runnerup_ties_go_to_the_earlier_column():
+    # The old loop put the second column ahead when the first two tied, now every tie goes to the earlier column
+    # for both the winner and the runner up
+    df = make_constits_df()
+    results = election_core.calculate_constit_results(df, ["2019"], parties)
+    assert list(results["2019_first_party"]) == ["con", "lab", "con", "con", "ld"]
+    assert list(results["2019_second_party"]) == ["lab", "con", "lab", "lab", "con"]
+    assert df.apply(baseline_calculate_constit_runnerup, axis=1, args=("2019", parties)).iloc[2] == "con"
+
+def test_nan_votes_mean_the_party_did_not_stand():
+    # The old runner up loop could pick a party with no candidate when the first column was NaN
+    df = pd.DataFrame({"2019_con": [np.nan], "2019_lab": [100.0], "2019_ld": [50.0], "2019_snp": [np.nan], "2019_valid_votes": [150]})
+    results = election_core.calculate_constit_results(df, ["2019"], parties)
+    assert results["2019_first_party"].iloc[0] == "lab"
+    assert results["2019_second_party"].iloc[0] == "ld"
+    assert results["2019_majority"].iloc[0] == 50
+    assert np.isclose(results["2019_margin"].iloc[0], 100*50/150)
+    assert baseline_calculate_constit_runnerup(df.iloc[0], "2019", parties) == "con"
+
+def test_no_candidates_is_invalid():
+    df = pd.DataFrame({"2019_con": [np.nan], "2019_lab": [np.nan], "2019_ld": [np.nan], "2019_snp": [np.nan], "2019_valid_votes": [0]})
+    assert election_core.calculate_constit_winners(df.iloc[0], "2019", parties) == "invalid"
+    assert baseline_calculate_constit_winners(df.iloc[0], "2019", parties) == "invalid"
+
+def test_joined_results_are_not_parties():
+    df = make_constits_df()
+    df["2019_SNP"] = df.pop("2019_snp")
+    df.loc[0, "2019_SNP"] = 19000
+    parties = election_core.get_election_parties(df, "2019")
+    results = election_core.calculate_constit_results(df, ["2019"])
+    joined_df = df.join(results)
+    assert election_core.get_election_parties(joined_df, "2019") == parties
+    assert (results["2019_second_party"] == results["2019_second_party"].str.lower()).all()
+    assert results["2019_second_party"].iloc[0] == "snp"
@@ -0,0 +1,53 @@
+import numpy as np
+from sklearn.tree import DecisionTreeClassifier
+import cross_validation
+
+def make_data(no_rows=120, seed=0):
+    # Imbalanced three class data so SMOTE has something to oversample
+    rng = np.random.default_rng(seed)
+    targets = rng.choice(np.array(["con", "lab", "ld"]), size=no_rows, p=[0.6, 0.3, 0.1])
+    features = rng.normal(size=(no_rows, 4)) + (targets == "lab")[:, np.newaxis] - (targets == "ld")[:, np.newaxis]
+    return features, targets
+
+def test_folds_are_reused_and_bounded():
+    cross_validation.smote_fold_cache.clear()
+    features, targets = make_data()
+    labels, folds = cross_validation.get_smote_folds(features, targets, k=3)
+    assert list(labels) == ["con", "lab", "ld"]
+    assert cross_validation.get_smote_folds(features, targets, k=3)[1] is folds
+    # Training folds are balanced by SMOTE, test folds cover every row once
+    for fold in folds:
+        assert len(set(np.bincount(fold["y_train"]))) == 1
+    assert sorted(np.concatenate([fold["test_index"] for fold in folds])) == list(range(0, len(targets)))
+
+    for seed in range(1, cross_validation.smote_fold_cache_size + 2):
+        cross_validation.get_smote_folds(features, targets, k=3, seed=seed)
+    assert len(cross_validation.smote_fold_cache) == cross_validation.smote_fold_cache_size
+    assert cross_validation.get_smote_folds(features, targets, k=3)[1] is not folds
+
+def test_folds_round_trip_through_npz(tmp_path):
+    cross_validation.smote_fold_cache.clear()
+    features, targets = make_data()
+    folds = cross_validation.get_smote_folds(features, targets, k=3, cache_dir=str(tmp_path))[1]
+    assert len(list(tmp_path.glob("*.npz"))) == 1
+
+    cross_validation.smote_fold_cache.clear()
+    loaded_folds = cross_validation.get_smote_folds(features, targets, k=3, cache_dir=str(tmp_path))[1]
+    assert loaded_folds is not folds
+    for fold, loaded_fold in zip(folds, loaded_folds):
+        for name in ["X_train", "y_train", "test_index"]:
+            assert np.array_equal(fold[name], loaded_fold[name])
+
+def test_serial_and_parallel_give_the_same_results():
+    cross_validation.smote_fold_cache.clear()
+    features, targets = make_data()
+    model = DecisionTreeClassifier(random_state=0)
+    param_sets = [{"max_depth": 1}, {"max_depth": 3}]
+    serial = cross_validation.evaluate_with_smote(features, targets, model, param_sets, k=3, n_workers=1)
+    parallel = cross_validation.evaluate_with_smote(features, targets, model, param_sets, k=3, n_workers=2)
+    assert serial["results"].drop(columns="params").equals(parallel["results"].drop(columns="params"))
+    assert list(serial["results"]["params"]) == list(parallel["results"]["params"])
+    for serial_matrix, parallel_matrix in zip(serial["confusion_matrices"], parallel["confusion_matrices"]):
+        assert np.array_equal(serial_matrix, parallel_matrix)
+    # Every row is tested once per param set
+    assert serial["confusion_matrices"][0].sum() == len(targets)
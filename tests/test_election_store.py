@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+import election_core
+import share_changes
+from election_store import ElectionStore
+
+def make_store():
+    return ElectionStore(pd.DataFrame({
+        "ons_id": ["E1", "E2", "S1"],
+        "region_name": ["london", "london", "scotland"],
+        "2017_con": [20000, 15000, 9000],
+        "2017_lab": [18000, 21000, 8000],
+        "2017_valid_votes": [38000, 36000, 17000],
+        "2019_con": [21000, 14000, 9500],
+        "2019_lab": [17000, 22000, 7000],
+        "2019_valid_votes": [38000, 36000, 16500]
+    }), name="constits")
+
+def test_version_changes_when_the_frame_is_changed_in_place():
+    store = make_store()
+    version = store.version
+    assert store.version == version
+    store.df.loc[0, "2019_con"] = 30000
+    assert store.version != version
+
+def test_version_depends_on_contents_not_identity():
+    assert make_store().version == make_store().version
+    store = make_store()
+    assert store.filter(np.array([True, True, False])).version != store.version
+
+def test_share_tensor_is_rebuilt_after_an_in_place_change():
+    store = make_store()
+    before = share_changes.get_share_tensor(store).pedersen_volatility("2019", "2017", "national")
+    store.df.loc[2, "2019_con"] = 16500
+    store.df.loc[2, "2019_lab"] = 0
+    after = share_changes.get_share_tensor(store).pedersen_volatility("2019", "2017", "national")
+    assert after != before
+
+def test_vote_sums_are_done_in_float64():
+    # 20,000,001 can't be held exactly by float32
+    store = ElectionStore(pd.DataFrame({"2019_con": [10000000.0, 10000001.0], "2019_valid_votes": [10000000.0, 10000001.0]}))
+    assert store.df["2019_con"].dtype == np.float32
+    assert election_core.get_vote_column(store, "2019_con").sum() == 20000001
@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import election_core
+
+def baseline_estimate_individual_volatility(df, past_election_column, current_election_column, weight_column):
+    # The row by row loop utilities used before calculate_individual_volatility
+    df = df[~df[past_election_column].isin(["Didn't vote", "Don't know", " "])]
+    df = df[~df[current_election_column].isin(["Didn't vote", "Don't know", " "])]
+    total_weight = df[weight_column].sum()
+    total_weight_of_changers = 0
+    for index, row in df.iterrows():
+        if ((row[past_election_column] != row[current_election_column]) and (float(row[weight_column] > 0))):
+            total_weight_of_changers = total_weight_of_changers + row[weight_column]
+    return 100*total_weight_of_changers/total_weight
+
+def make_bes_df(no_respondents=1000, seed=0):
+    rng = np.random.default_rng(seed)
+    answers = np.array(["Conservative", "Labour", "Liberal Democrat", "Green Party", "Didn't vote", "Don't know", " "], dtype=object)
+    weights = rng.uniform(0.2, 3, no_respondents)
+    weights[rng.random(no_respondents) < 0.1] = np.nan
+    weights[rng.random(no_respondents) < 0.1] = 0
+    return pd.DataFrame({
+        "p_past_vote_2017": rng.choice(answers, no_respondents),
+        "p_past_vote_2019": rng.choice(answers, no_respondents),
+        "country": rng.choice(["England", "Scotland", "Wales"], no_respondents),
+        "wt": weights
+    })
+
+def test_matches_baseline_with_missing_and_zero_weights():
+    bes_df = make_bes_df()
+    expected = baseline_estimate_individual_volatility(bes_df, "p_past_vote_2017", "p_past_vote_2019", "wt")
+    assert np.isclose(election_core.estimate_individual_volatility(bes_df, "p_past_vote_2017", "p_past_vote_2019", "wt"), expected)
+
+def test_missing_and_zero_weights_are_not_counted_as_respondents():
+    bes_df = make_bes_df()
+    results = election_core.calculate_individual_volatility(bes_df, [("p_past_vote_2017", "p_past_vote_2019")], "wt")
+    included = (~bes_df["p_past_vote_2017"].isin(election_core.individual_volatility_dont_include)
+        & ~bes_df["p_past_vote_2019"].isin(election_core.individual_volatility_dont_include) & (bes_df["wt"] > 0))
+    assert results["respondents"].values[0] == included.sum()
+    assert np.isclose(results["total_weight"].values[0], bes_df.loc[included, "wt"].sum())
+
+def test_groups_match_baseline_on_each_group():
+    bes_df = make_bes_df()
+    results = election_core.calculate_individual_volatility(bes_df, [("p_past_vote_2017", "p_past_vote_2019")], "wt", group_by="country")
+    for country, volatility in zip(results["country"], results["volatility"]):
+        expected = baseline_estimate_individual_volatility(bes_df[bes_df["country"] == country], "p_past_vote_2017", "p_past_vote_2019", "wt")
+        assert np.isclose(volatility, expected)
+
+def test_missing_answers_are_left_out():
+    # The old loop counted a missing answer as a switch
+    bes_df = pd.DataFrame({
+        "p_past_vote_2017": ["Labour", "Labour", np.nan],
+        "p_past_vote_2019": ["Labour", "Conservative", "Labour"],
+        "wt": [1.0, 1.0, 2.0]
+    })
+    assert election_core.estimate_individual_volatility(bes_df, "p_past_vote_2017", "p_past_vote_2019", "wt") == 50
+    assert baseline_estimate_individual_volatility(bes_df, "p_past_vote_2017", "p_past_vote_2019", "wt") == 75
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+import model_scoring
+import election_core
+
+class LabelModel:
+    # A classifier with no predict_proba, trained on float coded classes
+    classes_ = np.array([0.0, 1.0, 2.0])
+
+    def predict(self, features):
+        return np.asarray(features)[:, 0] % 3
+
+class SigmoidModel:
+    def __init__(self, flat):
+        self.flat = flat
+
+    def predict(self, features):
+        positive = 1/(1 + np.exp(-np.asarray(features)[:, 0]))
+        return positive if self.flat else positive[:, np.newaxis]
+
+features = np.arange(12, dtype=float).reshape(6, 2)
+
+def test_float_labels_are_label_encoded():
+    probabilities = model_scoring.predict_probabilities(LabelModel(), features, n_workers=1)
+    assert probabilities.shape == (6, 3)
+    assert (probabilities.sum(axis=1) == 1).all()
+    codes, predictions = model_scoring.decode_predictions(probabilities, LabelModel.classes_)
+    assert list(predictions) == list(features[:, 0] % 3)
+
+def test_float_labels_can_be_reordered_to_parties():
+    probabilities = model_scoring.predict_probabilities(LabelModel(), features, n_workers=1)
+    probabilities = probabilities[:, model_scoring.encode_labels([2.0, 0.0, 1.0], LabelModel.classes_)]
+    df = model_scoring.aggregate_constit_predictions(probabilities, ["E1", "E1", "E1", "E2", "E2", "E2"], np.ones(6), ["ld", "con", "lab"])
+    assert list(df["predicted_valid_votes"]) == [3, 3]
+    assert list(df["predicted_con"]) == [1, 1]
+
+@pytest.mark.parametrize("flat", [True, False])
+def test_sigmoid_outputs(flat):
+    probabilities = model_scoring.predict_probabilities(SigmoidModel(flat), features - 5, labels=["con", "lab"], n_workers=1)
+    assert np.allclose(probabilities[:, 1], 1/(1 + np.exp(-(features[:, 0] - 5))))
+    assert np.allclose(probabilities.sum(axis=1), 1)
+
+def test_label_only_model_needs_labels():
+    class NoClassesModel:
+        def predict(self, features):
+            return np.asarray(features)[:, 0] % 3
+    with pytest.raises(Exception):
+        model_scoring.predict_probabilities(NoClassesModel(), features, n_workers=1)
+
+def test_winners_match_calculate_constit_winners():
+    rng = np.random.default_rng(0)
+    probabilities = rng.dirichlet(np.ones(3), size=40)
+    cell_constits = np.repeat(["E1", "E2", "E3", "E4"], 10)
+    df = model_scoring.aggregate_constit_predictions(probabilities, cell_constits, rng.random(40), ["con", "lab", "ld"])
+    winners = df.apply(election_core.calculate_constit_winners, axis=1, args=("predicted", ["con", "lab", "ld"]))
+    assert (winners == df["predicted_first_party"]).all()
+    assert np.allclose(df[["predicted_con_share", "predicted_lab_share", "predicted_ld_share"]].sum(axis=1), 100)
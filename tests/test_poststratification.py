@@ -0,0 +1,66 @@
+import numpy as np
+import poststratification
+
+def make_trace(no_draws=7, no_parties=3, no_constits=5, seed=0):
+    # A plain dict of draws, no sampler needed. Constituency 3 has no cells.
+    rng = np.random.default_rng(seed)
+    cell_constits = np.array([0, 0, 1, 1, 1, 2, 4, 4, 0, 2])
+    trace = {
+        "intercept": rng.normal(size=(no_draws, no_parties)),
+        "age": rng.normal(size=(no_draws, 4, no_parties)),
+        "sex": rng.normal(size=(no_draws, 2, no_parties)),
+        "incumbent": rng.normal(size=(no_draws, 3, no_parties)),
+        "l2_coeffs": rng.normal(size=(no_draws, 2, no_parties))
+    }
+    return {
+        "trace": trace,
+        "cell_constits": cell_constits,
+        "cell_weights": rng.random(len(cell_constits)),
+        "cell_effects": {"age": rng.integers(0, 4, len(cell_constits)), "sex": rng.integers(0, 2, len(cell_constits))},
+        "intercept": "intercept",
+        "constit_effects": {"incumbent": rng.integers(0, 3, no_constits)},
+        "constit_slopes": {"l2_coeffs": rng.random((no_constits, 2))},
+        "constit_electorates": rng.integers(50000, 80000, no_constits)
+    }
+
+def brute_force_votes(inputs):
+    trace = inputs["trace"]
+    no_draws, no_parties = trace["intercept"].shape
+    no_constits = len(inputs["constit_electorates"])
+    votes = np.zeros((no_draws, no_constits, no_parties))
+    for draw in range(0, no_draws):
+        for cell in range(0, len(inputs["cell_constits"])):
+            constit = inputs["cell_constits"][cell]
+            prediction = (trace["intercept"][draw]
+                + trace["age"][draw, inputs["cell_effects"]["age"][cell]]
+                + trace["sex"][draw, inputs["cell_effects"]["sex"][cell]]
+                + trace["incumbent"][draw, inputs["constit_effects"]["incumbent"][constit]]
+                + inputs["constit_slopes"]["l2_coeffs"][constit] @ trace["l2_coeffs"][draw])
+            probabilities = np.exp(prediction)/np.exp(prediction).sum()
+            votes[draw, constit] += inputs["cell_weights"][cell]*inputs["constit_electorates"][constit]*probabilities
+    return votes
+
+def test_matches_brute_force_weighted_sum():
+    inputs = make_trace()
+    expected = brute_force_votes(inputs)
+    # Tiny chunks so the draws and constituencies are split over several blocks
+    for draw_chunk_size, max_chunk_elements in [(100, 2000000), (3, 20), (2, 1)]:
+        results = poststratification.poststratify(draw_chunk_size=draw_chunk_size, max_chunk_elements=max_chunk_elements, **inputs)
+        assert np.allclose(results["votes"], expected)
+        assert (results["winners"][:, 3] == -1).all()
+        has_cells = [0, 1, 2, 4]
+        assert (results["winners"][:, has_cells] == expected[:, has_cells].argmax(axis=-1)).all()
+        assert np.allclose(results["shares"][:, has_cells].sum(axis=-1), 1)
+
+def test_last_constituency_without_cells():
+    inputs = make_trace(no_constits=6)
+    expected = brute_force_votes(inputs)
+    results = poststratification.poststratify(**inputs)
+    assert results["votes"].shape == expected.shape
+    assert np.allclose(results["votes"], expected)
+    assert (results["winners"][:, [3, 5]] == -1).all()
+
+    # Without electorates the constituency effects give the number of constituencies
+    del inputs["constit_electorates"]
+    results = poststratification.poststratify(**inputs)
+    assert results["votes"].shape[1] == 6
@@ -0,0 +1,39 @@
+import os
+import sys
+import json
+import subprocess
+import pandas as pd
+import election_core
+import utilities
+import profiling
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def make_constits_df():
+    return pd.DataFrame({"2019_con": [100.0, 300.0], "2019_lab": [200.0, 100.0], "2019_valid_votes": [300.0, 400.0]})
+
+def test_functions_are_restored_after_profiling():
+    originals = {name: function for name, function in vars(election_core).items() if callable(function)}
+    utilities_original = utilities.calculate_constit_results
+    with profiling.profile(memory=False) as profiler:
+        assert election_core.calculate_constit_results is not originals["calculate_constit_results"]
+        assert utilities.calculate_constit_results.profiled
+        utilities.calculate_constit_results(make_constits_df(), ["2019"])
+    assert {name: function for name, function in vars(election_core).items() if callable(function)} == originals
+    assert utilities.calculate_constit_results is utilities_original
+    rows = [row for row in profiler.summary() if row["function"] == "election_core.calculate_constit_results"]
+    assert (len(rows) == 1) and (rows[0]["calls"] == 1) and (rows[0]["rows"] == 2)
+
+def test_profiling_leaves_plotting_modules_unloaded():
+    check = "import sys, profiling\nprofiling.profile(memory=False).start()\nprint('matplotlib' in sys.modules)"
+    assert subprocess.run([sys.executable, "-c", check], cwd=repo_dir, capture_output=True, text=True, check=True).stdout.strip() == "False"
+
+def test_environment_variable_profiles_the_run(tmp_path):
+    output_path = str(tmp_path / "profile.json")
+    env = dict(os.environ, ELECTIONS_PROFILE="nomemory", ELECTIONS_PROFILE_OUTPUT=output_path)
+    run = "import pandas as pd, utilities\nutilities.calculate_constit_results(pd.DataFrame({'2019_con': [1.0], '2019_valid_votes': [1.0]}), ['2019'])"
+    output = subprocess.run([sys.executable, "-c", run], cwd=repo_dir, env=env, capture_output=True, text=True, check=True).stdout
+    assert "Profile saved to " + output_path in output
+    with open(output_path) as json_file:
+        summary = json.load(json_file)["summary"]
+    assert "election_core.calculate_constit_results" in [row["function"] for row in summary]
@@ -0,0 +1,117 @@
+import json
+import asyncio
+import numpy as np
+import pandas as pd
+import query_service
+
+def make_constits_df():
+    df = pd.DataFrame({
+        "ons_id": ["E1", "E2", "W1", "S1"],
+        "constituency_name": ["Bath", "Durham, City of", "Cardiff Central", "Edinburgh North and Leith"],
+        "region_name": ["south west", "north east", "wales", "scotland"],
+        "country_name": ["england", "england", "wales", "scotland"],
+        "2015_con": [15000.0, 8000.0, 5000.0, 9000.0],
+        "2015_lab": [5000.0, 20000.0, 14000.0, 16000.0],
+        "2015_ld": [16000.0, 3000.0, 15000.0, 1000.0],
+        "2017_con": [20000.0, 9000.0, 6000.0, 12000.0],
+        "2017_lab": [6000.0, 25000.0, 25000.0, 20000.0],
+        "2017_ld": [21000.0, 2000.0, 4000.0, 2000.0]
+    })
+    for year in ["2015", "2017"]:
+        df[year + "_valid_votes"] = df[[year + "_con", year + "_lab", year + "_ld"]].sum(axis=1)
+    # The speaker's seat and the 2015 margins are in the data as they are rather than worked out from the votes
+    df["2017_first_party"] = ["ld", "lab", "lab", "spk"]
+    df["2015_margin"] = [1.5, 50.0, 2.0, 30.0]
+    return df
+
+class FakeWriter:
+    def __init__(self):
+        self.data = b""
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+def request(service, target):
+    # Returns (status, body) for a GET as it comes back over the connection
+    async def send():
+        reader = asyncio.StreamReader()
+        reader.feed_data(("GET " + target + " HTTP/1.1\r\nHost: localhost\r\n\r\n").encode())
+        reader.feed_eof()
+        writer = FakeWriter()
+        await service.handle_connection(reader, writer)
+        return writer.data
+    header, body = asyncio.run(send()).split(b"\r\n\r\n", 1)
+    return int(header.split(b" ")[1]), body
+
+def test_existing_result_columns_are_kept():
+    index = query_service.ConstituencyIndex(make_constits_df())
+    assert list(index.frame["2017_first_party"]) == ["ld", "lab", "lab", "spk"]
+    assert list(index.frame["2015_first_party"]) == ["ld", "lab", "ld", "lab"]
+    assert list(index.frame["2015_margin"]) == [1.5, 50.0, 2.0, 30.0]
+    # Columns that aren't in the data are added
+    assert list(index.frame["2017_second_party"]) == ["con", "con", "con", "con"]
+    assert list(index.frame["2017_majority"]) == [1000, 16000, 19000, 8000]
+
+def test_constituency_endpoint():
+    service = query_service.QueryService(make_constits_df())
+    status, body = request(service, "/constituency/City%20of%20Durham?year=2017")
+    assert status == 200
+    records = json.loads(body)
+    assert (len(records) == 1) and (records[0]["ons_id"] == "E2")
+    assert (records[0]["2017_first_party"] == "lab") and (records[0]["2017_majority"] == 16000)
+    assert [record["ons_id"] for record in json.loads(request(service, "/constituency/W1")[1])] == ["W1"]
+    assert request(service, "/constituency/Nowhere")[0] == 404
+    assert request(service, "/constituency/W1?year=1066")[0] == 400
+
+def test_filter_endpoint():
+    service = query_service.QueryService(make_constits_df())
+    status, body = request(service, "/filter?year=2017&winner=lab&previous_winner=ld")
+    assert status == 200
+    content = json.loads(body)
+    assert content["count"] == 1
+    assert content["constituencies"][0]["ons_id"] == "W1"
+    assert content["constituencies"][0]["2015_first_party"] == "ld"
+    assert json.loads(request(service, "/filter?region=scotland")[1])["count"] == 1
+    assert request(service, "/filter?year=2015&previous_winner=con")[0] == 400
+    assert request(service, "/filter?winner=lab")[0] == 400
+
+def test_aggregate_endpoint():
+    service = query_service.QueryService(make_constits_df())
+    content = json.loads(request(service, "/aggregate?year=2017&group_by=country")[1])
+    assert content == {"count": 4, "seats": {"england": {"lab": 1, "ld": 1}, "scotland": {"spk": 1}, "wales": {"lab": 1}}}
+    content = json.loads(request(service, "/aggregate?year=2015&group_by=none&region=wales")[1])
+    assert content == {"count": 1, "seats": {"ld": 1}}
+    assert request(service, "/aggregate?group_by=region")[0] == 400
+    assert request(service, "/aggregate?year=2017&group_by=ward")[0] == 400
+
+def test_bad_map_limits_are_rejected():
+    service = query_service.QueryService(make_constits_df())
+    status, body = request(service, "/map?column=2017_margin&min=low&max=10")
+    assert status == 400
+    assert json.loads(body)["error"] == "min low not recognised"
+    # Rejected before any renderers are started
+    assert service.render_pool is None
+
+def test_answers_are_cached():
+    service = query_service.QueryService(make_constits_df(), cache_size=2)
+    for target in ["/constituency/E1", "/constituency/E1", "/filter?year=2015", "/constituency/E2", "/constituency/E1"]:
+        assert request(service, target)[0] == 200
+    # E1 is answered, then found, then pushed out by the other two
+    assert (service.cache.hits == 1) and (service.cache.misses == 4)
+    assert len(service.cache.items) == 2
+
+def test_lru_cache_evicts_the_least_recently_used():
+    cache = query_service.LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a") == 1) and (cache.get("c") == 3)
+    assert (cache.hits == 3) and (cache.misses == 1)
@@ -0,0 +1,26 @@
+import warnings
+import numpy as np
+import pandas as pd
+import seat_projection
+
+def make_constits_df():
+    # The last seat is the Speaker's, none of the parties stood there
+    return pd.DataFrame({
+        "ons_id": ["E1", "E2", "E3", "E4", "E5"],
+        "region_name": ["london", "london", "north", "north", "north"],
+        "2019_con": [20000, 15000, 9000, 16000, np.nan],
+        "2019_lab": [18000, 21000, 19000, 12000, np.nan],
+        "2019_ld": [5000, 3000, 4000, 12000, np.nan],
+        "2019_valid_votes": [43000, 39000, 32000, 40000, 30000]
+    })
+
+def test_uncontested_seats_have_no_winner_or_tipping_point():
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", RuntimeWarning)
+        results = seat_projection.project_seats(make_constits_df(), "2019", {"con": 40, "lab": 40, "ld": 20}, parties=["con", "lab", "ld"], no_simulations=400, batch_size=100, n_workers=1, seed=0)
+    assert (results["win_probabilities"].loc["E5"] == 0).all()
+    assert (results["tipping_points"].loc["E5"] == 0).all()
+    assert np.allclose(results["win_probabilities"].drop("E5").sum(axis=1), 1)
+    assert np.allclose(results["tipping_points"].sum(axis=0), 1)
+    # The four contested seats are shared out in every simulation
+    assert np.isclose(results["summary"]["expected_seats"].sum(), 4)
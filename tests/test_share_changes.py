@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import election_core
+import share_changes
+from election_store import ElectionStore
+
+parties = ["con", "lab", "snp", "pc"]
+
+def make_constits_df():
+    # pc only stands in Wales and snp only in Scotland
+    rng = np.random.default_rng(1)
+    region_names = np.array(["scotland"]*6 + ["wales"]*4)
+    df = pd.DataFrame({"ons_id": ["C" + str(constit_no) for constit_no in range(0, 10)], "region_name": region_names})
+    for year in ["2015", "2017", "2019"]:
+        for party in parties:
+            votes = rng.integers(1000, 20000, 10).astype(float)
+            if (party == "pc"):
+                votes[region_names == "scotland"] = np.nan
+            if (party == "snp"):
+                votes[region_names == "wales"] = np.nan
+            df[year + "_" + party] = votes
+        df[year + "_valid_votes"] = df[[year + "_" + party for party in parties]].sum(axis=1) + 500
+    return df
+
+def test_share_change_df_matches_calculate_share_change():
+    df = make_constits_df()
+    share_tensor = share_changes.ShareTensor(df)
+    for year, compare_year in [("2019", "2017"), ("2019", "2015"), ("2015", "2019")]:
+        share_change_df = share_tensor.share_change_df(year, compare_year)
+        for party in parties:
+            expected = df.apply(election_core.calculate_share_change, axis=1, args=(year, compare_year, party))
+            pd.testing.assert_series_equal(share_change_df[year + "_" + party + "_share_change"], expected, check_names=False)
+
+def test_pedersen_volatility_matches_calculate_net_volatility():
+    df = make_constits_df()
+    share_tensor = share_changes.ShareTensor(df)
+    for year, compare_year in [("2019", "2017"), ("2017", "2015"), ("2015", "2019")]:
+        assert np.isclose(share_tensor.pedersen_volatility(year, compare_year, "national"), election_core.calculate_net_volatility(df, compare_year, year))
+        region_volatility = share_tensor.pedersen_volatility(year, compare_year, "region")
+        for region_name in ["scotland", "wales"]:
+            region_df = df[df["region_name"] == region_name]
+            assert np.isclose(region_volatility[region_name], election_core.calculate_net_volatility(region_df, compare_year, year))
+        # Each constituency on its own is the same as its national figure
+        constit_volatility = share_tensor.pedersen_volatility(year, compare_year)
+        for row_no in [0, 9]:
+            assert np.isclose(constit_volatility.iloc[row_no], election_core.calculate_net_volatility(df.iloc[[row_no]], compare_year, year))
+
+def test_parties_with_a_column_stood_in_every_frame():
+    df = make_constits_df()
+    scotland_df = df[df["region_name"] == "scotland"]
+    share_tensor = share_changes.ShareTensor(scotland_df)
+    assert share_tensor.has_column.all()
+    assert np.isclose(share_tensor.pedersen_volatility("2019", "2017", "national"), election_core.calculate_net_volatility(scotland_df, "2017", "2019"))
+
+def test_share_tensor_cache_is_bounded():
+    store = ElectionStore(make_constits_df())
+    share_tensor = share_changes.get_share_tensor(store)
+    assert share_changes.get_share_tensor(store) is share_tensor
+    for tensor_no in range(0, share_changes.share_tensor_cache_size + 5):
+        share_changes.get_share_tensor(store, region_column="region " + str(tensor_no))
+    assert len(share_changes.share_tensor_cache) == share_changes.share_tensor_cache_size
+    assert share_changes.get_share_tensor(store) is not share_tensor
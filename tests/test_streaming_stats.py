@@ -0,0 +1,119 @@
+import io
+import contextlib
+import numpy as np
+import pandas as pd
+import election_core
+import streaming_stats
+
+def baseline_print_descriptive_summary_statistics(column):
+    # The old print_descriptive_summary_statistics, kept here as the reference
+    print("Min:    " + str(column.min()))
+    print("Q1:     " + str(column.quantile([0.25]).values[0]))
+    print("Median: " + str(column.median()))
+    print("Q3:     " + str(column.quantile([0.75]).values[0]))
+    print("Max:    " + str(column.max()))
+    print("Mean:   " + str(column.mean()))
+    print("Mode:   " + str(column.mode().values[0]))
+    print("SD:     " + str(column.std()))
+    print("Skew:   " + str(column.skew()))
+    print("Kurto:  " + str(column.kurtosis()))
+
+def get_moments(values):
+    deviations = values - values.mean()
+    return np.array([len(values), values.mean(), (deviations**2).sum(), (deviations**3).sum(), (deviations**4).sum(), values.min(), values.max()])
+
+def expected_stats(values):
+    values = pd.Series(values, dtype=float)
+    return {
+        "count": len(values), "min": values.min(), "q1": values.quantile(0.25), "median": values.median(), "q3": values.quantile(0.75),
+        "max": values.max(), "mean": values.mean(), "mode": values.mode().values[0], "sd": values.std(), "skew": values.skew(), "kurtosis": values.kurtosis()
+    }
+
+def test_merged_moments_match_the_whole_array():
+    rng = np.random.default_rng(0)
+    values = rng.gamma(2, 3, 1000)
+    merged = np.zeros(7)
+    # Uneven pieces, including an empty one
+    for piece in np.split(values, [0, 10, 11, 400, 999]):
+        merged = streaming_stats.merge_moments(merged, get_moments(piece) if len(piece) > 0 else np.zeros(7))
+    assert np.allclose(merged, get_moments(values))
+
+def test_bucketed_counts_stay_within_the_relative_accuracy():
+    rng = np.random.default_rng(1)
+    values = np.r_[rng.lognormal(2, 1, 5000), -rng.lognormal(0, 1, 500), np.zeros(20)]
+    bucketed = streaming_stats.bucket_values(values, 0.01)
+    assert (np.abs(bucketed - values) <= 0.01*np.abs(values) + 1e-12).all()
+    assert (bucketed[values == 0] == 0).all()
+
+    stats = streaming_stats.StreamingStats(["x"], max_exact_values=100, relative_accuracy=0.01)
+    for chunk in np.array_split(values, 7):
+        stats.update(pd.Series(chunk))
+    assert len(stats.value_counts[("x", None)]) < len(values)
+    assert sum(stats.value_counts[("x", None)].values()) == len(values)
+    result = stats.get_stats(("x", None))
+    expected = expected_stats(values)
+    assert result["approximate_quantiles"]
+    for stat_name in ["q1", "median", "q3"]:
+        assert abs(result[stat_name] - expected[stat_name]) <= 0.01*abs(expected[stat_name])
+    # The moments aren't bucketed
+    for stat_name in ["count", "min", "max", "mean", "sd", "skew", "kurtosis"]:
+        assert np.isclose(result[stat_name], expected[stat_name])
+
+def make_survey_csv(tmp_path, no_rows=503):
+    # Survey style answers with invalid codes and a quoted free text column that has commas and line breaks in it
+    rng = np.random.default_rng(2)
+    df = pd.DataFrame({
+        "id": np.arange(no_rows),
+        "country": rng.choice(["England", "Scotland", "Wales"], no_rows),
+        "lr": rng.choice(["0", "1", "2", "5", "9", "10", "Don't know"], no_rows),
+        "age": rng.integers(18, 90, no_rows),
+        "comment": rng.choice(["fine", "not sure, really", "two\nlines", 'said "no"'], no_rows)
+    })
+    csv_path = str(tmp_path / "survey.csv")
+    df.to_csv(csv_path, index=False)
+    return df, csv_path
+
+def test_describe_csv_matches_pandas_groupby(tmp_path):
+    df, csv_path = make_survey_csv(tmp_path)
+    df["lr"] = pd.to_numeric(df["lr"].mask(df["lr"] == "Don't know"))
+    results = [streaming_stats.describe_csv(csv_path, ["lr", "age"], "country", ["Don't know"], chunksize=50, n_workers=n_workers) for n_workers in [1, 3]]
+    for result in results:
+        assert len(result) == 6
+        for (country, values) in df.groupby("country"):
+            for col in ["lr", "age"]:
+                row = result[(result["column"] == col) & (result["country"] == country)].iloc[0]
+                for stat_name, value in expected_stats(values[col].dropna()).items():
+                    assert np.isclose(row[stat_name], value), (col, country, stat_name)
+    # The byte ranges split the file on the same rows as the chunked reader, so the results are the same
+    pd.testing.assert_frame_equal(results[0].sort_values(["column", "country"]).reset_index(drop=True), results[1].sort_values(["column", "country"]).reset_index(drop=True))
+
+def test_byte_ranges_cover_every_row_once(tmp_path):
+    df, csv_path = make_survey_csv(tmp_path)
+    byte_ranges = streaming_stats.get_chunk_byte_ranges(csv_path, 50, block_size=64)
+    assert len(byte_ranges) == 11
+    ids = []
+    for args in byte_ranges:
+        stats = streaming_stats.summarise_byte_range((csv_path,) + args + (list(df.columns), ["id"], {"columns": ["id"]}))
+        assert stats.moments[("id", None)][0] <= 50
+        ids.extend(stats.value_counts[("id", None)].keys())
+    assert sorted(ids) == list(range(0, len(df)))
+
+def capture(function, *args):
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        function(*args)
+    return output.getvalue()
+
+def test_printed_summary_matches_baseline():
+    rng = np.random.default_rng(3)
+    for column in [pd.Series(rng.integers(0, 11, 1001)), pd.Series(rng.normal(50, 10, 1000)), pd.Series([1.0, np.nan, 4.0, 4.0, 2.0])]:
+        expected_lines = capture(baseline_print_descriptive_summary_statistics, column).splitlines()
+        lines = capture(election_core.print_descriptive_summary_statistics, column).splitlines()
+        assert len(lines) == len(expected_lines)
+        for line, expected_line in zip(lines, expected_lines):
+            # Labels, quantiles, min, max and mode print exactly the same, the moments to rounding
+            assert line[:8] == expected_line[:8]
+            if (line[:8] in ["Mean:   ", "SD:     ", "Skew:   ", "Kurto:  "]):
+                assert np.isclose(float(line[8:]), float(expected_line[8:]))
+            else:
+                assert line == expected_line
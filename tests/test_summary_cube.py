@@ -0,0 +1,82 @@
+import io
+import contextlib
+import numpy as np
+import pandas as pd
+import election_core
+from election_store import ElectionStore
+
+def baseline_print_summary_election_result(df, year, compare_df, compare_year):
+    # The compared branch of the old print_summary_election_result, kept here as the reference
+    print("====================================================================================================")
+    print("=== " + year + " general election summary (compared with " + str(compare_year) + ")")
+    print("===================================================================================================")
+    if (df.shape[0] != compare_df.shape[0]):
+        print("(constituency changes occured, difference of " + '{0:+}'.format(df.shape[0] - compare_df.shape[0]) + ")")
+    print("\nSEATS WON: ")
+    seats_won_this_election = df[year + "_first_party"].value_counts()
+    seats_won_compare_election = compare_df[compare_year + "_first_party"].value_counts()
+    for party, seats in seats_won_this_election.items():
+        if (party in seats_won_compare_election.index):
+            print('{:10s}'.format(party) + str(seats) + " (" + '{0:+}'.format(seats - seats_won_compare_election.at[party]) + ")")
+        else:
+            print('{:10s}'.format(party) + str(seats))
+    print("\nVOTE SHARE:")
+    total_votes_this_election = pd.to_numeric(df[year + "_valid_votes"]).sum(skipna=True)
+    total_votes_last_election = pd.to_numeric(compare_df[compare_year + "_valid_votes"]).sum(skipna=True)
+    parties_this_election = election_core.get_election_parties(df, year)
+    parties_last_election = election_core.get_election_parties(compare_df, compare_year)
+    for party in parties_this_election:
+        party_share_this_election = 100*pd.to_numeric(df[year + "_" + party]).sum(skipna=True)/total_votes_this_election
+        if (party in parties_last_election):
+            party_share_last_election = 100*pd.to_numeric(compare_df[compare_year + "_" + party]).sum(skipna=True)/total_votes_last_election
+            print('{:10s}'.format(party) + str(round(party_share_this_election, 1)) + "% (" + '{0:+}'.format(round(party_share_this_election - party_share_last_election, 1)) + "%)")
+        else:
+            print('{:10s}'.format(party) + str(round(party_share_this_election, 1)) + "%")
+    print()
+
+def make_constits_df():
+    # pc only stands in Wales, and in Scotland lab and snp tie on seats in 2019
+    rng = np.random.default_rng(0)
+    region_names = np.array(["scotland"]*6 + ["wales"]*4)
+    df = pd.DataFrame({"ons_id": ["C" + str(constit_no) for constit_no in range(0, 10)], "region_name": region_names})
+    for year in ["2017", "2019"]:
+        for party in ["con", "lab", "snp", "pc"]:
+            votes = rng.integers(1000, 20000, 10).astype(float)
+            if (party == "pc"):
+                votes[region_names == "scotland"] = np.nan
+            if (party == "snp"):
+                votes[region_names == "wales"] = np.nan
+            df[year + "_" + party] = votes
+        df[year + "_valid_votes"] = df[[year + "_" + party for party in ["con", "lab", "snp", "pc"]]].sum(axis=1)
+    df["2019_first_party"] = ["snp", "lab", "snp", "lab", "con", "con", "pc", "lab", "pc", "con"]
+    df["2017_first_party"] = ["snp", "snp", "snp", "lab", "con", "lab", "pc", "lab", "con", "con"]
+    return df
+
+def capture(function, *args):
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        function(*args)
+    return output.getvalue()
+
+def test_printed_summary_matches_baseline_on_region_frames():
+    df = make_constits_df()
+    for region_df in [df, df[df["region_name"] == "scotland"], df[df["region_name"] == "wales"]]:
+        expected = capture(baseline_print_summary_election_result, region_df, "2019", region_df, "2017")
+        assert capture(election_core.print_summary_election_result, region_df, "2019", region_df, "2017") == expected
+    assert "pc        0.0% (+0.0%)" in capture(election_core.print_summary_election_result, df[df["region_name"] == "scotland"], "2019", df[df["region_name"] == "scotland"], "2017")
+
+def test_compare_summary_years_matches_a_two_year_cube():
+    df = make_constits_df()
+    for col in ["2015_con", "2015_lab", "2015_snp", "2015_pc", "2015_valid_votes", "2015_first_party"]:
+        df[col] = df[col.replace("2015", "2017")]
+    cube_df = election_core.calculate_election_summary_cube(df, ["2015", "2017", "2019"])
+    compared_df = election_core.compare_summary_years(cube_df, "2019", "2015")
+    expected_df = election_core.calculate_election_summary_cube(df, ["2015", "2019"])
+    expected_df = expected_df[expected_df["year"] == "2019"].reset_index(drop=True)
+    pd.testing.assert_frame_equal(compared_df.reset_index(drop=True), expected_df[compared_df.columns], check_dtype=False)
+
+def test_summary_cube_cache_is_bounded():
+    store = ElectionStore(make_constits_df())
+    for cube_no in range(0, election_core.summary_cube_cache_size + 5):
+        election_core.calculate_election_summary_cube(store, ["2019"], {"uk": None, "copy " + str(cube_no): None})
+    assert len(election_core.summary_cube_cache) == election_core.summary_cube_cache_size
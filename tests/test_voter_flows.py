@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+import voter_flows
+
+parties = ["Conservative", "Labour", "Liberal Democrat"]
+dont_include = ["Don't know", "Did not vote"]
+
+def make_bes_df(no_respondents=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    answers = parties + ["Green Party", "Brexit Party", "Don't know", "Did not vote", np.nan]
+    weights = rng.uniform(0.2, 3, no_respondents)
+    weights[rng.random(no_respondents) < 0.05] = np.nan
+    return pd.DataFrame({
+        "p_past_vote_2017": rng.choice(np.array(answers, dtype=object), no_respondents),
+        "general_election_vote": rng.choice(np.array(answers, dtype=object), no_respondents),
+        "wt": weights
+    })
+
+def brute_force_flow_matrix(bes_df, other):
+    # The notebook's filtering, then a crosstab of the weights with anything outside parties lumped together
+    past = bes_df["p_past_vote_2017"]
+    current = bes_df["general_election_vote"]
+    bes_df = bes_df[~past.isin(dont_include) | ~current.isin(dont_include)]
+    if (not other):
+        bes_df = bes_df[bes_df["p_past_vote_2017"].isin(parties) & bes_df["general_election_vote"].isin(parties)]
+    labels = voter_flows.get_flow_labels(parties)
+    past = bes_df["p_past_vote_2017"].where(bes_df["p_past_vote_2017"].isin(parties), voter_flows.other_label)
+    current = bes_df["general_election_vote"].where(bes_df["general_election_vote"].isin(parties), voter_flows.other_label)
+    weights = bes_df["wt"].fillna(0)
+    flows = pd.crosstab(past, current, values=weights, aggfunc="sum").reindex(index=labels, columns=labels).fillna(0)
+    return 100*flows.values/weights.sum()
+
+@pytest.mark.parametrize("other", [True, False])
+def test_flow_matrix_matches_brute_force_crosstab(other):
+    bes_df = make_bes_df()
+    flow_matrix = voter_flows.calculate_voter_flow_matrix(bes_df, "p_past_vote_2017", "general_election_vote", "wt", parties, dont_include, other)
+    assert list(flow_matrix.index) == voter_flows.get_flow_labels(parties)
+    assert np.allclose(flow_matrix.values, brute_force_flow_matrix(bes_df, other))
+    assert np.isclose(flow_matrix.values.sum(), 100)
+    if (not other):
+        assert (flow_matrix.values[-1, :] == 0).all() and (flow_matrix.values[:, -1] == 0).all()
+
+def test_other_to_party_links_count_other_voters():
+    # The notebook version summed respondents who didn't vote for the party into the other to party links
+    bes_df = pd.DataFrame({
+        "p_past_vote_2017": ["Green Party", "Green Party", "Conservative"],
+        "general_election_vote": ["Labour", "Conservative", "Labour"],
+        "wt": [1.0, 3.0, 4.0]
+    })
+    flow_matrix = voter_flows.calculate_voter_flow_matrix(bes_df, "p_past_vote_2017", "general_election_vote", "wt", parties, dont_include)
+    assert flow_matrix.loc[voter_flows.other_label, "Labour"] == 100*1/8
+    assert flow_matrix.loc[voter_flows.other_label, "Conservative"] == 100*3/8
+
+@pytest.mark.parametrize("other", [True, False])
+def test_bootstrap_intervals_contain_the_point_estimate(other):
+    bes_df = make_bes_df()
+    flow_matrix = voter_flows.calculate_voter_flow_matrix(bes_df, "p_past_vote_2017", "general_election_vote", "wt", parties, dont_include, other)
+    lower, upper = voter_flows.bootstrap_voter_flow_intervals(bes_df, "p_past_vote_2017", "general_election_vote", "wt", parties, dont_include, other, n_bootstraps=300, seed=0)
+    assert (lower.values <= flow_matrix.values + 1e-9).all()
+    assert (upper.values >= flow_matrix.values - 1e-9).all()
+    assert (upper.values - lower.values)[flow_matrix.values > 1].min() > 0
@@ -1,10 +1,10 @@
-import utilities
+import voter_flows
+import profiling
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-from matplotlib.patches import RegularPolygon
-from matplotlib.collections import PatchCollection
-import plotly.graph_objects as go
+from matplotlib.patches import Patch
+from matplotlib.collections import PolyCollection
 
 ge_colour_map = {
     "con": "blue",
@@ -27,6 +27,81 @@ ge_colour_map = {
     "na": "white"
 }
 
+# Using regular hexagons to keep a nice format
+# Going to keep the regular hexagon with a width of 1 exactly, from this we can
+# then use then use sine to calculate the correct radius of the circle used to draw 
+# the hexagon
+hex_radius = 0.5 / np.sin(np.pi / 3)
+# Then use the radius and some more gemoetry to work out what the spacing on the y-axis will be
+hex_y_spacing = hex_radius + (hex_radius - 0.5/np.tan(np.pi/3))
+
+class HexLayout:
+    # The hex map geometry for every constituency. The vertices of all the hexagons are worked out once as a single
+    # (constituencies x 6 x 2) array so that maps can be drawn, and redrawn with new data, without rebuilding any shapes.
+    
+    def __init__(self, constit_hex_coords_df):
+        constit_hex_coords_df = constit_hex_coords_df.drop_duplicates("ons_id")
+        self.ons_ids = constit_hex_coords_df["ons_id"].values
+        self.q = constit_hex_coords_df["q"].values.astype(float)
+        self.r = constit_hex_coords_df["r"].values.astype(float)
+        
+        # Odd rows are shifted half a hexagon to the right
+        centre_x = self.q + 0.5*(self.r % 2 == 1)
+        centre_y = hex_y_spacing*self.r
+        self.centres = np.column_stack([centre_x, centre_y])
+        
+        # Same vertex ordering as matplotlib's RegularPolygon (pointy top)
+        angles = 2*np.pi*np.arange(6)/6 + np.pi/2
+        offsets = hex_radius*np.column_stack([np.cos(angles), np.sin(angles)])
+        self.vertices = self.centres[:, np.newaxis, :] + offsets[np.newaxis, :, :]
+    
+    def __len__(self):
+        return len(self.ons_ids)
+    
+    def align(self, constit_data_df, col_to_visualise):
+        # Returns the column's values in layout order along with a mask of which constituencies are in the data
+        constit_values = constit_data_df.drop_duplicates("ons_id").set_index("ons_id")[col_to_visualise]
+        present = pd.Index(constit_values.index).get_indexer(self.ons_ids) >= 0
+        return constit_values.reindex(self.ons_ids).values, present
+    
+    def create_collection(self, **kwargs):
+        return PolyCollection(self.vertices, closed=True, **kwargs)
+    
+    def set_discrete_colours(self, collection, values, present, constit_colour_map, default_colour="white"):
+        # Constituencies missing from the data are made fully transparent rather than removed so that the
+        # collection can be reused
+        face_colours = [constit_colour_map.get(value, default_colour) if is_present else "none" for value, is_present in zip(values, present)]
+        collection.set_array(None)
+        collection.set_facecolors(face_colours)
+        collection.set_edgecolors(np.where(present, "k", "none"))
+    
+    def set_continuous_values(self, collection, values, present):
+        values = pd.to_numeric(pd.Series(values), errors="coerce").values
+        collection.set_array(np.ma.masked_array(values, mask=(~present | np.isnan(values))))
+        collection.set_edgecolors(np.where(present, "k", "none"))
+    
+    def set_limits(self, ax, present):
+        if (not present.any()):
+            return
+        ax.set_xlim([self.q[present].min() - 1, self.q[present].max() + 1])
+        ax.set_ylim([(self.r[present]*hex_y_spacing).min() - 1, (self.r[present]*hex_y_spacing).max() + 1])
+
+hex_layout_cache = {}
+
+def get_hex_layout(constit_hex_coords_path="csvs/constit_hex_coords.csv"):
+    # The coordinates are only read from disk the first time a layout is asked for
+    if (constit_hex_coords_path not in hex_layout_cache):
+        hex_layout_cache[constit_hex_coords_path] = HexLayout(pd.read_csv(constit_hex_coords_path))
+    return hex_layout_cache[constit_hex_coords_path]
+
+def create_discrete_legend(ax, values, present, constit_colour_map, default_colour="white"):
+    legend_handles = []
+    legend_labels = []
+    for value in pd.unique(values[present]):
+        legend_handles.append(Patch(facecolor=constit_colour_map.get(value, default_colour), edgecolor="k"))
+        legend_labels.append(value)
+    ax.legend(legend_handles, legend_labels)
+
 # ToDo: error handling
 
 def create_discrete_constit_map(
@@ -36,65 +111,46 @@ def create_discrete_constit_map(
     title = None,
     title_params = {"fontsize": 20, "fontweight": 5},
     default_colour = "white",
-    constit_colour_map = ge_colour_map):
+    constit_colour_map = ge_colour_map,
+    hex_layout = None):
     
-        # Merge data
-        constit_hex_coords_df = pd.read_csv("csvs/constit_hex_coords.csv")
-        constit_data_df = pd.merge(constit_hex_coords_df, constit_data_df, on="ons_id")
-        # Could do some checking here and a filter
-        
-        # Do something with this
-        y_min = 1000
-        y_max = -1000
-        
-        # Create visualisation
-        # Using regular hexagons to keep a nice format
-        # Going to keep the regular hexagon with a width of 1 exactly, from this we can
-        # then use then use sine to calculate the correct radius of the circle used to draw 
-        # the hexagon
-        radius = 0.5 / np.sin(np.pi / 3)
-        # Then use the radius and some more gemoetry to work out what the spacing on the y-axis will be
-        y_spacing = radius + (radius - 0.5/np.tan(np.pi/3))
-        
-        constit_hexagons = []
-        legend_recorder = {}
+        if (hex_layout is None):
+            hex_layout = get_hex_layout()
+        constit_values, present = hex_layout.align(constit_data_df, col_to_visualise)
         
-        for index, row in constit_data_df.iterrows():
-            constit_x = row["q"]
-            constit_y = row["r"]
-            # Might have to do a speaker thing here
-            constit_value = row[col_to_visualise]
-            
-            if (constit_y % 2 == 1):
-                constit_x = constit_x + 0.5
-            constit_y = y_spacing * constit_y
-            
-            constit_colour = constit_colour_map.get(constit_value, default_colour)
-            constit_hexagon = RegularPolygon(
-                (constit_x, constit_y),
-                numVertices = 6,
-                radius = radius,
-                edgecolor = "k",
-                facecolor = constit_colour)
-            
-            constit_hexagons.append(constit_hexagon)
-            
-            if (legend_recorder.get(constit_value) == None):
-                legend_recorder[constit_value] = constit_hexagon
-        
-        collection = PatchCollection(constit_hexagons, match_original=True, alpha=1.0)
+        collection = hex_layout.create_collection(alpha=1.0)
+        hex_layout.set_discrete_colours(collection, constit_values, present, constit_colour_map, default_colour)
         ax.add_collection(collection)
         
         # Clean up and polish
         if title is not None:
             ax.set_title(title, fontdict=title_params)
-        ax.set_xlim([constit_data_df["q"].min() - 1, constit_data_df["q"].max() + 1])
-        ax.set_ylim([(constit_data_df["r"]*y_spacing).min() - 1, (constit_data_df["r"]*y_spacing).max() + 1])
-        ax.legend(legend_recorder.values(), legend_recorder.keys())
+        hex_layout.set_limits(ax, present)
+        create_discrete_legend(ax, constit_values, present, constit_colour_map, default_colour)
         ax.axis("off")
         
-        if (len(constit_hexagons) < 649):
-            print("Only " + str(len(constit_hexagons)) + " constituencies were animated")
+        if (present.sum() < 649):
+            print("Only " + str(present.sum()) + " constituencies were animated")
+        
+        return collection
+
+def recolour_discrete_constit_map(
+    collection,
+    constit_data_df,
+    col_to_visualise,
+    ax = None,
+    default_colour = "white",
+    constit_colour_map = ge_colour_map,
+    hex_layout = None):
+    
+        # Updates a map drawn by create_discrete_constit_map in place, e.g. for the next frame of an animation
+        if (hex_layout is None):
+            hex_layout = get_hex_layout()
+        constit_values, present = hex_layout.align(constit_data_df, col_to_visualise)
+        hex_layout.set_discrete_colours(collection, constit_values, present, constit_colour_map, default_colour)
+        if (ax is not None):
+            create_discrete_legend(ax, constit_values, present, constit_colour_map, default_colour)
+        return collection
 
 def create_continous_constit_map(
     constit_data_df,
@@ -105,56 +161,19 @@ def create_continous_constit_map(
     title_params = {"fontsize": 20, "fontweight": 5},
     colour_map = "PiYG",
     colour_bar_limits = None,
-    suppress_con_warning=True):
-        
-        # Merge data
-        constit_hex_coords_df = pd.read_csv("csvs/constit_hex_coords.csv")
-        constit_data_df = pd.merge(constit_hex_coords_df, constit_data_df, on="ons_id")
-        # Could do some checking here and a filter
+    suppress_con_warning=True,
+    hex_layout = None):
         
-        # Do something with this
-        y_min = 1000
-        y_max = -1000
+        if (hex_layout is None):
+            hex_layout = get_hex_layout()
+        constit_values, present = hex_layout.align(constit_data_df, col_to_visualise)
         
-        # Create visualisation
-        # Using regular hexagons to keep a nice format
-        # Going to keep the regular hexagon with a width of 1 exactly, from this we can
-        # then use then use sine to calculate the correct radius of the circle used to draw 
-        # the hexagon
-        radius = 0.5 / np.sin(np.pi / 3)
-        # Then use the radius and some more gemoetry to work out what the spacing on the y-axis will be
-        y_spacing = radius + (radius - 0.5/np.tan(np.pi/3))
-        
-        constit_hexagons = []
-        constit_colour_values = []
-        
-        for index, row in constit_data_df.iterrows():
-            constit_x = row["q"]
-            constit_y = row["r"]
-            # Might have to do a speaker thing here
-            constit_value = row[col_to_visualise]
-            if (constit_value == None):
-                constit_value = 0
-            
-            if (constit_y % 2 == 1):
-                constit_x = constit_x + 0.5
-            constit_y = y_spacing * constit_y
-            
-            constit_hexagon = RegularPolygon(
-                (constit_x, constit_y),
-                numVertices = 6,
-                radius = radius,
-                edgecolor = "k")
-            
-            constit_hexagons.append(constit_hexagon)
-            constit_colour_values.append(constit_value)
-        
-        collection = PatchCollection(constit_hexagons, cmap=plt.get_cmap(colour_map), alpha=1.0)
-        collection.set_array(np.array(constit_colour_values))
+        collection = hex_layout.create_collection(cmap=plt.get_cmap(colour_map), alpha=1.0)
+        hex_layout.set_continuous_values(collection, constit_values, present)
         
         # ToDo: something smarter with the colour bar and symmetrical colouring
         if (colour_bar_limits == None):
-            collection.set_clim(np.min(constit_colour_values), np.max(constit_colour_values))
+            collection.set_clim(collection.get_array().min(), collection.get_array().max())
         else:
             collection.set_clim(colour_bar_limits[0], colour_bar_limits[1])
         
@@ -164,59 +183,56 @@ def create_continous_constit_map(
         # Clean up and polish
         if title is not None:
             ax.set_title(title, fontdict=title_params)
-        ax.set_xlim([constit_data_df["q"].min() - 1, constit_data_df["q"].max() + 1])
-        ax.set_ylim([(constit_data_df["r"]*y_spacing).min() - 1, (constit_data_df["r"]*y_spacing).max() + 1])
+        hex_layout.set_limits(ax, present)
         ax.axis("off")
         
-        if ((len(constit_hexagons) < 649) and (not suppress_con_warning)):
-            print("Only " + str(len(constit_hexagons)) + " constituencies were animated")
+        if ((present.sum() < 649) and (not suppress_con_warning)):
+            print("Only " + str(present.sum()) + " constituencies were animated")
         
-def create_voter_flow_diagram(bes_df, past_election_column, current_election_column, weight_column, parties, party_colours, dont_include, title, other=True):
-    bes_df = bes_df[~(bes_df[past_election_column].isin(dont_include)) | ~(bes_df[current_election_column].isin(dont_include))]
-    
-    if (not other):
-        bes_df = bes_df[(bes_df[past_election_column].isin(parties)) & (bes_df[current_election_column].isin(parties))]
+        return collection
+
+def recolour_continous_constit_map(
+    collection,
+    constit_data_df,
+    col_to_visualise,
+    colour_bar_limits = None,
+    hex_layout = None):
     
-    sankey_total_weight = bes_df[weight_column].sum()
+        # Updates a map drawn by create_continous_constit_map in place. The colour bar follows the collection so
+        # it's updated too.
+        if (hex_layout is None):
+            hex_layout = get_hex_layout()
+        constit_values, present = hex_layout.align(constit_data_df, col_to_visualise)
+        hex_layout.set_continuous_values(collection, constit_values, present)
+        if (colour_bar_limits is not None):
+            collection.set_clim(colour_bar_limits[0], colour_bar_limits[1])
+        return collection
         
-    total_no_parties = len(parties)
-    
-    source = []
-    target = []
-    value = []
-    
-    # parties
-    for party_past_election_no in range(0, total_no_parties):
-        for party_current_election_no in  range(0, total_no_parties):
-            filtered_df = bes_df[
-                (bes_df[past_election_column] == parties[party_past_election_no]) 
-                & (bes_df[current_election_column] == parties[party_current_election_no])]
-            source.append(party_past_election_no)
-            target.append(total_no_parties + party_current_election_no)
-            value.append(100*filtered_df[weight_column].sum()/sankey_total_weight)
+def create_voter_flow_diagram(bes_df, past_election_column, current_election_column, weight_column, parties, party_colours, dont_include, title, other=True, n_bootstraps=0, confidence=0.95):
+    # plotly is only loaded when a flow diagram is drawn
+    import plotly.graph_objects as go
+    flow_matrix = voter_flows.calculate_voter_flow_matrix(bes_df, past_election_column, current_election_column, weight_column, parties, dont_include, other)
+    source, target, value = voter_flows.get_sankey_links(flow_matrix, other)
+    
+    link = dict(
+      source = source,
+      target = target,
+      value = value
+    )
+    
+    # Optionally show a bootstrap confidence interval for each flow when hovering over it
+    if (n_bootstraps > 0):
+        lower, upper = voter_flows.bootstrap_voter_flow_intervals(bes_df, past_election_column, current_election_column, weight_column, parties, dont_include, other, n_bootstraps=n_bootstraps, confidence=confidence)
+        lower_links = voter_flows.get_sankey_links(lower, other)[2]
+        upper_links = voter_flows.get_sankey_links(upper, other)[2]
+        link["customdata"] = np.column_stack([lower_links, upper_links])
+        link["hovertemplate"] = "%{value:.1f}% (" + str(round(100*confidence)) + "% CI: %{customdata[0]:.1f}% - %{customdata[1]:.1f}%)<extra></extra>"
     
-    if (other):
-        for party_current_election_no in range(0, total_no_parties):
-            # other to party
-            source.append(total_no_parties*2)
-            target.append(total_no_parties + party_current_election_no)
-            filtered_df = bes_df[
-                    ~(bes_df[past_election_column].isin(parties)) 
-                    & ~(bes_df[current_election_column] == parties[party_current_election_no])]
-            value.append(100*filtered_df[weight_column].sum()/sankey_total_weight)
-            # party to other
-            source.append(party_current_election_no)
-            target.append(total_no_parties*2 + 1)
-            filtered_df = bes_df[
-                    ~(bes_df[current_election_column].isin(parties)) 
-                    & ~(bes_df[past_election_column] == parties[party_current_election_no])]
-            value.append(100*filtered_df[weight_column].sum()/sankey_total_weight)
-            
     sank_parties = parties + parties
     sank_colours = party_colours + party_colours
     
     if (other):
-        sank_parties = sank_parties + ["Other parties", "Other parties"]
+        sank_parties = sank_parties + [voter_flows.other_label, voter_flows.other_label]
         sank_colours = sank_colours + ["grey", "grey"]
     
     fig = go.Figure(data=[go.Sankey(
@@ -227,6 +243,38 @@ def create_voter_flow_diagram(bes_df, past_election_column, current_election_col
           label = sank_parties,
           color = sank_colours
         ),
+        link = link)])
+    
+    fig.update_layout(title_text=title, font_size=12, height=750)
+    fig.show()
+
+def create_multi_stage_voter_flow_diagram(voter_paths, party_colours, title, other=True, group=None):
+    # Sankey with a column of party nodes for each stage of a voter_flows.VoterPaths (e.g. 2010 -> 2015 -> 2017 ->
+    # 2019), optionally for one of its groups (e.g. group="Scotland" for paths split by country)
+    import plotly.graph_objects as go
+    if (group is not None):
+        voter_paths = voter_paths.slice(group)
+    source, target, value = voter_paths.get_sankey_links(other)
+    no_stages = len(voter_paths.election_columns)
+    
+    sank_parties = []
+    sank_colours = []
+    node_x = []
+    for stage_no in range(0, no_stages):
+        sank_parties = sank_parties + voter_paths.labels
+        sank_colours = sank_colours + party_colours + ["grey"]
+        node_x = node_x + [0.001 + 0.998*stage_no/max(no_stages - 1, 1)]*len(voter_paths.labels)
+    
+    fig = go.Figure(data=[go.Sankey(
+        arrangement = "snap",
+        node = dict(
+          pad = 5,
+          thickness = 20,
+          line = dict(color = "black", width = 0.5),
+          label = sank_parties,
+          color = sank_colours,
+          x = node_x
+        ),
         link = dict(
           source = source,
           target = target,
@@ -234,4 +282,6 @@ def create_voter_flow_diagram(bes_df, past_election_column, current_election_col
         ))])
     
     fig.update_layout(title_text=title, font_size=12, height=750)
-    fig.show()
\ No newline at end of file
+    fig.show()
+
+profiling.profile_from_environment(__name__)
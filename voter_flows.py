@@ -0,0 +1,233 @@
+import pandas as pd
+import numpy as np
+import election_core
+
+other_label = "Other parties"
+
+def encode_votes(votes, parties):
+    # Integer codes for each respondent's vote, 0..len(parties) - 1 for the listed parties and len(parties) for
+    # anything else
+    codes = pd.Categorical(votes, categories=parties).codes.astype(np.int64)
+    codes[codes < 0] = len(parties)
+    return codes
+
+def get_flow_respondents(bes_df, past_election_column, current_election_column, parties, dont_include, other=True):
+    # Same filtering as the Sankey diagrams have always used: drop respondents who gave a dont_include answer
+    # at both elections, and if we're not showing other parties keep only those who voted for a listed party both times
+    past_votes = bes_df[past_election_column]
+    current_votes = bes_df[current_election_column]
+    mask = ~(past_votes.isin(dont_include)) | ~(current_votes.isin(dont_include))
+    if (not other):
+        mask = mask & past_votes.isin(parties) & current_votes.isin(parties)
+    return mask.values
+
+def get_flow_cells(bes_df, past_election_column, current_election_column, weight_column, parties, dont_include, other=True):
+    # Returns the flat (past party, current party) cell for every respondent that's included, along with their weight
+    mask = get_flow_respondents(bes_df, past_election_column, current_election_column, parties, dont_include, other)
+    past_codes = encode_votes(bes_df[past_election_column].values[mask], parties)
+    current_codes = encode_votes(bes_df[current_election_column].values[mask], parties)
+    weights = pd.to_numeric(bes_df[weight_column], errors="coerce").fillna(0).values[mask].astype(float)
+    return past_codes*(len(parties) + 1) + current_codes, weights
+
+def get_flow_labels(parties):
+    return list(parties) + [other_label]
+
+def calculate_voter_flow_matrix(bes_df, past_election_column, current_election_column, weight_column, parties, dont_include=[], other=True, as_percentage=True):
+    # Weighted past vote x current vote matrix built from a single bincount over the respondents. Rows are the
+    # past election, columns the current one, with a final "Other parties" row and column. Values are a % of the
+    # total weight of included respondents unless as_percentage is False. Missing weights count as 0. The other row and
+    # column only hold respondents who voted for a party outside parties (the notebook version counted everyone who
+    # didn't vote for the party in the other to party and party to other links).
+    cells, weights = get_flow_cells(bes_df, past_election_column, current_election_column, weight_column, parties, dont_include, other)
+    no_categories = len(parties) + 1
+    flows = np.bincount(cells, weights=weights, minlength=no_categories*no_categories).reshape(no_categories, no_categories)
+
+    if (as_percentage):
+        total_weight = weights.sum()
+        if (total_weight > 0):
+            flows = 100*flows/total_weight
+
+    labels = get_flow_labels(parties)
+    return pd.DataFrame(flows, index=pd.Index(labels, name=past_election_column), columns=pd.Index(labels, name=current_election_column))
+
+def bootstrap_voter_flow_intervals(bes_df, past_election_column, current_election_column, weight_column, parties, dont_include=[], other=True, n_bootstraps=1000, confidence=0.95, seed=None, max_chunk_elements=5000000):
+    # Confidence intervals on every flow (as a % of total weight) from resampling respondents with replacement.
+    # Each chunk of bootstrap replicates is done as one bincount with every replicate offset into its own block of
+    # cells, so there's no DataFrame filtering involved. Chunks are sized so they never hold more than
+    # max_chunk_elements sampled respondents at a time.
+    cells, weights = get_flow_cells(bes_df, past_election_column, current_election_column, weight_column, parties, dont_include, other)
+    no_respondents = len(cells)
+    no_categories = len(parties) + 1
+    no_cells = no_categories*no_categories
+
+    rng = np.random.default_rng(seed)
+    replicate_flows = np.zeros((n_bootstraps, no_cells))
+    chunk_size = max(1, int(max_chunk_elements/max(no_respondents, 1)))
+
+    for chunk_start in range(0, n_bootstraps, chunk_size):
+        chunk_replicates = min(chunk_size, n_bootstraps - chunk_start)
+        sample = rng.integers(0, no_respondents, size=(chunk_replicates, no_respondents))
+        sample_weights = weights[sample]
+        offset_cells = cells[sample] + no_cells*np.arange(chunk_replicates)[:, np.newaxis]
+        chunk_flows = np.bincount(offset_cells.ravel(), weights=sample_weights.ravel(), minlength=chunk_replicates*no_cells).reshape(chunk_replicates, no_cells)
+        total_weights = sample_weights.sum(axis=1)[:, np.newaxis]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            replicate_flows[chunk_start:chunk_start + chunk_replicates] = 100*chunk_flows/total_weights
+
+    alpha = (1 - confidence)/2
+    lower = np.nanquantile(replicate_flows, alpha, axis=0).reshape(no_categories, no_categories)
+    upper = np.nanquantile(replicate_flows, 1 - alpha, axis=0).reshape(no_categories, no_categories)
+
+    labels = get_flow_labels(parties)
+    index = pd.Index(labels, name=past_election_column)
+    columns = pd.Index(labels, name=current_election_column)
+    return pd.DataFrame(lower, index=index, columns=columns), pd.DataFrame(upper, index=index, columns=columns)
+
+def get_sankey_links(flow_matrix, other=True):
+    # Turns a flow matrix into Sankey source/target/value lists. Nodes are the past parties, then the current
+    # parties, then other (past) and other (current). Other to other isn't shown.
+    total_no_parties = flow_matrix.shape[0] - 1
+    flows = flow_matrix.values
+
+    source = []
+    target = []
+    value = []
+
+    for party_past_election_no in range(0, total_no_parties):
+        for party_current_election_no in range(0, total_no_parties):
+            source.append(party_past_election_no)
+            target.append(total_no_parties + party_current_election_no)
+            value.append(flows[party_past_election_no, party_current_election_no])
+
+    if (other):
+        for party_no in range(0, total_no_parties):
+            # other to party
+            source.append(total_no_parties*2)
+            target.append(total_no_parties + party_no)
+            value.append(flows[total_no_parties, party_no])
+            # party to other
+            source.append(party_no)
+            target.append(total_no_parties*2 + 1)
+            value.append(flows[party_no, total_no_parties])
+
+    return source, target, value
+
+# Multi-stage flows, following the same respondents through several elections or waves (e.g. 2010 -> 2015 -> 2017 ->
+# 2019). Each respondent's votes are packed into a single int64 path code (one base len(parties) + 1 digit per stage)
+# and the weights are summed over the distinct (group, path) pairs, so memory depends on the respondents and the
+# paths actually taken, not on the (parties + 1)^stages possible paths. Any pair of stages, any subgroup and the
+# multi-stage Sankey links are all worked out from those sparse path totals.
+
+def get_path_respondents(bes_df, election_columns, parties, dont_include, other=True):
+    # The pairwise filtering extended to every stage: drop respondents who gave a dont_include answer at every
+    # stage, and if we're not showing other parties keep only those who voted for a listed party every time
+    mask = np.zeros(bes_df.shape[0], dtype=bool)
+    for col in election_columns:
+        mask |= ~bes_df[col].isin(dont_include).values
+    if (not other):
+        for col in election_columns:
+            mask &= bes_df[col].isin(parties).values
+    return mask
+
+class VoterPaths:
+    def __init__(self, election_columns, parties, group_labels, group_codes, path_codes, weights, respondents):
+        self.election_columns = list(election_columns)
+        self.parties = list(parties)
+        self.labels = get_flow_labels(parties)
+        self.no_categories = len(parties) + 1
+        self.group_labels = group_labels
+        self.group_codes = group_codes
+        self.path_codes = path_codes
+        self.weights = weights
+        self.respondents = respondents
+
+    def __len__(self):
+        return len(self.path_codes)
+
+    def get_stage_codes(self, stage):
+        # Party code at one stage (a column name or stage number) for every path
+        if (isinstance(stage, str)):
+            stage = self.election_columns.index(stage)
+        place_value = self.no_categories**(len(self.election_columns) - 1 - stage)
+        return (self.path_codes//place_value) % self.no_categories
+
+    def slice(self, group):
+        # The paths of one subgroup (a group label, e.g. "Scotland", or a tuple for several group_by columns)
+        if (self.group_labels is None):
+            raise Exception("paths weren't grouped")
+        group_no = self.group_labels.get_loc(group)
+        in_group = self.group_codes == group_no
+        return VoterPaths(self.election_columns, self.parties, self.group_labels, self.group_codes[in_group], self.path_codes[in_group], self.weights[in_group], self.respondents[in_group])
+
+    def transition_matrix(self, from_stage, to_stage, as_percentage=True):
+        # Weighted from stage x to stage matrix, laid out as calculate_voter_flow_matrix's is
+        cells = self.get_stage_codes(from_stage)*self.no_categories + self.get_stage_codes(to_stage)
+        flows = np.bincount(cells, weights=self.weights, minlength=self.no_categories**2).reshape(self.no_categories, self.no_categories)
+        if (as_percentage and (self.weights.sum() > 0)):
+            flows = 100*flows/self.weights.sum()
+        from_column = from_stage if isinstance(from_stage, str) else self.election_columns[from_stage]
+        to_column = to_stage if isinstance(to_stage, str) else self.election_columns[to_stage]
+        return pd.DataFrame(flows, index=pd.Index(self.labels, name=from_column), columns=pd.Index(self.labels, name=to_column))
+
+    def path_table(self, top=None):
+        # The distinct paths (summed over groups) with their % of the total weight and respondent counts, most common first
+        unique_paths, path_index = np.unique(self.path_codes, return_inverse=True)
+        path_weights = np.bincount(path_index, weights=self.weights, minlength=len(unique_paths))
+        path_respondents = np.bincount(path_index, weights=self.respondents, minlength=len(unique_paths)).astype(np.int64)
+        order = np.argsort(-path_weights, kind="stable")
+        if (top is not None):
+            order = order[:top]
+        labels = np.array(self.labels, dtype=object)
+        paths = VoterPaths(self.election_columns, self.parties, None, None, unique_paths[order], path_weights[order], path_respondents[order])
+        table = pd.DataFrame({col: labels[paths.get_stage_codes(stage_no)] for stage_no, col in enumerate(self.election_columns)})
+        total_weight = self.weights.sum()
+        table["share"] = 100*paths.weights/total_weight if total_weight > 0 else paths.weights
+        table["respondents"] = paths.respondents
+        return table
+
+    def get_sankey_links(self, other=True):
+        # Source/target/value lists (values as % of total weight) for a Sankey with a column of nodes per stage.
+        # Node stage_no*(len(parties) + 1) + party_no is that party at that stage, the last in each column is other.
+        # Other to other isn't shown.
+        source = []
+        target = []
+        value = []
+        other_code = self.no_categories - 1
+        for stage_no in range(0, len(self.election_columns) - 1):
+            flows = self.transition_matrix(stage_no, stage_no + 1).values
+            for from_code in range(0, self.no_categories):
+                for to_code in range(0, self.no_categories):
+                    if ((from_code == other_code) and (to_code == other_code)):
+                        continue
+                    if ((not other) and ((from_code == other_code) or (to_code == other_code))):
+                        continue
+                    source.append(stage_no*self.no_categories + from_code)
+                    target.append((stage_no + 1)*self.no_categories + to_code)
+                    value.append(flows[from_code, to_code])
+        return source, target, value
+
+def calculate_voter_paths(bes_df, election_columns, weight_column, parties, dont_include=[], group_by=None, other=True):
+    # Builds the sparse weighted path totals for the respondents across election_columns (in order), optionally
+    # split by group_by (e.g. "country") so each group can be sliced out later without filtering bes_df again
+    election_columns = list(election_columns)
+    no_categories = len(parties) + 1
+    group_codes, group_labels = election_core.get_group_codes(bes_df, group_by)
+    no_paths = no_categories**len(election_columns)
+    no_groups = 1 if group_labels is None else len(group_labels)
+    if (no_paths*no_groups > np.iinfo(np.int64).max):
+        raise Exception("too many stages and groups to encode paths as int64")
+
+    mask = get_path_respondents(bes_df, election_columns, parties, dont_include, other)
+    mask &= np.asarray(group_codes) >= 0
+    path_codes = np.zeros(mask.sum(), dtype=np.int64)
+    for col in election_columns:
+        path_codes = path_codes*no_categories + encode_votes(bes_df[col].values[mask], parties)
+    weights = pd.to_numeric(bes_df[weight_column], errors="coerce").fillna(0).values[mask].astype(float)
+    group_codes = np.asarray(group_codes, dtype=np.int64)[mask]
+
+    # One key per (group, path), with the weights and respondents summed over everyone sharing it
+    unique_keys, key_index = np.unique(group_codes*no_paths + path_codes, return_inverse=True)
+    key_weights = np.bincount(key_index, weights=weights, minlength=len(unique_keys))
+    key_respondents = np.bincount(key_index, minlength=len(unique_keys))
+
+    return VoterPaths(election_columns, parties, group_labels, unique_keys//no_paths, unique_keys % no_paths, key_weights, key_respondents)